@@ -3,6 +3,11 @@ ASGI config for mon_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Async views (e.g. ``money.views.verify_email_api_async``) run directly in the
+event loop when served through this entry point, e.g.:
+
+    uvicorn mon_project.asgi:application
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -0,0 +1,129 @@
+"""
+Конфигурация gunicorn для проверки email.
+
+Проверка почти всё время ждёт DNS и SMTP, поэтому число одновременных
+запросов на узле определяется не числом ядер, а долей ожидания
+ввода-вывода: на одно ядро приходится 1 / (1 - VERIFIER_IO_WAIT)
+одновременных проверок (0.98 -> 50 на ядро, 200 на 4 ядрах).
+
+Режимы (VERIFIER_SERVER_MODE):
+- asgi (по умолчанию) - mon_project.asgi через uvicorn.workers.UvicornWorker,
+  воркер на ядро. Асинхронные view держат сотни проверок в event loop
+  (ASYNC_VERIFY_CONCURRENCY), синхронные выполняются в потоках;
+- gthread - mon_project.wsgi, синхронные воркеры с пулом потоков: DNS и
+  SMTP блокируют только свой поток.
+
+Переменные окружения: VERIFIER_SERVER_MODE, VERIFIER_IO_WAIT,
+VERIFIER_CONCURRENCY (общее число одновременных запросов на узле вместо
+расчётного), WEB_CONCURRENCY (число воркеров), GUNICORN_BIND.
+Рассчитанные размеры пулов передаются Django через окружение
+(ASYNC_VERIFY_CONCURRENCY, DB_CONN_MAX_AGE, REDIS_MAX_CONNECTIONS).
+
+Запуск: gunicorn -c mon_project/gunicorn_conf.py
+"""
+
+import math
+import multiprocessing
+import os
+
+MODES = {
+    'asgi': ('mon_project.asgi:application', 'uvicorn.workers.UvicornWorker'),
+    'gthread': ('mon_project.wsgi:application', 'gthread'),
+}
+
+DEFAULT_IO_WAIT = 0.98
+
+
+def size_workers(cpu_count, mode='asgi', io_wait=DEFAULT_IO_WAIT, concurrency=None, workers=None):
+    """Число воркеров, потоков и размеры пулов соединений для узла.
+    
+    Возвращает словарь: workers, threads, concurrency (одновременных
+    запросов на воркер), db_connections (сколько соединений с БД воркер
+    может открыть в худшем случае) и redis_connections (размер пула на воркер).
+    """
+    io_wait = min(max(io_wait, 0.0), 0.99)
+    total = concurrency or math.ceil(cpu_count / (1 - io_wait))
+    if workers is None:
+        # ASGI: event loop на ядро; gthread: на ядро плюс один, пока остальные ждут GIL
+        workers = cpu_count if mode == 'asgi' else cpu_count + 1
+    per_worker = max(math.ceil(total / workers), 1)
+    
+    if mode == 'asgi':
+        threads = 1
+    else:
+        threads = per_worker
+    return {
+        'workers': workers,
+        'threads': threads,
+        'concurrency': per_worker,
+        # Django не ограничивает число соединений: в ASGI каждый синхронный
+        # view выполняется в своём потоке со своим соединением, в gthread -
+        # по соединению на поток. Плюс поток отложенной записи
+        'db_connections': per_worker + 1,
+        # Кэш нужен каждому одновременному запросу; запас - фоновым потокам
+        # (отложенная запись, метрики), чтобы BlockingConnectionPool не ждал
+        'redis_connections': per_worker + 10,
+    }
+
+
+mode = os.environ.get('VERIFIER_SERVER_MODE', 'asgi')
+if mode not in MODES:
+    raise ValueError(f'VERIFIER_SERVER_MODE: {mode!r}, ожидается одно из {", ".join(MODES)}')
+
+sizing = size_workers(
+    multiprocessing.cpu_count(),
+    mode=mode,
+    io_wait=float(os.environ.get('VERIFIER_IO_WAIT', DEFAULT_IO_WAIT)),
+    concurrency=int(os.environ['VERIFIER_CONCURRENCY']) if os.environ.get('VERIFIER_CONCURRENCY') else None,
+    workers=int(os.environ['WEB_CONCURRENCY']) if os.environ.get('WEB_CONCURRENCY') else None,
+)
+
+wsgi_app, worker_class = MODES[mode]
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = sizing['workers']
+threads = sizing['threads']
+
+# SMTP-проверка одного адреса укладывается в SMTP_VERIFY_DEADLINE (20 секунд)
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# Перезапуск воркеров ограничивает рост памяти (локальные кэши, пулы)
+max_requests = 10000
+max_requests_jitter = 1000
+
+# Пулы Django в воркерах (читаются settings_production)
+os.environ.setdefault('ASYNC_VERIFY_CONCURRENCY', str(sizing['concurrency']))
+# В ASGI запросы выполняются в разных потоках - постоянные соединения с БД не переиспользуются
+os.environ.setdefault('DB_CONN_MAX_AGE', '0' if mode == 'asgi' else '60')
+os.environ.setdefault('REDIS_MAX_CONNECTIONS', str(sizing['redis_connections']))
+
+
+def on_starting(server):
+    server.log.info(
+        'Email verifier: mode=%s workers=%s threads=%s concurrency/worker=%s db connections/worker<=%s redis pool/worker=%s',
+        mode, workers, threads, sizing['concurrency'], sizing['db_connections'], sizing['redis_connections'],
+    )
+
+
+def post_worker_init(worker):
+    """Прогрев кэшей после загрузки Django, до приёма запросов (money.warmup)"""
+    from money.warmup import warm_up
+    try:
+        report = warm_up()
+    except Exception:
+        worker.log.exception('Прогрев кэшей воркера не выполнен')
+        return
+    worker.log.info('Worker warm-up: %s', ', '.join(f'{key}={value}' for key, value in report.items()))
+
+
+def worker_exit(server, worker):
+    """Сбросить буфер отложенной записи до выхода воркера (atexit дублирует это при обычном завершении)"""
+    try:
+        from money.write_behind import write_buffer
+    except Exception:
+        return  # Django не успел загрузиться
+    try:
+        write_buffer.flush()
+    except Exception:
+        server.log.exception('Не удалось записать буфер проверок при остановке воркера')
@@ -131,3 +131,148 @@ CACHES = {
 
 RATELIMIT_USE_CACHE = 'default'
 RATELIMIT_VIEW = 'money.views.ratelimit_error'
+
+# Максимум одновременных асинхронных проверок в одном процессе
+ASYNC_VERIFY_CONCURRENCY = 500
+
+# Кэш MX-записей (секунды)
+MX_CACHE_SIZE = 10000
+MX_CACHE_MIN_TTL = 60
+MX_CACHE_MAX_TTL = 86400
+MX_CACHE_NEGATIVE_TTL = 300
+
+# DNS: серверы (пусто - системные из /etc/resolv.conf), таймаут попытки и
+# общий предел на запрос (секунды), размер UDP-ответа EDNS
+DNS_RESOLVERS = []
+DNS_TIMEOUT = 2.0
+DNS_LIFETIME = 4.0
+DNS_EDNS_PAYLOAD = 1232
+# Запрашивать A/AAAA одновременно с MX (домены без MX, RFC 5321)
+DNS_PARALLEL_FALLBACK = True
+
+# Резервные MX: сколько хостов пробовать и через сколько секунд без ответа
+# запускать проверку следующего (асинхронный движок)
+MX_FAILOVER_MAX_HOSTS = 3
+MX_RACE_DELAY = 2
+# Общий срок SMTP-проверки адреса в синхронном API: ожидание слота, все MX-хосты
+# и проверка catch-all (секунды)
+SMTP_VERIFY_DEADLINE = 20
+
+# Максимум адресов в одном запросе массовой проверки
+BULK_VERIFY_MAX_EMAILS = 5000
+# Максимальный размер файла CSV в запросе массовой проверки (байты)
+BULK_VERIFY_MAX_BYTES = 5 * 1024 * 1024
+
+# Пул SMTP-сессий: простой (секунды) и число проверок на одну сессию
+SMTP_POOL_MAX_IDLE = 30
+SMTP_POOL_MAX_RECIPIENTS = 100
+SMTP_POOL_MAX_SESSIONS_PER_HOST = 2  # остальные проверки хоста ждут освободившуюся сессию
+
+# Фоновые задачи: таймаут брошенной задачи (секунды) и число попыток
+JOB_STALE_TIMEOUT = 600
+JOB_MAX_ATTEMPTS = 3
+
+# Ограничения на один MX-хост (общие для всех воркеров)
+THROTTLE_MAX_CONCURRENT_PER_HOST = 5
+THROTTLE_MAX_RATE_PER_HOST = 10  # проверок в секунду
+THROTTLE_MAX_WAIT = 30  # секунд ожидания в очереди
+THROTTLE_BACKOFF_BASE = 5  # пауза после первого ответа 4xx, далее x2
+THROTTLE_BACKOFF_MAX = 300
+BULK_THROTTLE_ROUNDS = 3  # кругов массовой проверки для адресов, не дождавшихся слота
+
+# Списки одноразовых доменов: по одному домену в строке, поддомены учитываются.
+# Файлы перечитываются при изменении не чаще раза в DISPOSABLE_RELOAD_INTERVAL секунд
+DISPOSABLE_DOMAINS_FILE = None  # например BASE_DIR / 'data' / 'disposable_domains.txt'
+DISPOSABLE_ALLOWLIST_FILE = None
+DISPOSABLE_RELOAD_INTERVAL = 60
+# Каталог для отсортированной копии списка (None - временный каталог системы)
+DISPOSABLE_COMPILED_DIR = None
+
+# Кэш результатов проверки: время жизни по статусу (секунды), 0 - не кэшировать
+RESULT_CACHE_SIZE = 50000
+RESULT_CACHE_TTLS = {
+    'valid': 7 * 24 * 3600,
+    'invalid': 24 * 3600,
+    'risky': 24 * 3600,
+    'unknown': 15 * 60,
+    'catch_all': 24 * 3600,
+}
+
+# Вердикты доменов (catch-all, блокировка проверки): время жизни (секунды)
+DOMAIN_VERDICT_CACHE_SIZE = 10000
+DOMAIN_VERDICT_TTLS = {
+    'normal': 24 * 3600,
+    'catch_all': 24 * 3600,
+    'blocked': 15 * 60,
+}
+# Сколько сбоев SMTP-проверки подряд (нет соединения, таймаут) делают домен blocked
+DOMAIN_BLOCK_AFTER_FAILURES = 3
+
+# Сколько проверок из лимита тарифа списывает адрес на уровне проверки (?level=)
+VERIFICATION_LEVEL_COSTS = {
+    'syntax': 0,
+    'dns': 0,
+    'smtp': 1,
+}
+# То же для анонимных запросов (дневной лимит по IP): dns ходит в DNS и не бесплатен
+VERIFICATION_ANONYMOUS_LEVEL_COSTS = {
+    'syntax': 0,
+    'dns': 1,
+    'smtp': 1,
+}
+
+# Прогрев воркера при запуске (gunicorn post_worker_init): всегда прогреваемые
+# домены, число самых частых доменов за WARMUP_LOOKBACK_DAYS дней, предел по
+# времени (секунды) и число параллельных DNS-запросов
+WARMUP_ENABLED = True
+WARMUP_DOMAINS = ['gmail.com', 'yandex.ru', 'mail.ru']
+WARMUP_TOP_DOMAINS = 100
+WARMUP_LOOKBACK_DAYS = 7
+WARMUP_TIMEOUT = 10
+WARMUP_CONCURRENCY = 16
+
+# Реестр тарифных планов в памяти: как часто сверять версию планов с общим кэшем (секунды)
+PLAN_REGISTRY_CHECK_INTERVAL = 5
+# Сколько хранить готовую страницу тарифов (сбрасывается и при изменении планов)
+PRICING_CACHE_TTL = 3600
+
+# Бесплатные проверки в день без регистрации (счётчик на IP в кэше)
+ANONYMOUS_DAILY_LIMIT = 3
+
+# Кэш API ключей: время жизни найденного и несуществующего ключа (секунды)
+API_KEY_CACHE_TTL = 60
+API_KEY_NEGATIVE_TTL = 30
+
+# Отложенная запись проверок и статистики API ключей фоновым потоком:
+# сброс раз в WRITE_BEHIND_INTERVAL секунд или по WRITE_BEHIND_MAX_ROWS записей
+VERIFICATION_WRITE_BEHIND = False
+WRITE_BEHIND_INTERVAL = 0.2
+WRITE_BEHIND_MAX_ROWS = 500
+# Предел буфера, пока БД недоступна: новые записи сверх него отбрасываются
+WRITE_BEHIND_MAX_BUFFER = 100000
+
+# Хранение истории: проверки старше стольки дней сворачиваются в дневную
+# статистику командой rollup_verifications
+VERIFICATION_RETENTION_DAYS = 180
+
+# Выгрузка истории: строк на одно чтение курсора
+EXPORT_CHUNK_SIZE = 2000
+
+# Проверка больших файлов: каталог для файлов задач, максимальный размер
+# файла (байты) и адресов в одной пачке проверки
+BULK_UPLOAD_DIR = BASE_DIR / 'uploads'
+BULK_UPLOAD_MAX_BYTES = 512 * 1024 * 1024
+BULK_UPLOAD_CHUNK_SIZE = 1000
+# Сколько хранить results.jsonl завершённой загрузки (секунды)
+BULK_UPLOAD_RESULTS_TTL = 7 * 24 * 3600
+
+# Метрики этапов проверки (/metrics): публикация снимка процесса в общий кэш
+# раз в METRICS_PUBLISH_INTERVAL секунд; METRICS_TOKEN - Bearer токен доступа
+METRICS_PUBLISH_INTERVAL = 10
+METRICS_MAX_PROVIDERS = 100
+# Снимок воркера, не публиковавшегося столько секунд, истекает; слотов на все узлы
+METRICS_WORKER_TTL = 10 * 60
+METRICS_MAX_WORKERS = 256
+# Через сколько секунд снимок завершённого воркера переносится в накопленную базу /metrics
+METRICS_RETIRED_TTL = 24 * 3600
+METRICS_TOKEN = ''
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import EmailVerification, SubscriptionPlan, UserProfile, APIKey, Payment, YooKassaSettings
+from .models import EmailVerification, SubscriptionPlan, UserProfile, APIKey, Payment, YooKassaSettings, VerificationJob, VerificationDailyStats
 
 
 @admin.register(YooKassaSettings)
@@ -85,7 +85,25 @@ class PaymentAdmin(admin.ModelAdmin):
 @admin.register(EmailVerification)
 class EmailVerificationAdmin(admin.ModelAdmin):
     list_display = ['email', 'user', 'is_valid_syntax', 'has_mx_record', 'is_deliverable', 'is_disposable', 'created_at']
-    list_filter = ['is_valid_syntax', 'has_mx_record', 'is_deliverable', 'is_disposable']
+    list_filter = ['is_valid_syntax', 'has_mx_record', 'is_deliverable', 'is_disposable', 'error_code']
     search_fields = ['email', 'domain', 'user__username']
+    raw_id_fields = ['user', 'api_key', 'mx_set']
+    date_hierarchy = 'created_at'
+
+
+@admin.register(VerificationDailyStats)
+class VerificationDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ['date', 'user', 'total', 'valid_syntax', 'with_mx', 'deliverable', 'disposable']
+    search_fields = ['user__username']
+    raw_id_fields = ['user']
+    date_hierarchy = 'date'
+
+
+@admin.register(VerificationJob)
+class VerificationJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'kind', 'status', 'attempts', 'callback_sent', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['id', 'user__username']
     raw_id_fields = ['user', 'api_key']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
     date_hierarchy = 'created_at'
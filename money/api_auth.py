@@ -0,0 +1,68 @@
+"""
+Аутентификация по API ключу с кэшированием.
+
+Ключ разрешается в (APIKey, пользователь, профиль, тариф) одним запросом
+с select_related, результат хранится в кэше Django несколько десятков
+секунд. Несуществующие ключи кэшируются отдельно (negative cache), чтобы
+перебор ключей не нагружал БД. Записи сбрасываются сигналами при
+изменении ключа, профиля или тарифа (см. signals.py).
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import APIKey
+
+# Время жизни записи о найденном и о несуществующем ключе (секунды)
+API_KEY_CACHE_TTL = getattr(settings, 'API_KEY_CACHE_TTL', 60)
+API_KEY_NEGATIVE_TTL = getattr(settings, 'API_KEY_NEGATIVE_TTL', 30)
+
+# Маркер несуществующего ключа: None в кэше неотличим от промаха
+MISSING = 'missing'
+
+
+def api_key_cache_key(key):
+    """Ключ кэша для API ключа - по хэшу, чтобы не хранить секрет в имени"""
+    return 'api-key:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def load_api_key(key):
+    """Активный ключ вместе с пользователем, профилем и тарифом одним запросом"""
+    try:
+        return APIKey.objects.select_related('user__profile__plan').get(key=key, is_active=True)
+    except APIKey.DoesNotExist:
+        return None
+
+
+def get_api_key(key):
+    """Активный APIKey по значению ключа или None"""
+    cache_key = api_key_cache_key(key)
+    cached = cache.get(cache_key)
+    if cached == MISSING:
+        return None
+    if cached is not None:
+        return cached
+    
+    api_key = load_api_key(key)
+    if api_key is None:
+        cache.set(cache_key, MISSING, API_KEY_NEGATIVE_TTL)
+    else:
+        cache.set(cache_key, api_key, API_KEY_CACHE_TTL)
+    return api_key
+
+
+def get_request_api_key(request):
+    """Значение API ключа из заголовка X-API-Key или параметра api_key"""
+    return request.headers.get('X-API-Key') or request.GET.get('api_key')
+
+
+def invalidate_api_keys(keys):
+    """Сбросить кэш для перечисленных значений ключей"""
+    cache.delete_many([api_key_cache_key(key) for key in keys])
+
+
+def invalidate_user_api_keys(user_ids):
+    """Сбросить кэш всех ключей указанных пользователей"""
+    invalidate_api_keys(APIKey.objects.filter(user_id__in=user_ids).values_list('key', flat=True))
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MoneyConfig(AppConfig):
     name = "money"
+    
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,251 @@
+"""
+Асинхронный движок верификации email.
+
+Повторяет логику views.verify_email, но DNS-запросы идут через
+dns.asyncresolver, а SMTP-проверка - через сокеты asyncio. Один процесс
+держит сотни проверок одновременно и не блокирует обработку запросов.
+"""
+
+import asyncio
+import weakref
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .views import (
+    is_disposable_email,
+    new_verification_result,
+    apply_cached_verdict,
+    apply_dns_failure,
+    apply_domain_verdict,
+    acache_mx_lookup,
+    finalize_result,
+    mx_cache,
+    MX_FAILOVER_MAX_HOSTS,
+)
+from .domain_intel import (
+    SKIP_SMTP_VERDICTS, aget_domain_verdict, aset_domain_verdict, catch_all_verdict, probe_verdict, random_mailbox,
+)
+from .levels import SMTP, SYNTAX
+from .resolver import resolver_pool
+from .smtp_pool import get_smtp_pool, scoped_smtp_pool
+from .throttle import ThrottleTimeout
+from .timing import mx_provider, stage
+from .validation import parse_email, validate_many
+
+
+# Максимум одновременных проверок в одном event loop
+DEFAULT_MAX_CONCURRENCY = 500
+
+# Через сколько секунд без ответа запускать проверку следующего MX-хоста
+MX_RACE_DELAY = getattr(settings, 'MX_RACE_DELAY', 2)
+
+# Сколько раз массовая проверка возвращает в очередь адреса, не дождавшиеся слота MX-хоста
+BULK_THROTTLE_ROUNDS = getattr(settings, 'BULK_THROTTLE_ROUNDS', 3)
+
+_semaphores = weakref.WeakKeyDictionary()
+
+# Поднимать ThrottleTimeout вместо результата unknown (адрес вернётся в очередь)
+_requeue_throttled = ContextVar('requeue_throttled', default=False)
+
+
+def get_semaphore():
+    """Семафор одновременных проверок для текущего event loop"""
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        limit = getattr(settings, 'ASYNC_VERIFY_CONCURRENCY', DEFAULT_MAX_CONCURRENCY)
+        semaphore = asyncio.Semaphore(limit)
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+async def check_mx_records_async(domain):
+    """Проверка MX-записей домена (асинхронно, см. views.check_mx_records)"""
+    domain = domain.lower()
+    with stage('dns') as span:
+        cached = await mx_cache.aget(domain)
+        if cached is not None:
+            span.outcome = 'cached'
+            return cached[0], list(cached[1])
+        
+        lookup = await resolver_pool.alookup_mx(domain)
+        span.outcome = lookup.status
+        span.provider = mx_provider(lookup.hosts[0]) if lookup.hosts else ''
+        return await acache_mx_lookup(domain, lookup)
+
+
+async def check_smtp_deliverable_async(email, mx_host):
+    """Проверка доставляемости через SMTP (асинхронно, через пул сессий)"""
+    try:
+        return await get_smtp_pool().probe(email, mx_host)
+    except ThrottleTimeout:
+        if _requeue_throttled.get():
+            raise
+        return None  # Хост перегружен - не дождались своей очереди
+    except Exception:
+        return None
+
+
+async def race_mx_hosts(email, mx_records):
+    """Проверка по MX-хостам со ступенчатым стартом (как happy eyeballs).
+    
+    Следующий по приоритету хост запускается, если предыдущие не дали точного
+    ответа за MX_RACE_DELAY секунд или ответили "неизвестно". Побеждает первый
+    точный ответ, остальные проверки отменяются. Возвращает (результат, хост).
+    """
+    hosts = [mx.rstrip('.') for mx in mx_records[:MX_FAILOVER_MAX_HOSTS]]
+    task_hosts = {}
+    pending = set()
+    try:
+        for index, host in enumerate(hosts):
+            task = asyncio.ensure_future(check_smtp_deliverable_async(email, host))
+            task_hosts[task] = host
+            pending.add(task)
+            
+            is_last = index == len(hosts) - 1
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=None if is_last else MX_RACE_DELAY,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for finished in done:
+                    if finished.result() is not None:
+                        return finished.result(), task_hosts[finished]
+                if not is_last:
+                    break  # Задержка истекла или ответ неточный - стартуем следующий хост
+        return None, ''
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def probe_smtp_async(email, domain, mx_records):
+    """SMTP-проверка с учётом вердикта домена (см. views.probe_smtp)"""
+    known = await aget_domain_verdict(domain)
+    if known in SKIP_SMTP_VERDICTS:
+        return known, None, ''
+    
+    deliverable, mx_host = await race_mx_hosts(email, mx_records)
+    if deliverable and known is None:
+        verdict = catch_all_verdict(await check_smtp_deliverable_async(random_mailbox(domain), mx_host))
+    else:
+        verdict = probe_verdict(deliverable)
+    if verdict != known:
+        await aset_domain_verdict(domain, verdict)
+    return verdict, deliverable, mx_host
+
+
+async def verify_email_async(email, mx_result=None, level=SMTP):
+    """Верификация email без блокировки event loop (полная или до уровня level).
+    
+    mx_result - уже известный результат check_mx_records_async для домена.
+    """
+    async with get_semaphore():
+        result = new_verification_result(email, level)
+        
+        with stage('syntax') as span:
+            parsed = parse_email(email)
+            span.outcome = 'valid' if parsed.valid else 'invalid'
+        if not parsed.valid:
+            result['error_message'] = 'Неверный формат email'
+            result['status'] = 'invalid'
+            return result
+        
+        result['is_valid_syntax'] = True
+        domain = parsed.domain
+        result['domain'] = domain
+        result['is_disposable'] = is_disposable_email(domain)
+        
+        if mx_result is None and level == SYNTAX:
+            # Без DNS: MX-записи известны, только если домен уже есть в кэше
+            mx_result = await mx_cache.aget(domain, (None, []))
+        elif mx_result is None:
+            mx_result = await check_mx_records_async(domain)
+        has_mx, mx_records = mx_result
+        result['has_mx_record'] = bool(has_mx)
+        result['mx_records'] = list(mx_records)
+        
+        if has_mx is False:
+            result['error_message'] = 'Домен не имеет MX-записей - почта не будет доставлена'
+            result['status'] = 'invalid'
+            return result
+        
+        if has_mx is None and level != SYNTAX:
+            apply_dns_failure(result)
+            return finalize_result(result)
+        
+        if level != SMTP:
+            apply_cached_verdict(result, await aget_domain_verdict(domain))
+            return finalize_result(result)
+        
+        # SMTP проверка
+        if mx_records:
+            verdict, deliverable, result['mx_host'] = await probe_smtp_async(parsed.address, domain, mx_records)
+            apply_domain_verdict(result, verdict, deliverable)
+        
+        return finalize_result(result)
+
+
+async def verify_many_async(emails):
+    """Параллельная верификация списка адресов"""
+    return await asyncio.gather(*(verify_email_async(email) for email in emails))
+
+
+async def verify_bulk_async(emails, level=SMTP, on_round=None):
+    """Массовая верификация: DNS один раз на домен, затем параллельные SMTP-проверки.
+    
+    Адреса, не дождавшиеся слота MX-хоста (MXThrottle), проверяются в
+    следующем круге, когда остальные уже освободили слоты; unknown они
+    получают, только если не дождались и за BULK_THROTTLE_ROUNDS кругов.
+    on_round - корутина, которая вызывается после DNS и каждого круга
+    (продление heartbeat фоновой задачи).
+    """
+    mx_by_domain = {}
+    parsed = validate_many(emails)
+    if level != SYNTAX:
+        domains = list({address.domain for address in parsed if address.valid})
+        lookups = await asyncio.gather(*(check_mx_records_async(domain) for domain in domains))
+        mx_by_domain = dict(zip(domains, lookups))
+        if on_round:
+            await on_round()
+    
+    results = [None] * len(emails)
+    pending = list(range(len(emails)))
+    for round_number in range(1, BULK_THROTTLE_ROUNDS + 1):
+        token = _requeue_throttled.set(round_number < BULK_THROTTLE_ROUNDS)
+        try:
+            outcomes = await asyncio.gather(*(
+                verify_email_async(emails[index], mx_by_domain.get(parsed[index].domain), level)
+                for index in pending
+            ), return_exceptions=True)
+        finally:
+            _requeue_throttled.reset(token)
+        
+        throttled = []
+        for index, outcome in zip(pending, outcomes):
+            if isinstance(outcome, ThrottleTimeout):
+                throttled.append(index)
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            else:
+                results[index] = outcome
+        pending = throttled
+        if on_round:
+            await on_round()
+        if not pending:
+            break
+    return results
+
+
+async def run_bulk_verification(emails, level=SMTP, on_round=None):
+    """Массовая верификация для вызова из синхронного кода (async_to_sync).
+    
+    Под ASGI async_to_sync выполняет её в общем event loop сервера, поэтому
+    проверка работает со своим пулом SMTP-сессий и закрывает только его -
+    сессии, которые переиспользуют запросы /api/v2/verify/, не затрагиваются.
+    """
+    async with scoped_smtp_pool():
+        return await verify_bulk_async(emails, level, on_round)
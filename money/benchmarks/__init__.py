@@ -0,0 +1 @@
+"""Бенчмарки горячего пути проверки (команда benchmark)"""
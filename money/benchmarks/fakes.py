@@ -0,0 +1,245 @@
+"""
+Локальные DNS и SMTP серверы для бенчмарков и тестов.
+
+FakeDNSServer отвечает на MX-запросы по словарю зон, FakeSMTPServer
+принимает проверки RCPT по списку ящиков. У обоих настраиваются задержка
+ответа и доля отказов; SMTP-сервер умеет greylisting (первая попытка для
+адреса получает 451).
+"""
+
+import asyncio
+import random
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest.mock import patch
+
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+
+
+class FakeDNSServer:
+    """UDP DNS-сервер на 127.0.0.1 с MX-записями из словаря.
+    
+    zones: домен -> список MX-хостов (пустой список - домен без MX, домен
+    не из словаря - NXDOMAIN), '*.example' задаёт записи для всех
+    поддоменов. failure: 'servfail' или 'timeout' (ответ не отправляется)
+    для доли запросов failure_rate.
+    """
+    
+    def __init__(self, zones, latency=0.0, failure='servfail', failure_rate=0.0, ttl=300):
+        self.zones = {domain.lower(): hosts for domain, hosts in zones.items()}
+        self.latency = latency
+        self.failure = failure
+        self.failure_rate = failure_rate
+        self.ttl = ttl
+        self.queries = 0
+        self.socket = None
+        self.port = None
+        self._executor = None
+        self._thread = None
+        self._random = random.Random(0)
+    
+    def start(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.port = self.socket.getsockname()[1]
+        self._executor = ThreadPoolExecutor(max_workers=32)
+        self._thread = threading.Thread(target=self._serve, name='fake-dns', daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+    
+    def _serve(self):
+        while True:
+            try:
+                data, address = self.socket.recvfrom(4096)
+            except OSError:
+                return  # Сокет закрыт
+            self.queries += 1
+            self._executor.submit(self._reply, data, address)
+    
+    def _reply(self, data, address):
+        if self.latency:
+            threading.Event().wait(self.latency)
+        response = self.answer(dns.message.from_wire(data))
+        if response is None:
+            return
+        try:
+            self.socket.sendto(response.to_wire(), address)
+        except (OSError, AttributeError):
+            pass  # Сервер остановлен
+    
+    def answer(self, query):
+        """Ответ на запрос или None, если запрос нужно "потерять" """
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            if self.failure == 'timeout':
+                return None
+            response = dns.message.make_response(query)
+            response.set_rcode(dns.rcode.SERVFAIL)
+            return response
+        
+        response = dns.message.make_response(query)
+        question = query.question[0]
+        hosts = self.lookup(question.name.to_text().rstrip('.').lower())
+        if hosts is None:
+            response.set_rcode(dns.rcode.NXDOMAIN)
+        elif hosts and question.rdtype == dns.rdatatype.MX:
+            records = [f'{(index + 1) * 10} {host.rstrip(".")}.' for index, host in enumerate(hosts)]
+            response.answer.append(dns.rrset.from_text(question.name, self.ttl, 'IN', 'MX', *records))
+        return response
+    
+    def lookup(self, domain):
+        """MX-хосты домена с учётом записей '*.' или None"""
+        if domain in self.zones:
+            return self.zones[domain]
+        labels = domain.split('.')
+        for index in range(1, len(labels)):
+            hosts = self.zones.get('*.' + '.'.join(labels[index:]))
+            if hosts is not None:
+                return hosts
+        return None
+    
+    @contextmanager
+    def installed(self, lifetime=2.0):
+        """Направить пул резолверов проверки (money.resolver) на этот сервер на время блока"""
+        from money.resolver import resolver_pool
+        with patch.multiple(
+            resolver_pool,
+            nameservers=['127.0.0.1'],
+            port=self.port,
+            timeout=lifetime,
+            lifetime=lifetime,
+            _resolvers={},
+        ):
+            yield self
+
+
+class FakeSMTPServer:
+    """SMTP-сервер на 127.0.0.1, отвечающий на HELO/MAIL/RCPT/RSET/QUIT.
+    
+    mailboxes - существующие адреса или функция address -> bool (None -
+    принимается любой адрес, catch-all).
+    latency - задержка перед каждым ответом. greylist - первая попытка для
+    адреса получает 451. failure: 'tempfail' (421 при подключении) или
+    'drop' (соединение закрывается) для доли подключений failure_rate.
+    mail_code - ответ на MAIL FROM (например, 553 - отказ отправителю).
+    """
+    
+    def __init__(self, mailboxes=None, latency=0.0, greylist=False, failure='tempfail', failure_rate=0.0,
+                 mail_code=250):
+        if mailboxes is not None and not callable(mailboxes):
+            mailboxes = {mailbox.lower() for mailbox in mailboxes}.__contains__
+        self.mailboxes = mailboxes
+        self.latency = latency
+        self.greylist = greylist
+        self.failure = failure
+        self.failure_rate = failure_rate
+        self.mail_code = mail_code
+        self.connections = 0
+        self.rcpt_commands = 0
+        self.port = None
+        self._seen = set()
+        self._random = random.Random(0)
+        self._loop = None
+        self._server = None
+        self._thread = None
+    
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, '127.0.0.1', 0))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._thread = threading.Thread(target=self._loop.run_forever, name='fake-smtp', daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        if self._loop is None:
+            return
+        
+        async def shutdown():
+            self._server.close()
+            await self._server.wait_closed()
+        
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+        self._loop = None
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+    
+    @contextmanager
+    def installed(self):
+        """Направить синхронный и асинхронный SMTP-клиенты на этот сервер"""
+        with patch('smtplib.SMTP.default_port', self.port), patch('money.smtp_pool.SMTP_PORT', self.port):
+            yield self
+    
+    def rcpt_code(self, address):
+        address = address.lower()
+        if self.greylist and address not in self._seen:
+            self._seen.add(address)
+            return 451
+        if self.mailboxes is None or self.mailboxes(address):
+            return 250
+        return 550
+    
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        
+        async def reply(line):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            writer.write(f'{line}\r\n'.encode())
+            await writer.drain()
+        
+        try:
+            if self.failure_rate and self._random.random() < self.failure_rate:
+                if self.failure == 'tempfail':
+                    await reply('421 Service not available')
+                return
+            
+            await reply('220 fake.smtp ESMTP')
+            while True:
+                line = (await reader.readline()).decode('utf-8', 'replace').strip()
+                if not line:
+                    return
+                command = line[:4].upper()
+                if command in ('HELO', 'EHLO'):
+                    await reply('250 fake.smtp')
+                elif command == 'MAIL':
+                    await reply(f'{self.mail_code} MAIL')
+                elif command in ('RSET', 'NOOP'):
+                    await reply('250 OK')
+                elif command == 'RCPT':
+                    self.rcpt_commands += 1
+                    address = line.partition(':')[2].strip().strip('<>')
+                    await reply(f'{self.rcpt_code(address)} RCPT')
+                elif command == 'QUIT':
+                    await reply('221 Bye')
+                    return
+                else:
+                    await reply('502 Command not implemented')
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
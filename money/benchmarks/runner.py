@@ -0,0 +1,245 @@
+"""
+Бенчмарки горячего пути проверки.
+
+Сценарии запускают verify_email, API проверки и учёт лимитов против
+локальных FakeDNSServer и FakeSMTPServer (задержка задаётся) и считают
+пропускную способность, задержку p50/p95/p99 и число запросов к БД на
+операцию. Результат сравнивается с baselines.json: показатель хуже базового
+больше чем на допуск считается регрессией.
+
+Время зависит от машины, поэтому в начале прогона замеряется эталонная
+нагрузка без сети (разбор адреса и простой запрос к БД) и хранится в
+baselines.json под ключом _reference. Базовые задержки и пропускная
+способность пересчитываются на текущую машину во столько раз, во сколько
+эталон здесь медленнее записанного (на более быстрой машине - как есть).
+Без записанного эталона сравнивается только число запросов к БД.
+"""
+
+import json
+import math
+import secrets
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .fakes import FakeDNSServer, FakeSMTPServer
+
+BASELINES_PATH = Path(__file__).with_name('baselines.json')
+
+# Допуск по умолчанию: на 50% хуже базового - регрессия (хвосты p99 шумные)
+DEFAULT_TOLERANCE = 0.5
+# Задержки меньше миллисекунды слишком шумные для относительного допуска
+LATENCY_SLACK_MS = 1.0
+
+# Ключ эталонной нагрузки в baselines.json и число её операций
+REFERENCE = '_reference'
+REFERENCE_REQUESTS = 1000
+
+BENCH_ZONE = 'bench'
+SMTP_HOST = '127.0.0.1'
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+def summarize_run(latencies, seconds, queries):
+    """Показатели прогона: операций в секунду, перцентили (мс), запросов к БД на операцию"""
+    return {
+        'requests': len(latencies),
+        'throughput': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'queries': round(queries / len(latencies), 2),
+    }
+
+
+def measure(operation, requests):
+    """Выполнить operation(index) requests раз подряд и собрать показатели"""
+    latencies = []
+    queries = 0
+    started = time.perf_counter()
+    for index in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            call_started = time.perf_counter()
+            operation(index)
+            latencies.append(time.perf_counter() - call_started)
+        queries += len(captured)
+    return summarize_run(latencies, time.perf_counter() - started, queries)
+
+
+def host_factor(reference, baseline_reference):
+    """Во сколько раз эта машина медленнее той, где записаны базовые показатели.
+    
+    Не меньше 1: задержки fake-серверов от машины не зависят, и на быстрой
+    машине базовые показатели не ужесточаются.
+    """
+    return max(1.0, baseline_reference['throughput'] / reference['throughput'])
+
+
+def find_regressions(stats, baseline, tolerance=DEFAULT_TOLERANCE, factor=1.0):
+    """Показатели хуже базовых сверх допуска: список описаний.
+    
+    factor - поправка на скорость машины (host_factor); None - время не
+    сравнивается, только запросы к БД.
+    """
+    problems = []
+    if factor is not None:
+        if 'throughput' in baseline:
+            expected = round(baseline['throughput'] / factor, 1)
+            if stats['throughput'] < expected * (1 - tolerance):
+                problems.append(f"throughput {stats['throughput']}/s < baseline {expected}/s")
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if key not in baseline:
+                continue
+            expected = round(baseline[key] * factor, 2)
+            if stats[key] > expected * (1 + tolerance) + LATENCY_SLACK_MS:
+                problems.append(f'{key} {stats[key]} > baseline {expected}')
+    # Число запросов к БД не зависит от машины - допуск не применяется
+    if 'queries' in baseline and stats['queries'] > baseline['queries'] + 0.01:
+        problems.append(f"queries {stats['queries']} > baseline {baseline['queries']}")
+    return problems
+
+
+def load_baselines(path=BASELINES_PATH):
+    try:
+        with open(path, encoding='utf-8') as source:
+            return json.load(source)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(results, path=BASELINES_PATH):
+    baselines = load_baselines(path)
+    baselines.update(results)
+    with open(path, 'w', encoding='utf-8') as target:
+        json.dump(baselines, target, indent=2, sort_keys=True)
+        target.write('\n')
+
+
+class BenchmarkEnvironment:
+    """Fake DNS/SMTP, снятые лимиты MX-хоста и пользователь с API ключом.
+    
+    Все домены *.bench указывают на FakeSMTPServer; существуют ящики,
+    начинающиеся с "user". Адреса каждого прогона уникальны, поэтому кэши
+    не нужно очищать.
+    """
+    
+    def __init__(self, dns_latency=0.001, smtp_latency=0.001, domains=20):
+        self.dns = FakeDNSServer({f'*.{BENCH_ZONE}': [SMTP_HOST]}, latency=dns_latency)
+        self.smtp = FakeSMTPServer(mailboxes=lambda address: address.startswith('user'), latency=smtp_latency)
+        self.domains = domains
+        self.run_id = secrets.token_hex(4)
+        self._stack = ExitStack()
+    
+    def __enter__(self):
+        from money.models import APIKey, SubscriptionPlan, UserProfile
+        from money.throttle import mx_throttle
+        
+        stack = self._stack
+        stack.enter_context(self.dns)
+        stack.enter_context(self.dns.installed())
+        stack.enter_context(self.smtp)
+        stack.enter_context(self.smtp.installed())
+        # Все домены обслуживает один локальный хост - его лимиты не должны мешать замеру
+        stack.enter_context(patch.object(mx_throttle, 'max_concurrent', 10 ** 6))
+        stack.enter_context(patch.object(mx_throttle, 'max_rate', 10 ** 6))
+        stack.enter_context(patch.object(mx_throttle, 'backoff_base', 0))
+        stack.enter_context(override_settings(RATELIMIT_ENABLE=False))
+        
+        plan = SubscriptionPlan.objects.create(
+            name=f'bench-{self.run_id}',
+            display_name='Benchmark',
+            daily_limit=10 ** 9,
+            monthly_limit=10 ** 9,
+            api_access=True,
+            bulk_verification=True,
+        )
+        self.user = User.objects.create_user(f'bench-{self.run_id}', password=secrets.token_hex(8))
+        self.profile = UserProfile.objects.create(user=self.user, plan=plan)
+        self.api_key = APIKey.objects.create(user=self.user, name='Benchmark')
+        self.client = Client(HTTP_X_API_KEY=self.api_key.key)
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._stack.close()
+    
+    def address(self, scenario, index, mailbox='user'):
+        """Уникальный адрес сценария на одном из self.domains доменов"""
+        return f'{mailbox}{index}@d{index % self.domains}.{scenario}.{self.run_id}.{BENCH_ZONE}'
+    
+    def post(self, url_name, payload):
+        response = self.client.post(reverse(url_name), data=json.dumps(payload), content_type='application/json')
+        if response.status_code != 200:
+            raise RuntimeError(f'{url_name}: HTTP {response.status_code} {response.content[:200]!r}')
+        return response
+
+
+def bench_verify_email(env, index):
+    from money.views import verify_email
+    verify_email(env.address('verify', index, 'user' if index % 4 else 'nobody'))
+
+
+def bench_verify_email_greylisted(env, index):
+    from money.views import verify_email
+    verify_email(env.address('greylist', index))
+
+
+def bench_verify_email_api(env, index):
+    env.post('money:verify_api', {'email': env.address('api', index)})
+
+
+def bench_verify_email_api_syntax(env, index):
+    env.post('money:verify_api', {'email': env.address('syntax', index), 'level': 'syntax'})
+
+
+def bench_verify_email_bulk_api(env, index, size=100):
+    env.post('money:verify_bulk_api', {'emails': [env.address('bulk', index * size + offset) for offset in range(size)]})
+
+
+def bench_reserve_quota(env, index):
+    from money.quota import reserve_quota
+    reserve_quota(env.profile)
+
+
+def bench_reference(env, index):
+    """Эталонная нагрузка без сети: разбор адреса и простой запрос к БД"""
+    from money.models import SubscriptionPlan
+    from money.views import validate_email_syntax
+    validate_email_syntax(env.address('reference', index))
+    SubscriptionPlan.objects.filter(pk=env.profile.plan_id).exists()
+
+
+# Имя -> (функция операции, число операций по умолчанию, настройки fake-серверов)
+SCENARIOS = {
+    'verify_email': (bench_verify_email, 200, {}),
+    'verify_email_greylisted': (bench_verify_email_greylisted, 100, {'greylist': True}),
+    'verify_email_api': (bench_verify_email_api, 200, {}),
+    'verify_email_api_syntax': (bench_verify_email_api_syntax, 500, {}),
+    'verify_email_bulk_api': (bench_verify_email_bulk_api, 20, {}),
+    'reserve_quota': (bench_reserve_quota, 500, {}),
+}
+
+
+def run_scenario(env, name, requests=None):
+    """Прогнать сценарий в окружении env и вернуть показатели"""
+    operation, default_requests, smtp_options = SCENARIOS[name]
+    with ExitStack() as stack:
+        for option, value in smtp_options.items():
+            stack.enter_context(patch.object(env.smtp, option, value))
+        return measure(lambda index: operation(env, index), requests or default_requests)
+
+
+def run_reference(env, requests=REFERENCE_REQUESTS):
+    """Замерить эталонную нагрузку - меру скорости машины"""
+    return measure(lambda index: bench_reference(env, index), requests)
@@ -0,0 +1,103 @@
+"""
+Массовая проверка email: разбор загруженного списка адресов.
+
+Адреса принимаются в JSON ({"emails": [...]}), в теле text/csv или
+файлом CSV в поле "file". Из CSV берётся первая ячейка строки, похожая
+на email, поэтому заголовки и дополнительные колонки не мешают.
+"""
+
+import csv
+import io
+import json
+
+from django.conf import settings
+
+
+# Максимум адресов в одном запросе
+BULK_VERIFY_MAX_EMAILS = getattr(settings, 'BULK_VERIFY_MAX_EMAILS', 5000)
+# Максимальный размер файла CSV в запросе (байты); большие файлы - через загрузку (upload)
+BULK_VERIFY_MAX_BYTES = getattr(settings, 'BULK_VERIFY_MAX_BYTES', 5 * 1024 * 1024)
+
+
+def iter_csv_emails(lines):
+    """Адреса из строк CSV по одному - первая ячейка с '@' в каждой строке"""
+    for row in csv.reader(lines):
+        for cell in row:
+            cell = cell.strip()
+            if '@' in cell:
+                yield cell
+                break
+
+
+def parse_csv_emails(text):
+    """Адреса из CSV - первая ячейка с '@' в каждой строке"""
+    return list(iter_csv_emails(io.StringIO(text)))
+
+
+def deduplicate(emails):
+    """Удаление пустых значений и повторов с сохранением порядка"""
+    seen = set()
+    unique = []
+    for email in emails:
+        email = email.strip()
+        key = email.lower()
+        if email and key not in seen:
+            seen.add(key)
+            unique.append(email)
+    return unique
+
+
+def read_upload_emails(upload, limit=BULK_VERIFY_MAX_EMAILS):
+    """Адреса из файла CSV построчно, без повторов.
+    
+    Чтение останавливается на limit + 1 адресе - этого хватает, чтобы
+    сообщить о превышении лимита, не читая файл до конца.
+    """
+    lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', errors='replace', newline='')
+    seen = set()
+    emails = []
+    try:
+        for email in iter_csv_emails(lines):
+            key = email.lower()
+            if key not in seen:
+                seen.add(key)
+                emails.append(email)
+                if len(emails) > limit:
+                    break
+    finally:
+        lines.detach()  # Файл закрывает Django вместе с запросом
+    return emails
+
+
+def parse_bulk_emails(request):
+    """Список адресов из запроса. Возвращает (emails, сообщение об ошибке)"""
+    upload = request.FILES.get('file')
+    if upload:
+        if upload.size > BULK_VERIFY_MAX_BYTES:
+            return [], f'Файл слишком большой: максимум {BULK_VERIFY_MAX_BYTES // (1024 * 1024)} МБ за один запрос'
+        emails = read_upload_emails(upload)
+    elif request.content_type == 'text/csv':
+        emails = parse_csv_emails(request.body.decode('utf-8-sig', 'replace'))
+    else:
+        try:
+            data = json.loads(request.body)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return [], 'Неверный формат запроса: ожидается JSON или CSV'
+        emails = data.get('emails') if isinstance(data, dict) else None
+        if not isinstance(emails, list) or not all(isinstance(email, str) for email in emails):
+            return [], 'Поле emails должно быть списком строк'
+    
+    emails = deduplicate(emails)
+    if not emails:
+        return [], 'Список адресов пуст'
+    if len(emails) > BULK_VERIFY_MAX_EMAILS:
+        return [], f'Слишком много адресов: максимум {BULK_VERIFY_MAX_EMAILS} за один запрос'
+    return emails, None
+
+
+def summarize(results):
+    """Количество адресов по статусам"""
+    summary = {'valid': 0, 'invalid': 0, 'risky': 0, 'unknown': 0, 'catch_all': 0}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return summary
@@ -0,0 +1,142 @@
+"""
+Кэши с учётом TTL.
+
+TTLCache - ограниченный по размеру LRU-кэш внутри процесса.
+TwoLevelCache - TTLCache перед кэшем Django (Redis в production), так что
+результаты видны всем воркерам gunicorn, а повторные обращения в рамках
+процесса обслуживаются без сетевого запроса.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+
+class TTLCache:
+    """LRU-кэш в памяти процесса с временем жизни записей"""
+    
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+    
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self):
+        return len(self._data)
+
+
+class TwoLevelCache:
+    """Локальный TTLCache перед общим кэшем Django"""
+    
+    def __init__(self, prefix, max_size=10000, alias='default'):
+        self.prefix = prefix
+        self.alias = alias
+        self.local = TTLCache(max_size)
+    
+    def make_key(self, key):
+        return f'{self.prefix}:{key}'
+    
+    @property
+    def shared(self):
+        return caches[self.alias]
+    
+    def _from_shared(self, key, entry, default):
+        """Перенос записи общего кэша в локальный с оставшимся TTL"""
+        if entry is None:
+            return default
+        expires_at, value = entry
+        ttl = expires_at - time.time()
+        if ttl <= 0:
+            return default
+        self.local.set(key, value, ttl)
+        return value
+    
+    def get(self, key, default=None):
+        value = self.local.get(key, default)
+        if value is not default:
+            return value
+        return self._from_shared(key, self.shared.get(self.make_key(key)), default)
+    
+    def set(self, key, value, ttl):
+        ttl = int(ttl)
+        if ttl <= 0:
+            return
+        self.local.set(key, value, ttl)
+        self.shared.set(self.make_key(key), (time.time() + ttl, value), timeout=ttl)
+    
+    def get_many(self, keys):
+        """Словарь найденных значений, общий кэш опрашивается одним запросом"""
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        
+        if missing:
+            entries = self.shared.get_many([self.make_key(key) for key in missing])
+            for key in missing:
+                value = self._from_shared(key, entries.get(self.make_key(key)), None)
+                if value is not None:
+                    found[key] = value
+        return found
+    
+    def set_many(self, items):
+        """Сохранение пар ключ -> (значение, ttl), по одному запросу на каждый TTL"""
+        by_ttl = {}
+        for key, (value, ttl) in items.items():
+            ttl = int(ttl)
+            if ttl > 0:
+                self.local.set(key, value, ttl)
+                by_ttl.setdefault(ttl, {})[self.make_key(key)] = (time.time() + ttl, value)
+        for ttl, entries in by_ttl.items():
+            self.shared.set_many(entries, timeout=ttl)
+    
+    def delete(self, key):
+        self.local.delete(key)
+        self.shared.delete(self.make_key(key))
+    
+    async def aget(self, key, default=None):
+        value = self.local.get(key, default)
+        if value is not default:
+            return value
+        return self._from_shared(key, await self.shared.aget(self.make_key(key)), default)
+    
+    async def aset(self, key, value, ttl):
+        ttl = int(ttl)
+        if ttl <= 0:
+            return
+        self.local.set(key, value, ttl)
+        await self.shared.aset(self.make_key(key), (time.time() + ttl, value), timeout=ttl)
@@ -0,0 +1,184 @@
+"""
+Определение одноразовых email доменов по большому списку.
+
+Список (100k+ доменов, по одному в строке, '#' - комментарий) один раз
+сортируется в файл в каталоге DISPOSABLE_COMPILED_DIR (по умолчанию -
+временный каталог системы) и открывается через mmap:
+страницы файла общие для всех воркеров gunicorn, а память процесса не
+растёт с размером списка. Поиск - бинарный по строкам файла для каждого
+суффикса домена, поэтому запись mailinator.com покрывает и a.b.mailinator.com.
+Изменение исходного файла подхватывается без перезапуска воркеров; если
+новый файл не удалось прочитать, остаётся загруженный ранее список.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def default_compiled_dir():
+    return os.path.join(tempfile.gettempdir(), 'email-verifier-domains')
+
+
+def domain_suffixes(domain):
+    """Домен и все его родительские домены, кроме зоны верхнего уровня"""
+    labels = domain.split('.')
+    return ['.'.join(labels[i:]) for i in range(len(labels) - 1)]
+
+
+def normalize_domain(line):
+    """Домен из строки списка или '' для пустых строк и комментариев"""
+    line = line.split('#', 1)[0].strip().lower()
+    if line.startswith('*.'):
+        line = line[2:]
+    return line.strip('.')
+
+
+def read_domains(path):
+    """Множество доменов из текстового файла"""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return {domain for domain in map(normalize_domain, f) if domain}
+
+
+def compile_domain_list(source_path, compiled_dir=None):
+    """Отсортированная копия списка для mmap, пересобирается при изменении источника.
+    
+    Копия пишется в compiled_dir: каталог со списком может быть доступен только для чтения.
+    """
+    compiled_dir = compiled_dir or default_compiled_dir()
+    os.makedirs(compiled_dir, exist_ok=True)
+    # Имя зависит от полного пути: разные списки с одинаковым именем не перепутаются
+    source_id = hashlib.sha1(os.path.abspath(source_path).encode('utf-8')).hexdigest()[:12]
+    compiled_path = os.path.join(compiled_dir, f'{os.path.basename(source_path)}.{source_id}.sorted')
+    try:
+        if os.path.getmtime(compiled_path) >= os.path.getmtime(source_path):
+            return compiled_path
+    except OSError:
+        pass
+    
+    data = '\n'.join(sorted(read_domains(source_path))).encode('utf-8')
+    tmp_path = f'{compiled_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, compiled_path)  # Атомарно для параллельно читающих воркеров
+    return compiled_path
+
+
+class SortedDomainFile:
+    """Отсортированный файл доменов в mmap с бинарным поиском по строкам"""
+    
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+    
+    def __contains__(self, domain):
+        key = domain.encode('utf-8')
+        data = self.data
+        lo, hi = 0, len(data)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = data.rfind(b'\n', 0, mid) + 1
+            end = data.find(b'\n', start)
+            if end == -1:
+                end = len(data)
+            line = data[start:end]
+            if line == key:
+                return True
+            if line < key:
+                lo = end + 1
+            else:
+                hi = start
+        return False
+
+
+class DomainClassifier:
+    """Классификация доменов по чёрному и белому спискам с горячей перезагрузкой"""
+    
+    def __init__(self, blocklist_path=None, allowlist_path=None, builtin=(), reload_interval=60, compiled_dir=None):
+        self.blocklist_path = blocklist_path and str(blocklist_path)
+        self.allowlist_path = allowlist_path and str(allowlist_path)
+        self.compiled_dir = compiled_dir and str(compiled_dir)
+        self.builtin = frozenset(builtin)
+        self.reload_interval = reload_interval
+        self.blocklist = None
+        self.allowlist = frozenset()
+        self.loaded_mtimes = None
+        self.next_check = 0
+        self.lock = threading.Lock()
+    
+    def source_mtimes(self):
+        mtimes = []
+        for path in (self.blocklist_path, self.allowlist_path):
+            try:
+                mtimes.append(os.path.getmtime(path) if path else None)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+    
+    def maybe_reload(self):
+        """Перечитать списки, если файлы изменились (не чаще reload_interval)"""
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        with self.lock:
+            if now < self.next_check:
+                return
+            self.next_check = now + self.reload_interval
+            mtimes = self.source_mtimes()
+            if mtimes == self.loaded_mtimes:
+                return
+            blocklist_mtime, allowlist_mtime = mtimes
+            try:
+                blocklist = (
+                    SortedDomainFile(compile_domain_list(self.blocklist_path, self.compiled_dir))
+                    if blocklist_mtime is not None else None
+                )
+                allowlist = (
+                    frozenset(read_domains(self.allowlist_path))
+                    if allowlist_mtime is not None else frozenset()
+                )
+            except (OSError, ValueError):
+                # Проверка продолжается по прежним спискам, загрузка повторится через reload_interval
+                logger.exception('Не удалось загрузить списки одноразовых доменов')
+                return
+            self.blocklist = blocklist
+            self.allowlist = allowlist
+            self.loaded_mtimes = mtimes
+    
+    def warm_up(self):
+        """Загрузить списки и подкачать страницы mmap до первых проверок"""
+        self.next_check = 0
+        self.maybe_reload()
+        data = getattr(self.blocklist, 'data', None)
+        if isinstance(data, mmap.mmap) and hasattr(mmap, 'MADV_WILLNEED'):
+            data.madvise(mmap.MADV_WILLNEED)
+    
+    def is_disposable(self, domain):
+        self.maybe_reload()
+        suffixes = domain_suffixes(domain.lower().strip('.'))
+        if any(suffix in self.allowlist for suffix in suffixes):
+            return False
+        if any(suffix in self.builtin for suffix in suffixes):
+            return True
+        blocklist = self.blocklist
+        return blocklist is not None and any(suffix in blocklist for suffix in suffixes)
+
+
+def make_classifier(builtin=()):
+    """Классификатор по настройкам DISPOSABLE_*"""
+    return DomainClassifier(
+        blocklist_path=getattr(settings, 'DISPOSABLE_DOMAINS_FILE', None),
+        allowlist_path=getattr(settings, 'DISPOSABLE_ALLOWLIST_FILE', None),
+        builtin=builtin,
+        reload_interval=getattr(settings, 'DISPOSABLE_RELOAD_INTERVAL', 60),
+        compiled_dir=getattr(settings, 'DISPOSABLE_COMPILED_DIR', None),
+    )
@@ -0,0 +1,138 @@
+"""
+Сведения о доменах для пропуска лишних SMTP-проверок.
+
+Вердикт домена хранится в общем кэше с временем жизни по его значению
+(DOMAIN_VERDICT_TTLS):
+- catch_all - сервер принимает любой адрес. Определяется один раз: если
+  реальный адрес принят, проверяется заведомо несуществующий ящик;
+- blocked - сервер отказывает в самой проверке: 5xx на подключение, HELO,
+  MAIL FROM или на RCPT TO не об отсутствии ящика (report_smtp_reply), либо
+  DOMAIN_BLOCK_AFTER_FAILURES проверок подряд не удалось выполнить - нет
+  соединения, обрыв, таймаут (report_smtp_failure);
+- normal - сервер отличает существующие ящики от несуществующих.
+
+Для доменов catch_all и blocked следующие адреса не проверяются по SMTP.
+Временные ответы 4xx (greylisting) и таймауты очереди MXThrottle вердикт
+не меняют: адрес получает статус unknown, следующий адрес проверяется.
+Домены без MX пропускают SMTP по кэшу MX-записей (views.mx_cache).
+"""
+
+import secrets
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import TwoLevelCache
+
+NORMAL = 'normal'
+CATCH_ALL = 'catch_all'
+BLOCKED = 'blocked'
+
+# Вердикты, при которых SMTP-проверка адреса не нужна
+SKIP_SMTP_VERDICTS = (CATCH_ALL, BLOCKED)
+
+# Время жизни вердикта (секунды), 0 - не запоминать
+DEFAULT_DOMAIN_VERDICT_TTLS = {
+    NORMAL: 24 * 3600,
+    CATCH_ALL: 24 * 3600,
+    BLOCKED: 15 * 60,
+}
+
+DOMAIN_VERDICT_TTLS = {**DEFAULT_DOMAIN_VERDICT_TTLS, **getattr(settings, 'DOMAIN_VERDICT_TTLS', {})}
+
+# Сколько сбоев SMTP-проверки подряд делают домен blocked
+DOMAIN_BLOCK_AFTER_FAILURES = getattr(settings, 'DOMAIN_BLOCK_AFTER_FAILURES', 3)
+# Через сколько секунд без новых сбоев серия забывается
+FAILURE_WINDOW = 15 * 60
+
+# Ответы на RCPT TO об отсутствии ящика (views.interpret_rcpt_code)
+MAILBOX_REJECTION_CODES = (550, 551, 552, 553)
+
+domain_verdicts = TwoLevelCache('domain', max_size=getattr(settings, 'DOMAIN_VERDICT_CACHE_SIZE', 10000))
+
+
+def random_mailbox(domain):
+    """Заведомо несуществующий адрес на домене для проверки catch-all"""
+    return f'{secrets.token_hex(12)}@{domain}'
+
+
+def catch_all_verdict(accepted):
+    """Вердикт по ответу на несуществующий ящик (None - ответ неточный)"""
+    return {True: CATCH_ALL, False: NORMAL}.get(accepted)
+
+
+def probe_verdict(deliverable):
+    """Вердикт по ответу на реальный адрес, если проверка catch-all не нужна.
+    
+    Неточный ответ вердикт не меняет: blocked ставят report_smtp_reply и report_smtp_failure.
+    """
+    return None if deliverable is None else NORMAL
+
+
+def is_policy_rejection(code, rcpt=False):
+    """Отказ 5xx в самой проверке, а не ответ об отсутствии ящика"""
+    return code is not None and code >= 500 and not (rcpt and code in MAILBOX_REJECTION_CODES)
+
+
+def failures_key(domain):
+    return f'domain:failures:{domain.lower()}'
+
+
+def get_domain_verdict(domain):
+    return domain_verdicts.get(domain)
+
+
+async def aget_domain_verdict(domain):
+    return await domain_verdicts.aget(domain)
+
+
+def set_domain_verdict(domain, verdict):
+    if verdict is not None:
+        domain_verdicts.set(domain, verdict, DOMAIN_VERDICT_TTLS.get(verdict, 0))
+
+
+async def aset_domain_verdict(domain, verdict):
+    if verdict is not None:
+        await domain_verdicts.aset(domain, verdict, DOMAIN_VERDICT_TTLS.get(verdict, 0))
+
+
+def report_smtp_reply(domain, code, rcpt=False):
+    """Учесть ответ сервера: отказ в проверке блокирует домен, любой ответ прерывает серию сбоев"""
+    if is_policy_rejection(code, rcpt):
+        set_domain_verdict(domain, BLOCKED)
+    cache.delete(failures_key(domain))
+
+
+async def areport_smtp_reply(domain, code, rcpt=False):
+    if is_policy_rejection(code, rcpt):
+        await aset_domain_verdict(domain, BLOCKED)
+    await cache.adelete(failures_key(domain))
+
+
+def report_smtp_failure(domain):
+    """Учесть сбой проверки (нет соединения, обрыв, таймаут). True - домен заблокирован"""
+    key = failures_key(domain)
+    cache.add(key, 0, FAILURE_WINDOW)
+    try:
+        failures = cache.incr(key)
+    except ValueError:
+        return False  # Серия истекла между add и incr
+    if failures < DOMAIN_BLOCK_AFTER_FAILURES:
+        return False
+    cache.delete(key)
+    set_domain_verdict(domain, BLOCKED)
+    return True
+
+
+async def areport_smtp_failure(domain):
+    key = failures_key(domain)
+    await cache.aadd(key, 0, FAILURE_WINDOW)
+    try:
+        failures = await cache.aincr(key)
+    except ValueError:
+        return False
+    if failures < DOMAIN_BLOCK_AFTER_FAILURES:
+        return False
+    await cache.adelete(key)
+    await aset_domain_verdict(domain, BLOCKED)
+    return True
@@ -0,0 +1,135 @@
+"""
+Потоковая выгрузка истории проверок в CSV и JSONL.
+
+Строки читаются курсором на стороне сервера (.iterator(chunk_size=...)) и
+сразу отдаются клиенту через StreamingHttpResponse, поэтому память не
+зависит от размера истории.
+"""
+
+import csv
+import json
+from datetime import date
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import EmailVerification
+from .storage import day_bounds
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+EXPORT_FIELDS = [
+    'email', 'status', 'score', 'is_valid_syntax', 'has_mx_record', 'is_deliverable',
+    'is_disposable', 'domain', 'mx_records', 'error_message', 'created_at',
+]
+
+# Коды ошибок, при которых существование адреса неизвестно
+UNKNOWN_ERROR_CODES = ['smtp_unknown', 'dns_timeout']
+
+# Статус проверки восстанавливается по сохранённым полям так же, как его ставит verify_email
+STATUS_FILTERS = {
+    'valid': Q(is_deliverable=True, is_disposable=False),
+    'invalid': Q(is_deliverable=False, is_disposable=False) & ~Q(error_code__in=UNKNOWN_ERROR_CODES + ['catch_all']),
+    'unknown': Q(error_code__in=UNKNOWN_ERROR_CODES, is_disposable=False),
+    'catch_all': Q(error_code='catch_all', is_disposable=False),
+    'risky': Q(is_disposable=True),
+}
+
+
+def verification_status(verification):
+    """Статус сохранённой проверки: valid, invalid, unknown, catch_all или risky"""
+    if verification.is_disposable:
+        return 'risky'
+    if verification.is_deliverable:
+        return 'valid'
+    if verification.error_code in UNKNOWN_ERROR_CODES:
+        return 'unknown'
+    if verification.error_code == 'catch_all':
+        return 'catch_all'
+    return 'invalid'
+
+
+def parse_export_params(params):
+    """Разбор формата и фильтров выгрузки. Возвращает (параметры, сообщение об ошибке)"""
+    export_format = params.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return None, 'Формат выгрузки: csv или jsonl'
+    
+    status = params.get('status', '')
+    if status and status not in STATUS_FILTERS:
+        return None, f'Неизвестный статус: {status}'
+    
+    try:
+        date_from = date.fromisoformat(params['from']) if params.get('from') else None
+        date_to = date.fromisoformat(params['to']) if params.get('to') else None
+    except ValueError:
+        return None, 'Даты указываются в формате ГГГГ-ММ-ДД'
+    
+    return {'format': export_format, 'status': status, 'from': date_from, 'to': date_to}, None
+
+
+def export_queryset(user, options):
+    """Проверки пользователя с учётом фильтров, от старых к новым"""
+    queryset = EmailVerification.objects.filter(user=user).select_related('mx_set')
+    # Границы дня вместо __date, чтобы работал индекс (user, created_at)
+    if options['from']:
+        queryset = queryset.filter(created_at__gte=day_bounds(options['from'])[0])
+    if options['to']:
+        queryset = queryset.filter(created_at__lt=day_bounds(options['to'])[1])
+    if options['status']:
+        queryset = queryset.filter(STATUS_FILTERS[options['status']])
+    return queryset.order_by('created_at', 'id')
+
+
+def export_row(verification):
+    """Строка выгрузки для одной проверки"""
+    return {
+        'email': verification.email,
+        'status': verification_status(verification),
+        'score': verification.overall_score,
+        'is_valid_syntax': verification.is_valid_syntax,
+        'has_mx_record': verification.has_mx_record,
+        'is_deliverable': verification.is_deliverable,
+        'is_disposable': verification.is_disposable,
+        'domain': verification.domain,
+        'mx_records': verification.mx_records,
+        'error_message': verification.error_message,
+        'created_at': timezone.localtime(verification.created_at).isoformat(),
+    }
+
+
+class Echo:
+    """Псевдофайл для csv.writer: возвращает записанную строку вместо буферизации"""
+    
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.DictWriter(Echo(), fieldnames=EXPORT_FIELDS)
+    yield '\ufeff' + writer.writeheader()  # BOM, чтобы Excel открыл UTF-8
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def export_response(user, options):
+    """StreamingHttpResponse с историей проверок пользователя"""
+    rows = map(export_row, export_queryset(user, options).iterator(chunk_size=EXPORT_CHUNK_SIZE))
+    stream = iter_csv(rows) if options['format'] == 'csv' else iter_jsonl(rows)
+    
+    response = StreamingHttpResponse(stream, content_type=EXPORT_FORMATS[options['format']])
+    filename = f"verifications-{timezone.localdate():%Y%m%d}.{options['format']}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
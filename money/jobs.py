@@ -0,0 +1,263 @@
+"""
+Фоновые задачи верификации.
+
+POST /api/verify/?async=1 и /api/verify/bulk/?async=1 сразу возвращают id
+задачи, а проверку выполняют воркеры (manage.py run_verification_worker).
+Очередь хранится в таблице VerificationJob: воркер забирает задачу условным
+UPDATE, поэтому несколько процессов никогда не возьмут одну задачу дважды.
+Результат доступен по /api/jobs/<id>/ или отправляется POST-запросом на callback_url.
+Callback принимается только на публичный адрес: имя хоста разрешается при
+постановке задачи и ещё раз перед отправкой, соединение идёт на проверенный
+IP, редиректы не выполняются - так клиент API не заставит сервер обратиться
+к внутренним адресам (127.0.0.1, 10/8, 169.254.169.254).
+Задачи загрузки больших файлов (kind='upload') выполняет upload.process_upload_job.
+"""
+
+import http.client
+import ipaddress
+import json
+import socket
+import time
+from datetime import timedelta
+from functools import partial
+from urllib.parse import urlparse
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from .bulk import summarize
+from .models import EmailVerification, VerificationJob
+from .result_cache import verify_many_with_cache
+
+
+# Задача в статусе running без признаков жизни дольше этого времени считается брошенной (секунды)
+JOB_STALE_TIMEOUT = getattr(settings, 'JOB_STALE_TIMEOUT', 600)
+JOB_MAX_ATTEMPTS = getattr(settings, 'JOB_MAX_ATTEMPTS', 3)
+CALLBACK_TIMEOUT = 10
+# Как часто воркер удаляет файлы завершённых загрузок (секунды)
+UPLOAD_PURGE_INTERVAL = 3600
+
+
+def is_async_request(request):
+    """Запрошен ли асинхронный режим (?async=1)"""
+    return request.GET.get('async', '').lower() in ('1', 'true', 'yes')
+
+
+def resolve_host(host, port):
+    """IP-адреса хоста"""
+    return [info[4][0] for info in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)]
+
+
+def is_public_address(address):
+    """Адрес в интернете: не loopback, не частный, не link-local, не зарезервированный"""
+    ip = ipaddress.ip_address(address)
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def callback_address(url):
+    """Проверенный IP-адрес для callback или None (не http(s), имя не разрешается, внутренний адрес)"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return None
+    try:
+        addresses = resolve_host(parsed.hostname, parsed.port or (443 if parsed.scheme == 'https' else 80))
+        if addresses and all(is_public_address(address) for address in addresses):
+            return addresses[0]
+    except (OSError, ValueError, UnicodeError):
+        pass
+    return None
+
+
+def is_valid_callback_url(url):
+    """Callback допускается только на публичный http(s) адрес"""
+    return callback_address(url) is not None
+
+
+def post_callback(url, address, body):
+    """POST на url через проверенный address без перехода по редиректам. Возвращает код ответа"""
+    parsed = urlparse(url)
+    connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+    connection = connection_class(parsed.hostname, parsed.port, timeout=CALLBACK_TIMEOUT)
+    # Подключаемся к проверенному IP: новый DNS-запрос мог бы вернуть внутренний адрес (DNS rebinding)
+    connection._create_connection = lambda host_port, *args: socket.create_connection((address, host_port[1]), *args)
+    path = parsed.path or '/'
+    if parsed.query:
+        path = f'{path}?{parsed.query}'
+    try:
+        connection.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+        return connection.getresponse().status
+    finally:
+        connection.close()
+
+
+def enqueue_job(kind, emails, user, api_key=None, ip_address=None, callback_url=''):
+    """Поставить проверку в очередь"""
+    return VerificationJob.objects.create(
+        kind=kind,
+        emails=emails,
+        user=user,
+        api_key=api_key,
+        ip_address=ip_address,
+        callback_url=callback_url,
+    )
+
+
+def claim_next_job():
+    """Забрать самую старую задачу из очереди или вернуть None"""
+    candidates = VerificationJob.objects.filter(status='pending').order_by('created_at')
+    for job_id in candidates.values_list('id', flat=True)[:10]:
+        now = timezone.now()
+        claimed = VerificationJob.objects.filter(pk=job_id, status='pending').update(
+            status='running',
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return VerificationJob.objects.get(pk=job_id)
+    return None
+
+
+def requeue_stale_jobs():
+    """Вернуть в очередь задачи упавших воркеров, исчерпавшие попытки - завершить с ошибкой"""
+    deadline = timezone.now() - timedelta(seconds=JOB_STALE_TIMEOUT)
+    stale = VerificationJob.objects.filter(
+        Q(heartbeat_at__lt=deadline) | Q(heartbeat_at__isnull=True, started_at__lt=deadline),
+        status='running',
+    )
+    stale.filter(attempts__gte=JOB_MAX_ATTEMPTS).update(
+        status='failed',
+        error_message='Превышено число попыток обработки',
+        finished_at=timezone.now(),
+    )
+    return stale.filter(attempts__lt=JOB_MAX_ATTEMPTS).update(status='pending')
+
+
+def touch_job(job):
+    """Отметить, что воркер ещё работает над задачей"""
+    job.heartbeat_at = timezone.now()
+    VerificationJob.objects.filter(pk=job.pk).update(heartbeat_at=job.heartbeat_at)
+
+
+def claimed(job):
+    """Задача всё ещё принадлежит этому воркеру: не возвращена в очередь и не взята повторно"""
+    return VerificationJob.objects.filter(pk=job.pk, status='running', attempts=job.attempts)
+
+
+def job_payload(job):
+    """Представление задачи для API и callback"""
+    payload = {
+        'job_id': str(job.id),
+        'kind': job.kind,
+        'status': job.status,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.kind == 'upload':
+        payload['total'] = job.total_count
+        payload['processed'] = job.processed_count
+        payload['summary'] = job.results or {}
+        payload['results_url'] = reverse('money:job_results', args=[job.id])
+        if job.status == 'failed':
+            payload['error'] = job.error_message
+        return payload
+    
+    if job.status == 'completed':
+        if job.kind == 'single':
+            payload['data'] = job.results[0]
+        else:
+            payload['count'] = len(job.results)
+            payload['summary'] = summarize(job.results)
+            payload['results'] = job.results
+    elif job.status == 'failed':
+        payload['error'] = job.error_message
+    return payload
+
+
+def send_callback(job):
+    """POST результата задачи на callback_url. Возвращает True при ответе 2xx"""
+    if not job.callback_url:
+        return False
+    
+    # Адрес проверяется заново: DNS-запись могла измениться после постановки задачи
+    address = callback_address(job.callback_url)
+    if address is None:
+        return False
+    body = json.dumps(job_payload(job), ensure_ascii=False).encode('utf-8')
+    try:
+        delivered = 200 <= post_callback(job.callback_url, address, body) < 300
+    except (http.client.HTTPException, OSError, ValueError):
+        delivered = False
+    
+    if delivered:
+        VerificationJob.objects.filter(pk=job.pk).update(callback_sent=True)
+        job.callback_sent = True
+    return delivered
+
+
+def process_job(job):
+    """Выполнить задачу: проверка, сохранение результатов, callback"""
+    from .async_verifier import run_bulk_verification
+    from .views import build_verification
+    
+    if job.kind == 'upload':
+        from .upload import process_upload_job
+        return process_upload_job(job)
+    
+    # Долгая проверка (паузы MXThrottle, повторные круги) не должна выглядеть брошенной
+    heartbeat = sync_to_async(touch_job)
+    verify_many = partial(async_to_sync(run_bulk_verification), on_round=lambda: heartbeat(job))
+    try:
+        results, _ = verify_many_with_cache(job.emails, verify_many)
+    except Exception as e:
+        job.status = 'failed'
+        job.error_message = str(e)
+        job.finished_at = timezone.now()
+        if claimed(job).update(status=job.status, error_message=job.error_message, finished_at=job.finished_at):
+            send_callback(job)
+        return job
+    
+    with transaction.atomic():
+        job.results = results
+        job.status = 'completed'
+        job.finished_at = timezone.now()
+        # Задачу вернули в очередь и её выполняет другой воркер - результат запишет он
+        if not claimed(job).update(results=results, status=job.status, finished_at=job.finished_at):
+            return job
+        EmailVerification.objects.bulk_create([
+            build_verification(result, user=job.user, ip_address=job.ip_address, api_key=job.api_key)
+            for result in results
+        ], batch_size=500)
+    
+    send_callback(job)
+    return job
+
+
+def run_worker(poll_interval=1.0, once=False):
+    """Цикл воркера: забирает задачи из очереди и выполняет их.
+    
+    once=True - обработать текущую очередь и выйти. Возвращает число задач.
+    """
+    from .upload import purge_expired_uploads
+    
+    processed = 0
+    next_purge = 0
+    while True:
+        requeue_stale_jobs()
+        if time.monotonic() >= next_purge:
+            purge_expired_uploads()
+            next_purge = time.monotonic() + UPLOAD_PURGE_INTERVAL
+        job = claim_next_job()
+        if job is None:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        process_job(job)
+        processed += 1
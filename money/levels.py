@@ -0,0 +1,71 @@
+"""
+Уровни проверки email (параметр level в API).
+
+- syntax - синтаксис, одноразовые домены и то, что уже известно из кэша
+  (домен без MX, домен catch-all, готовый результат по адресу): без DNS
+  и SMTP;
+- dns - то же плюс MX-записи домена (из кэша или DNS), без SMTP;
+- smtp (по умолчанию) - полная проверка.
+
+Уровни дешевле smtp списывают из лимита VERIFICATION_LEVEL_COSTS
+проверок (по умолчанию бесплатны) и не сохраняются в историю, поэтому
+формам на сайтах клиентов ответ приходит без записи в БД. Анонимные
+запросы платят по VERIFICATION_ANONYMOUS_LEVEL_COSTS: уровень dns ходит
+в DNS и списывается из дневного лимита по IP, бесплатен только syntax.
+
+Ящик на уровнях syntax и dns не проверяется, поэтому адрес, прошедший все
+их проверки, получает статус unknown, а не valid (уровень - в поле level).
+"""
+
+from django.conf import settings
+
+SYNTAX = 'syntax'
+DNS = 'dns'
+SMTP = 'smtp'
+
+LEVELS = (SYNTAX, DNS, SMTP)
+DEFAULT_LEVEL = SMTP
+
+# Сколько проверок из лимита тарифа списывает один адрес на каждом уровне
+DEFAULT_LEVEL_COSTS = {
+    SYNTAX: 0,
+    DNS: 0,
+    SMTP: 1,
+}
+
+# То же для анонимных запросов: без тарифа сетевые проверки DNS не бесплатны
+DEFAULT_ANONYMOUS_LEVEL_COSTS = {
+    SYNTAX: 0,
+    DNS: 1,
+    SMTP: 1,
+}
+
+LEVEL_COSTS = {**DEFAULT_LEVEL_COSTS, **getattr(settings, 'VERIFICATION_LEVEL_COSTS', {})}
+ANONYMOUS_LEVEL_COSTS = {
+    **DEFAULT_ANONYMOUS_LEVEL_COSTS,
+    **getattr(settings, 'VERIFICATION_ANONYMOUS_LEVEL_COSTS', {}),
+}
+
+
+def parse_level(value):
+    """Уровень проверки из параметра запроса. Возвращает (уровень, сообщение об ошибке)"""
+    level = str(value or DEFAULT_LEVEL).strip().lower()
+    if level not in LEVELS:
+        return None, f'Неизвестный уровень проверки: {value}. Допустимые значения: {", ".join(LEVELS)}'
+    return level, None
+
+
+def get_request_level(request, data=None):
+    """Уровень из ?level= или поля level в теле запроса"""
+    return parse_level(request.GET.get('level') or (data or {}).get('level'))
+
+
+def level_cost(level, count=1, anonymous=False):
+    """Сколько проверок списать за count адресов уровня level"""
+    costs = ANONYMOUS_LEVEL_COSTS if anonymous else LEVEL_COSTS
+    return costs[level] * count
+
+
+def is_recorded(level):
+    """Сохраняется ли проверка этого уровня в историю"""
+    return level == SMTP
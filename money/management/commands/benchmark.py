@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from money.benchmarks.runner import (
+    DEFAULT_TOLERANCE, REFERENCE, SCENARIOS, BenchmarkEnvironment, find_regressions, host_factor, load_baselines,
+    run_reference, run_scenario, save_baselines,
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the verification hot path against local fake DNS and SMTP servers'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Scenarios to run (default: all of {", ".join(SCENARIOS)})')
+        parser.add_argument('--requests', type=int, help='Operations per scenario (default: per-scenario)')
+        parser.add_argument('--dns-latency', type=float, default=0.001, help='Fake DNS reply delay, seconds')
+        parser.add_argument('--smtp-latency', type=float, default=0.001, help='Fake SMTP reply delay, seconds')
+        parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Allowed relative regression')
+        parser.add_argument('--update-baselines', action='store_true', help='Store the results as the new baselines')
+    
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+        
+        # Замеры идут в отдельной тестовой БД, рабочие данные не затрагиваются
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with BenchmarkEnvironment(options['dns_latency'], options['smtp_latency']) as env:
+                reference = run_reference(env)
+                results = {name: run_scenario(env, name, options['requests']) for name in names}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        
+        if options['update_baselines']:
+            save_baselines({**results, REFERENCE: reference})
+            self.stdout.write(self.style.SUCCESS(f'Stored baselines for {", ".join(names)}'))
+        
+        baselines = load_baselines()
+        # Базовые задержки пересчитываются на скорость этой машины
+        factor = host_factor(reference, baselines[REFERENCE]) if REFERENCE in baselines else None
+        self.stdout.write(f'reference: {reference["throughput"]} ops/s, p50 {reference["p50_ms"]} ms')
+        if factor is None:
+            self.stdout.write(self.style.WARNING('No reference in baselines: timings are not compared, only queries'))
+        else:
+            self.stdout.write(f'host factor: {factor:.2f} (baseline timings scaled by it)')
+        failures = []
+        self.stdout.write(f'{"scenario":<26}{"ops/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"queries":>9}')
+        for name, stats in results.items():
+            self.stdout.write(
+                f'{name:<26}{stats["throughput"]:>10}{stats["p50_ms"]:>10}{stats["p95_ms"]:>10}'
+                f'{stats["p99_ms"]:>10}{stats["queries"]:>9}'
+            )
+            if name not in baselines:
+                self.stdout.write(self.style.WARNING(f'  no baseline for {name}'))
+                continue
+            for problem in find_regressions(stats, baselines[name], options['tolerance'], factor):
+                failures.append(f'{name}: {problem}')
+                self.stdout.write(self.style.ERROR(f'  regression: {problem}'))
+        
+        if failures:
+            raise CommandError(f'{len(failures)} benchmark regressions')
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from money.storage import VERIFICATION_RETENTION_DAYS, rollup_verifications
+
+
+class Command(BaseCommand):
+    help = 'Roll up old email verifications into daily stats and delete them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=VERIFICATION_RETENTION_DAYS,
+            help='Keep individual verifications for this many days',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        removed = rollup_verifications(cutoff)
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {removed} verifications older than {cutoff:%Y-%m-%d}'))
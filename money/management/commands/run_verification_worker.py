@@ -0,0 +1,38 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from money.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Run background verification workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Number of worker processes')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between queue polls')
+        parser.add_argument('--once', action='store_true', help='Process pending jobs and exit')
+
+    def handle(self, *args, **options):
+        if options['once'] or options['processes'] <= 1:
+            processed = run_worker(poll_interval=options['poll_interval'], once=options['once'])
+            self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs'))
+            return
+
+        # Дочерние процессы не должны делить соединение с БД родителя
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=run_worker, kwargs={'poll_interval': options['poll_interval']})
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Started {len(workers)} worker processes')
+
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
@@ -0,0 +1,130 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("money", "0003_yookassasettings"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VerificationJob",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("single", "Одиночная"), ("bulk", "Массовая")],
+                        default="single",
+                        max_length=10,
+                        verbose_name="Тип",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "В очереди"),
+                            ("running", "Выполняется"),
+                            ("completed", "Завершена"),
+                            ("failed", "Ошибка"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                        verbose_name="Статус",
+                    ),
+                ),
+                ("emails", models.JSONField(default=list, verbose_name="Адреса")),
+                (
+                    "results",
+                    models.JSONField(blank=True, null=True, verbose_name="Результаты"),
+                ),
+                (
+                    "error_message",
+                    models.TextField(blank=True, verbose_name="Сообщение об ошибке"),
+                ),
+                (
+                    "callback_url",
+                    models.URLField(
+                        blank=True, max_length=500, verbose_name="Callback URL"
+                    ),
+                ),
+                (
+                    "callback_sent",
+                    models.BooleanField(
+                        default=False, verbose_name="Callback отправлен"
+                    ),
+                ),
+                (
+                    "ip_address",
+                    models.GenericIPAddressField(
+                        blank=True, null=True, verbose_name="IP адрес"
+                    ),
+                ),
+                ("attempts", models.IntegerField(default=0, verbose_name="Попыток")),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата создания"
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Начало обработки"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Окончание обработки"
+                    ),
+                ),
+                (
+                    "api_key",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="money.apikey",
+                        verbose_name="API ключ",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="verification_jobs",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Задача верификации",
+                "verbose_name_plural": "Задачи верификации",
+                "ordering": ["-created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "created_at"],
+                        name="money_verif_status_bb5719_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,218 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import hashlib
+
+ERROR_CODES = {
+    "Неверный формат email": "invalid_syntax",
+    "Домен не имеет MX-записей - почта не будет доставлена": "no_mx",
+    "Почтовый ящик не существует на сервере": "mailbox_not_found",
+    "Не удалось проверить существование ящика (сервер не отвечает или блокирует проверку)": "smtp_unknown",
+    "Одноразовый email - может быть удалён в любой момент": "disposable",
+}
+
+
+def compact_verifications(apps, schema_editor):
+    """Перенос текстовых MX-записей и ошибок в наборы хостов и коды"""
+    EmailVerification = apps.get_model("money", "EmailVerification")
+    MXHostSet = apps.get_model("money", "MXHostSet")
+
+    for hosts in (
+        EmailVerification.objects.exclude(mx_records="")
+        .values_list("mx_records", flat=True)
+        .order_by()
+        .distinct()
+    ):
+        digest = hashlib.sha256(hosts.encode()).hexdigest()
+        mx_set, _ = MXHostSet.objects.get_or_create(
+            digest=digest, defaults={"hosts": hosts}
+        )
+        EmailVerification.objects.filter(mx_records=hosts).update(mx_set=mx_set)
+
+    for message in (
+        EmailVerification.objects.exclude(error_message="")
+        .values_list("error_message", flat=True)
+        .order_by()
+        .distinct()
+    ):
+        EmailVerification.objects.filter(error_message=message).update(
+            error_code=ERROR_CODES.get(message, "other")
+        )
+
+
+def expand_verifications(apps, schema_editor):
+    """Обратный перенос: текст MX-записей из наборов хостов, текст ошибки из кода.
+
+    Исходный текст ошибок с кодом "other" не сохранялся - вместо него
+    записывается "Другая ошибка".
+    """
+    EmailVerification = apps.get_model("money", "EmailVerification")
+    MXHostSet = apps.get_model("money", "MXHostSet")
+    messages = {code: message for message, code in ERROR_CODES.items()}
+    messages["other"] = "Другая ошибка"
+
+    for mx_set in MXHostSet.objects.all():
+        EmailVerification.objects.filter(mx_set=mx_set).update(mx_records=mx_set.hosts)
+
+    for code, message in messages.items():
+        EmailVerification.objects.filter(error_code=code).update(error_message=message)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("money", "0004_verificationjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MXHostSet",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hosts", models.TextField(verbose_name="MX-хосты")),
+                (
+                    "digest",
+                    models.CharField(
+                        max_length=64, unique=True, verbose_name="Хэш набора"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Набор MX-хостов",
+                "verbose_name_plural": "Наборы MX-хостов",
+            },
+        ),
+        migrations.CreateModel(
+            name="VerificationDailyStats",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Дата")),
+                (
+                    "total",
+                    models.IntegerField(default=0, verbose_name="Всего проверок"),
+                ),
+                (
+                    "valid_syntax",
+                    models.IntegerField(default=0, verbose_name="Валидный синтаксис"),
+                ),
+                (
+                    "with_mx",
+                    models.IntegerField(default=0, verbose_name="Есть MX-запись"),
+                ),
+                (
+                    "deliverable",
+                    models.IntegerField(default=0, verbose_name="Доставляемых"),
+                ),
+                (
+                    "disposable",
+                    models.IntegerField(default=0, verbose_name="Одноразовых"),
+                ),
+            ],
+            options={
+                "verbose_name": "Статистика проверок за день",
+                "verbose_name_plural": "Статистика проверок по дням",
+                "ordering": ["-date"],
+            },
+        ),
+        migrations.AddField(
+            model_name="emailverification",
+            name="error_code",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("invalid_syntax", "Неверный формат email"),
+                    ("no_mx", "Домен не имеет MX-записей - почта не будет доставлена"),
+                    ("mailbox_not_found", "Почтовый ящик не существует на сервере"),
+                    (
+                        "smtp_unknown",
+                        "Не удалось проверить существование ящика (сервер не отвечает или блокирует проверку)",
+                    ),
+                    (
+                        "disposable",
+                        "Одноразовый email - может быть удалён в любой момент",
+                    ),
+                    ("other", "Другая ошибка"),
+                ],
+                max_length=20,
+                verbose_name="Ошибка",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="emailverification",
+            index=models.Index(
+                fields=["user", "-created_at"], name="money_email_user_id_3c5b05_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="emailverification",
+            index=models.Index(
+                fields=["domain", "-created_at"], name="money_email_domain_30435b_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="verificationdailystats",
+            name="user",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="verification_stats",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Пользователь",
+            ),
+        ),
+        migrations.AddField(
+            model_name="emailverification",
+            name="mx_set",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="money.mxhostset",
+                verbose_name="MX-записи",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="verificationdailystats",
+            constraint=models.UniqueConstraint(
+                fields=("user", "date"), name="verification_stats_user_date"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="verificationdailystats",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("user__isnull", True)),
+                fields=("date",),
+                name="verification_stats_anonymous_date",
+            ),
+        ),
+        migrations.RunPython(compact_verifications, expand_verifications),
+        migrations.RemoveField(
+            model_name="emailverification",
+            name="error_message",
+        ),
+        migrations.RemoveField(
+            model_name="emailverification",
+            name="mx_records",
+        ),
+    ]
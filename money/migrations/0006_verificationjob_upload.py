@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("money", "0005_compact_verification_storage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="verificationjob",
+            name="heartbeat_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Последний признак жизни воркера"
+            ),
+        ),
+        migrations.AddField(
+            model_name="verificationjob",
+            name="processed_count",
+            field=models.IntegerField(default=0, verbose_name="Проверено адресов"),
+        ),
+        migrations.AddField(
+            model_name="verificationjob",
+            name="total_count",
+            field=models.IntegerField(default=0, verbose_name="Всего адресов"),
+        ),
+        migrations.AlterField(
+            model_name="verificationjob",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("single", "Одиночная"),
+                    ("bulk", "Массовая"),
+                    ("upload", "Загрузка файла"),
+                ],
+                default="single",
+                max_length=10,
+                verbose_name="Тип",
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("money", "0007_emailverification_catch_all"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="emailverification",
+            name="error_code",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("invalid_syntax", "Неверный формат email"),
+                    ("no_mx", "Домен не имеет MX-записей - почта не будет доставлена"),
+                    ("mailbox_not_found", "Почтовый ящик не существует на сервере"),
+                    (
+                        "smtp_unknown",
+                        "Не удалось проверить существование ящика (сервер не отвечает или блокирует проверку)",
+                    ),
+                    (
+                        "catch_all",
+                        "Домен принимает любые адреса (catch-all) - существование ящика не проверить",
+                    ),
+                    (
+                        "dns_timeout",
+                        "DNS-серверы не ответили - не удалось получить MX-записи домена",
+                    ),
+                    (
+                        "disposable",
+                        "Одноразовый email - может быть удалён в любой момент",
+                    ),
+                    ("other", "Другая ошибка"),
+                ],
+                max_length=20,
+                verbose_name="Ошибка",
+            ),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+import hashlib
 import secrets
 import uuid
 
@@ -121,6 +122,18 @@ class UserProfile(models.Model):
         self.monthly_verifications += 1
         self.total_verifications += 1
         self.save()
+    
+    def remaining_verifications(self):
+        """Сколько проверок ещё доступно сегодня с учётом месячного лимита"""
+        from datetime import date
+        
+        if not self.plan:
+            return 0
+        daily_used = self.daily_verifications if self.last_verification_date == date.today() else 0
+        return max(0, min(
+            self.plan.daily_limit - daily_used,
+            self.plan.monthly_limit - self.monthly_verifications,
+        ))
 
 
 class APIKey(models.Model):
@@ -191,9 +204,39 @@ class Payment(models.Model):
         super().save(*args, **kwargs)
 
 
+class MXHostSet(models.Model):
+    """Набор MX-хостов домена: хранится один раз и используется всеми проверками"""
+    
+    hosts = models.TextField(verbose_name="MX-хосты")
+    digest = models.CharField(max_length=64, unique=True, verbose_name="Хэш набора")
+    
+    class Meta:
+        verbose_name = "Набор MX-хостов"
+        verbose_name_plural = "Наборы MX-хостов"
+    
+    def __str__(self):
+        return self.hosts
+    
+    @staticmethod
+    def make_digest(hosts):
+        return hashlib.sha256(hosts.encode()).hexdigest()
+
+
 class EmailVerification(models.Model):
     """Модель для хранения результатов проверки email"""
     
+    # Коды ошибок вместо повторяющегося в каждой строке текста
+    ERROR_CHOICES = [
+        ('invalid_syntax', 'Неверный формат email'),
+        ('no_mx', 'Домен не имеет MX-записей - почта не будет доставлена'),
+        ('mailbox_not_found', 'Почтовый ящик не существует на сервере'),
+        ('smtp_unknown', 'Не удалось проверить существование ящика (сервер не отвечает или блокирует проверку)'),
+        ('catch_all', 'Домен принимает любые адреса (catch-all) - существование ящика не проверить'),
+        ('dns_timeout', 'DNS-серверы не ответили - не удалось получить MX-записи домена'),
+        ('disposable', 'Одноразовый email - может быть удалён в любой момент'),
+        ('other', 'Другая ошибка'),
+    ]
+    
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='verifications', verbose_name="Пользователь")
     email = models.EmailField(verbose_name="Email адрес")
     
@@ -205,8 +248,8 @@ class EmailVerification(models.Model):
     
     # Дополнительная информация
     domain = models.CharField(max_length=255, blank=True, verbose_name="Домен")
-    mx_records = models.TextField(blank=True, verbose_name="MX-записи")
-    error_message = models.TextField(blank=True, verbose_name="Сообщение об ошибке")
+    mx_set = models.ForeignKey(MXHostSet, on_delete=models.PROTECT, null=True, blank=True, related_name='+', verbose_name="MX-записи")
+    error_code = models.CharField(max_length=20, choices=ERROR_CHOICES, blank=True, verbose_name="Ошибка")
     
     # Метаданные
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата проверки")
@@ -217,10 +260,31 @@ class EmailVerification(models.Model):
         verbose_name = "Проверка email"
         verbose_name_plural = "Проверки email"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['domain', '-created_at']),
+        ]
     
     def __str__(self):
         return f"{self.email} - {'✓' if self.is_deliverable else '✗'}"
     
+    @property
+    def mx_records(self):
+        """MX-записи строкой через запятую"""
+        return self.mx_set.hosts if self.mx_set_id else ''
+    
+    @property
+    def error_message(self):
+        """Текст ошибки по коду"""
+        return self.get_error_code_display() if self.error_code else ''
+    
+    @classmethod
+    def error_code_for(cls, message):
+        """Код ошибки по тексту из результата проверки"""
+        if not message:
+            return ''
+        return next((code for code, text in cls.ERROR_CHOICES if text == message), 'other')
+    
     @property
     def overall_score(self):
         """Общий балл качества email (0-100)"""
@@ -234,3 +298,80 @@ class EmailVerification(models.Model):
         if not self.is_disposable:
             score += 10
         return score
+
+
+class VerificationDailyStats(models.Model):
+    """Дневные итоги проверок пользователя (свёрнутые старые записи EmailVerification)"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='verification_stats', verbose_name="Пользователь")
+    date = models.DateField(verbose_name="Дата")
+    
+    total = models.IntegerField(default=0, verbose_name="Всего проверок")
+    valid_syntax = models.IntegerField(default=0, verbose_name="Валидный синтаксис")
+    with_mx = models.IntegerField(default=0, verbose_name="Есть MX-запись")
+    deliverable = models.IntegerField(default=0, verbose_name="Доставляемых")
+    disposable = models.IntegerField(default=0, verbose_name="Одноразовых")
+    
+    class Meta:
+        verbose_name = "Статистика проверок за день"
+        verbose_name_plural = "Статистика проверок по дням"
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='verification_stats_user_date'),
+            models.UniqueConstraint(fields=['date'], condition=models.Q(user__isnull=True), name='verification_stats_anonymous_date'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username if self.user else 'Аноним'} - {self.date} - {self.total}"
+
+
+class VerificationJob(models.Model):
+    """Фоновая задача верификации (одиночная или массовая)"""
+    
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('completed', 'Завершена'),
+        ('failed', 'Ошибка'),
+    ]
+    
+    KIND_CHOICES = [
+        ('single', 'Одиночная'),
+        ('bulk', 'Массовая'),
+        ('upload', 'Загрузка файла'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='verification_jobs', verbose_name="Пользователь")
+    api_key = models.ForeignKey(APIKey, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="API ключ")
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='single', verbose_name="Тип")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Статус")
+    emails = models.JSONField(default=list, verbose_name="Адреса")
+    results = models.JSONField(null=True, blank=True, verbose_name="Результаты")
+    error_message = models.TextField(blank=True, verbose_name="Сообщение об ошибке")
+    
+    callback_url = models.URLField(max_length=500, blank=True, verbose_name="Callback URL")
+    callback_sent = models.BooleanField(default=False, verbose_name="Callback отправлен")
+    ip_address = models.GenericIPAddressField(null=True, blank=True, verbose_name="IP адрес")
+    attempts = models.IntegerField(default=0, verbose_name="Попыток")
+    
+    # Прогресс задач загрузки файла
+    total_count = models.IntegerField(default=0, verbose_name="Всего адресов")
+    processed_count = models.IntegerField(default=0, verbose_name="Проверено адресов")
+    
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начало обработки")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Окончание обработки")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="Последний признак жизни воркера")
+    
+    class Meta:
+        verbose_name = "Задача верификации"
+        verbose_name_plural = "Задачи верификации"
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.id} - {self.get_kind_display()} - {self.status}"
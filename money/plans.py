@@ -0,0 +1,112 @@
+"""
+Реестр тарифных планов в памяти процесса.
+
+Планы меняются несколько раз в год, а читаются почти на каждой странице и в
+каждой проверке лимита. Реестр загружает таблицу один раз и отдаёт планы без
+запросов к БД. Изменение или удаление плана (signals.plan_changed) сразу
+сбрасывает реестр своего процесса, а после фиксации транзакции меняет
+версию планов в общем кэше: остальные воркеры сверяют её не чаще раза в
+PLAN_REGISTRY_CHECK_INTERVAL секунд и перечитывают таблицу.
+QuerySet.update() сигналов не вызывает - после него нужен invalidate_plans().
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import SubscriptionPlan
+
+PLAN_REGISTRY_CHECK_INTERVAL = getattr(settings, 'PLAN_REGISTRY_CHECK_INTERVAL', 5)
+
+VERSION_KEY = 'plans:version'
+
+
+def new_version():
+    return time.time_ns()
+
+
+def shared_version():
+    """Версия планов в общем кэше (если ключ вытеснен - начинается новая)"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, new_version(), None)
+        version = cache.get(VERSION_KEY, 0)
+    return version
+
+
+class PlanRegistry:
+    """Все тарифные планы процесса: id -> план"""
+    
+    def __init__(self, check_interval=PLAN_REGISTRY_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.plans = None
+        self.version = None
+        self.checked_at = 0
+        self._lock = threading.Lock()
+    
+    def load(self):
+        """Планы из памяти; таблица перечитывается, если версия в общем кэше сменилась"""
+        plans = self.plans
+        if plans is not None and time.monotonic() < self.checked_at + self.check_interval:
+            return plans
+        with self._lock:
+            # Версия читается до таблицы: изменение после чтения даст новую версию
+            version = shared_version()
+            if self.plans is None or version != self.version:
+                self.plans = {plan.pk: plan for plan in SubscriptionPlan.objects.all()}
+                self.version = version
+            self.checked_at = time.monotonic()
+            return self.plans
+    
+    def reset(self):
+        """Забыть загруженные планы процесса"""
+        with self._lock:
+            self.plans = None
+            self.checked_at = 0
+
+
+plan_registry = PlanRegistry()
+
+
+def get_plan(plan_id):
+    """План по id или None"""
+    return plan_registry.load().get(plan_id)
+
+
+def active_plans():
+    """Активные планы в порядке цены"""
+    return sorted(
+        (plan for plan in plan_registry.load().values() if plan.is_active),
+        key=lambda plan: plan.price_monthly,
+    )
+
+
+def get_active_plan(name):
+    """Активный план по названию или None"""
+    return next((plan for plan in active_plans() if plan.name == name), None)
+
+
+def plans_version():
+    """Версия загруженных планов (ключ кэша страниц с тарифами)"""
+    plan_registry.load()
+    return plan_registry.version
+
+
+def attach_plan(profile):
+    """Подставить план профиля из реестра вместо запроса к БД"""
+    if profile.plan_id is None or type(profile).plan.is_cached(profile):
+        return profile
+    plan = get_plan(profile.plan_id)
+    # План, созданный другим воркером и ещё не попавший в реестр, загрузится обычным запросом
+    if plan is not None:
+        profile.plan = plan
+    return profile
+
+
+def invalidate_plans():
+    """Сбросить реестр процесса сейчас, остальных воркеров - после фиксации транзакции"""
+    plan_registry.reset()
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, new_version(), None))
@@ -0,0 +1,105 @@
+"""
+Атомарный учёт лимитов проверок.
+
+Раньше каждая проверка делала can_verify() и increment_usage(), каждый из
+которых мог сохранять строку профиля целиком: при параллельных запросах
+счётчики терялись, а на запрос уходило несколько UPDATE. reserve_quota
+проверяет дневной и месячный лимиты и списывает проверки одним условным
+UPDATE: если лимита не хватает, строка не обновляется и ничего не списано.
+Дневной счётчик сбрасывается тем же запросом при смене даты.
+
+Лимит анонимных проверок хранится в кэше счётчиком на IP и день, поэтому
+главная страница и API не считают строки EmailVerification.
+"""
+
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, F, Q, Value, When
+
+from .models import UserProfile
+from .timing import timed
+
+
+def quota_outcome(result):
+    return 'ok' if result[0] else 'exceeded'
+
+
+def quota_error(profile, count):
+    """Сообщение о нехватке лимита"""
+    plan = profile.plan
+    if not plan:
+        return "Выберите тарифный план"
+    if count > 1:
+        return f'Недостаточно проверок по тарифу: в запросе {count}, доступно {profile.remaining_verifications()}'
+    daily_used = profile.daily_verifications if profile.last_verification_date == date.today() else 0
+    if daily_used >= plan.daily_limit:
+        return f"Достигнут дневной лимит ({plan.daily_limit} проверок)"
+    return f"Достигнут месячный лимит ({plan.monthly_limit} проверок)"
+
+
+@timed('quota', quota_outcome)
+def reserve_quota(profile, count=1):
+    """Проверить лимиты и списать count проверок одним UPDATE.
+    
+    Возвращает (успех, сообщение) как UserProfile.can_verify().
+    """
+    plan = profile.plan
+    if not plan or count > plan.daily_limit or count > plan.monthly_limit:
+        return False, quota_error(profile, count)
+    
+    today = date.today()
+    is_today = Q(last_verification_date=today)
+    updated = UserProfile.objects.filter(
+        (is_today & Q(daily_verifications__lte=plan.daily_limit - count)) | ~is_today,
+        pk=profile.pk,
+        monthly_verifications__lte=plan.monthly_limit - count,
+    ).update(
+        daily_verifications=Case(
+            When(is_today, then=F('daily_verifications') + count),
+            default=Value(count),
+        ),
+        monthly_verifications=F('monthly_verifications') + count,
+        total_verifications=F('total_verifications') + count,
+        last_verification_date=today,
+    )
+    if not updated:
+        # Сообщение строим по актуальным счётчикам, а не по устаревшему объекту
+        profile.refresh_from_db(fields=['daily_verifications', 'monthly_verifications', 'last_verification_date'])
+        return False, quota_error(profile, count)
+    return True, "OK"
+
+
+# Бесплатные проверки в день для анонимного пользователя (по IP)
+ANONYMOUS_DAILY_LIMIT = getattr(settings, 'ANONYMOUS_DAILY_LIMIT', 3)
+# Ключ живёт чуть дольше суток, чтобы пережить смену часового пояса
+ANONYMOUS_COUNTER_TTL = 2 * 24 * 60 * 60
+
+
+def anonymous_counter_key(ip, day=None):
+    """Ключ дневного счётчика анонимных проверок для IP"""
+    day = day or date.today()
+    return f'anon-quota:{day.isoformat()}:{ip}'
+
+
+def anonymous_usage(ip):
+    """Сколько анонимных проверок сделано с IP сегодня"""
+    return cache.get(anonymous_counter_key(ip), 0)
+
+
+@timed('quota', quota_outcome)
+def reserve_anonymous_quota(ip):
+    """Атомарно списать анонимную проверку с IP. Возвращает (успех, остаток)"""
+    key = anonymous_counter_key(ip)
+    cache.add(key, 0, ANONYMOUS_COUNTER_TTL)
+    try:
+        used = cache.incr(key)
+    except ValueError:
+        # Ключ вытеснен между add и incr - начинаем счёт заново
+        cache.set(key, 1, ANONYMOUS_COUNTER_TTL)
+        used = 1
+    if used > ANONYMOUS_DAILY_LIMIT:
+        cache.decr(key)
+        return False, 0
+    return True, ANONYMOUS_DAILY_LIMIT - used
@@ -0,0 +1,194 @@
+"""
+Пул DNS-резолверов для проверки MX-записей.
+
+Запросы идут к серверам DNS_RESOLVERS (по умолчанию - системным из
+/etc/resolv.conf) по очереди, с таймаутом DNS_TIMEOUT на попытку и общим
+пределом DNS_LIFETIME на запрос, так что медленный сервер задерживает
+проверку не дольше заданного. Запросы отправляются по UDP с EDNS
+(DNS_EDNS_PAYLOAD); обрезанный ответ dnspython сам повторяет по TCP, а если
+все серверы вернули ошибку (SERVFAIL, FORMERR на EDNS), запрос один раз
+повторяется по TCP без EDNS.
+
+lookup_mx возвращает MXLookup со статусом:
+- ok - почтовые хосты найдены. Если у домена нет MX, но есть A/AAAA, почта
+  по RFC 5321 (implicit MX) доставляется на сам домен;
+- no_mx - домена нет, у него нет ни MX, ни адресов, или объявлен null MX
+  (RFC 7505);
+- timeout, error - DNS не ответил: о домене ничего не известно, адрес не
+  считается недействительным.
+
+Асинхронный alookup_mx запрашивает A/AAAA одновременно с MX, чтобы запасной
+вариант не добавлял задержки (DNS_PARALLEL_FALLBACK); синхронный - после
+пустого ответа на MX, чтобы не занимать потоки на каждый домен.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import dns.asyncresolver
+import dns.exception
+import dns.resolver
+from django.conf import settings
+
+# Статусы MXLookup
+OK = 'ok'
+NO_MX = 'no_mx'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+
+# Исходы одного запроса (кроме TIMEOUT и ERROR)
+ANSWER = 'answer'
+NODATA = 'nodata'
+NXDOMAIN = 'nxdomain'
+
+ADDRESS_TYPES = ('A', 'AAAA')
+
+DNS_RESOLVERS = list(getattr(settings, 'DNS_RESOLVERS', []))
+DNS_PORT = getattr(settings, 'DNS_PORT', 53)
+DNS_TIMEOUT = getattr(settings, 'DNS_TIMEOUT', 2.0)
+DNS_LIFETIME = getattr(settings, 'DNS_LIFETIME', 4.0)
+DNS_EDNS_PAYLOAD = getattr(settings, 'DNS_EDNS_PAYLOAD', 1232)
+DNS_PARALLEL_FALLBACK = getattr(settings, 'DNS_PARALLEL_FALLBACK', True)
+
+# Потоки для параллельных запросов A/AAAA синхронной проверки
+_fallback_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'DNS_FALLBACK_THREADS', 8), thread_name_prefix='dns')
+
+
+class MXLookup(NamedTuple):
+    """Результат поиска почтовых хостов домена"""
+    status: str
+    hosts: tuple = ()
+    ttl: int = 0
+    
+    @property
+    def has_mx(self):
+        """True, False или None, если DNS не ответил"""
+        return {OK: True, NO_MX: False}.get(self.status)
+
+
+def sort_mx_records(answer):
+    """MX-хосты в порядке приоритета (меньший preference - первый)"""
+    return [str(mx.exchange) for mx in sorted(answer, key=lambda mx: mx.preference)]
+
+
+def build_lookup(domain, mx, addresses=()):
+    """MXLookup по исходам запросов MX и A/AAAA - парам (исход, ответ)"""
+    outcome, answer = mx
+    if outcome == ANSWER:
+        hosts = sort_mx_records(answer)
+        if hosts == ['.']:
+            return MXLookup(NO_MX, (), answer.rrset.ttl)  # Null MX: домен не принимает почту
+        return MXLookup(OK, tuple(hosts), answer.rrset.ttl)
+    if outcome == NXDOMAIN:
+        return MXLookup(NO_MX)
+    if outcome != NODATA:
+        return MXLookup(outcome)
+    
+    # MX нет - почта идёт на адрес самого домена (RFC 5321, 5.1)
+    found = [answer for outcome, answer in addresses if outcome == ANSWER]
+    if found:
+        return MXLookup(OK, (domain.rstrip('.') + '.',), min(answer.rrset.ttl for answer in found))
+    failed = [outcome for outcome, _ in addresses if outcome in (TIMEOUT, ERROR)]
+    return MXLookup(failed[0]) if failed else MXLookup(NO_MX)
+
+
+def query_failure(error):
+    """Исход запроса по исключению dnspython"""
+    if isinstance(error, dns.resolver.NXDOMAIN):
+        return NXDOMAIN
+    if isinstance(error, dns.resolver.NoAnswer):
+        return NODATA
+    if isinstance(error, dns.exception.Timeout):
+        return TIMEOUT
+    return ERROR
+
+
+class ResolverPool:
+    """Настроенные резолверы dnspython: синхронный и асинхронный, основной и запасной (TCP без EDNS)"""
+    
+    def __init__(self, nameservers=None, port=DNS_PORT, timeout=DNS_TIMEOUT, lifetime=DNS_LIFETIME,
+                 edns_payload=DNS_EDNS_PAYLOAD, parallel_fallback=DNS_PARALLEL_FALLBACK):
+        self.nameservers = list(nameservers or [])
+        self.port = port
+        self.timeout = timeout
+        self.lifetime = lifetime
+        self.edns_payload = edns_payload
+        self.parallel_fallback = parallel_fallback
+        self._resolvers = {}
+    
+    def get_resolver(self, resolver_class, tcp=False):
+        """Резолвер нужного класса, создаётся при первом обращении"""
+        resolver = self._resolvers.get((resolver_class, tcp))
+        if resolver is None:
+            # Без своего списка серверов берутся системные
+            resolver = resolver_class(configure=not self.nameservers)
+            if self.nameservers:
+                resolver.nameservers = self.nameservers
+                resolver.port = self.port
+            resolver.timeout = self.timeout
+            resolver.lifetime = self.lifetime
+            resolver.rotate = True
+            if tcp:
+                resolver.use_edns(-1)
+            else:
+                resolver.use_edns(0, 0, self.edns_payload)
+            self._resolvers[(resolver_class, tcp)] = resolver
+        return resolver
+    
+    def resolve(self, domain, rdtype, tcp=False):
+        return self.get_resolver(dns.resolver.Resolver, tcp).resolve(domain, rdtype, tcp=tcp, search=False)
+    
+    async def aresolve(self, domain, rdtype, tcp=False):
+        return await self.get_resolver(dns.asyncresolver.Resolver, tcp).resolve(domain, rdtype, tcp=tcp, search=False)
+    
+    def query(self, domain, rdtype):
+        """Исход запроса: (answer/nodata/nxdomain/timeout/error, ответ или None)"""
+        for tcp in (False, True):
+            try:
+                return ANSWER, self.resolve(domain, rdtype, tcp)
+            except dns.resolver.NoNameservers:
+                continue  # Все серверы ответили ошибкой - повтор по TCP без EDNS
+            except Exception as error:
+                return query_failure(error), None
+        return ERROR, None
+    
+    async def aquery(self, domain, rdtype):
+        """Асинхронный вариант query"""
+        for tcp in (False, True):
+            try:
+                return ANSWER, await self.aresolve(domain, rdtype, tcp)
+            except dns.resolver.NoNameservers:
+                continue
+            except Exception as error:
+                return query_failure(error), None
+        return ERROR, None
+    
+    def lookup_mx(self, domain):
+        """Почтовые хосты домена: MX, при их отсутствии - A/AAAA"""
+        mx = self.query(domain, 'MX')
+        addresses = ()
+        if mx[0] == NODATA:
+            addresses = list(_fallback_executor.map(lambda rdtype: self.query(domain, rdtype), ADDRESS_TYPES))
+        return build_lookup(domain, mx, addresses)
+    
+    async def alookup_mx(self, domain):
+        """Асинхронный вариант lookup_mx: A/AAAA запрашиваются одновременно с MX"""
+        if not self.parallel_fallback:
+            mx = await self.aquery(domain, 'MX')
+            addresses = ()
+            if mx[0] == NODATA:
+                addresses = await asyncio.gather(*(self.aquery(domain, rdtype) for rdtype in ADDRESS_TYPES))
+            return build_lookup(domain, mx, addresses)
+        
+        fallback = [asyncio.ensure_future(self.aquery(domain, rdtype)) for rdtype in ADDRESS_TYPES]
+        try:
+            mx = await self.aquery(domain, 'MX')
+            addresses = await asyncio.gather(*fallback) if mx[0] == NODATA else ()
+        finally:
+            for task in fallback:
+                task.cancel()  # MX найдены - адреса домена не нужны
+        return build_lookup(domain, mx, addresses)
+
+
+resolver_pool = ResolverPool(DNS_RESOLVERS)
@@ -0,0 +1,135 @@
+"""
+Кэш результатов верификации по нормализованному адресу
+(validation.parse_email).
+
+Формы регистрации повторяют запросы, CRM перепроверяют списки каждую ночь -
+повторная проверка того же адреса отдаётся из кэша без DNS и SMTP.
+Время жизни зависит от статуса (RESULT_CACHE_TTLS): однозначные ответы
+хранятся долго, "unknown" - недолго, чтобы быстрее перепроверить.
+Результаты неполных проверок (уровни syntax и dns) не кэшируются, но
+запрос такого уровня получает готовый результат полной проверки.
+"""
+
+from django.conf import settings
+
+from .caching import TwoLevelCache
+from .levels import SMTP
+from .validation import parse_email
+
+
+# Время жизни по статусу результата (секунды), 0 - не кэшировать
+DEFAULT_RESULT_CACHE_TTLS = {
+    'valid': 7 * 24 * 3600,
+    'invalid': 24 * 3600,
+    'risky': 24 * 3600,
+    'unknown': 15 * 60,
+    'catch_all': 24 * 3600,
+}
+
+RESULT_CACHE_TTLS = {**DEFAULT_RESULT_CACHE_TTLS, **getattr(settings, 'RESULT_CACHE_TTLS', {})}
+
+result_cache = TwoLevelCache('result', max_size=getattr(settings, 'RESULT_CACHE_SIZE', 50000))
+
+# Значения флага cache в ответе API
+CACHE_HIT = 'hit'
+CACHE_MISS = 'miss'
+CACHE_BYPASS = 'bypass'
+
+
+def normalize_email(email):
+    """Ключ кэша для адреса: варианты одного ящика (точки и +метки Gmail) дают один ключ"""
+    parsed = parse_email(email)
+    return parsed.normalized if parsed.valid else email.strip().lower()
+
+
+def is_cache_bypassed(request, data=None):
+    """Запрошена ли проверка в обход кэша (cache=bypass в запросе или JSON)"""
+    value = request.GET.get('cache') or (data or {}).get('cache') or ''
+    return str(value).lower() == CACHE_BYPASS
+
+
+def get_result_ttl(result):
+    """Время жизни результата в кэше по его статусу"""
+    if not result['is_valid_syntax']:
+        return 0  # Проверка синтаксиса и так мгновенная
+    if result.get('level', SMTP) != SMTP:
+        return 0  # Неполная проверка не должна подменять полную
+    return RESULT_CACHE_TTLS.get(result['status'], 0)
+
+
+def copy_cached(cached, email):
+    """Копия результата из кэша с исходным написанием адреса"""
+    if cached is None:
+        return None
+    return dict(cached, email=email, mx_records=list(cached['mx_records']))
+
+
+def get_cached_result(email):
+    """Результат из кэша или None"""
+    return copy_cached(result_cache.get(normalize_email(email)), email)
+
+
+async def aget_cached_result(email):
+    """Результат из кэша или None (асинхронно)"""
+    return copy_cached(await result_cache.aget(normalize_email(email)), email)
+
+
+def cache_result(result):
+    """Сохранить результат с TTL по его статусу"""
+    result_cache.set(normalize_email(result['email']), result, get_result_ttl(result))
+
+
+def get_cached_results(emails):
+    """Результаты из кэша для списка адресов: {email: результат}"""
+    keys = {normalize_email(email): email for email in emails}
+    found = result_cache.get_many(list(keys))
+    return {keys[key]: copy_cached(cached, keys[key]) for key, cached in found.items()}
+
+
+def cache_results(results):
+    """Сохранить список результатов"""
+    result_cache.set_many({
+        normalize_email(result['email']): (result, get_result_ttl(result))
+        for result in results
+    })
+
+
+async def acache_result(result):
+    """Сохранить результат с TTL по его статусу (асинхронно)"""
+    await result_cache.aset(normalize_email(result['email']), result, get_result_ttl(result))
+
+
+def verify_with_cache(email, verify, bypass=False):
+    """Проверка через кэш: возвращает (результат, hit/miss/bypass)"""
+    if not bypass:
+        cached = get_cached_result(email)
+        if cached is not None:
+            return cached, CACHE_HIT
+    
+    result = verify(email)
+    cache_result(result)
+    return result, CACHE_BYPASS if bypass else CACHE_MISS
+
+
+async def averify_with_cache(email, verify, bypass=False):
+    """Асинхронный вариант verify_with_cache для корутины verify"""
+    if not bypass:
+        cached = await aget_cached_result(email)
+        if cached is not None:
+            return cached, CACHE_HIT
+    
+    result = await verify(email)
+    await acache_result(result)
+    return result, CACHE_BYPASS if bypass else CACHE_MISS
+
+
+def verify_many_with_cache(emails, verify_many, bypass=False):
+    """Массовая проверка через кэш: verify_many получает только промахи.
+    
+    Возвращает (результаты в порядке emails, число попаданий в кэш).
+    """
+    cached = {} if bypass else get_cached_results(emails)
+    misses = [email for email in emails if email not in cached]
+    fresh = dict(zip(misses, verify_many(misses))) if misses else {}
+    cache_results(fresh.values())
+    return [cached.get(email) or fresh[email] for email in emails], len(cached)
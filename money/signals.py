@@ -0,0 +1,30 @@
+"""
+Сброс кэшей при изменении моделей.
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .api_auth import invalidate_api_keys, invalidate_user_api_keys
+from .models import APIKey, SubscriptionPlan, UserProfile
+from .plans import invalidate_plans
+
+
+@receiver([post_save, post_delete], sender=APIKey)
+def api_key_changed(sender, instance, **kwargs):
+    """Ключ изменён или удалён - сбрасываем его запись в кэше"""
+    invalidate_api_keys([instance.key])
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def profile_changed(sender, instance, **kwargs):
+    """Сменился тариф пользователя - сбрасываем кэш его ключей"""
+    invalidate_user_api_keys([instance.user_id])
+
+
+@receiver([post_save, pre_delete], sender=SubscriptionPlan)
+def plan_changed(sender, instance, **kwargs):
+    """Изменены условия тарифа - сбрасываем реестр планов и кэш ключей всех его пользователей"""
+    invalidate_plans()
+    user_ids = UserProfile.objects.filter(plan=instance).values_list('user_id', flat=True)
+    invalidate_user_api_keys(user_ids)
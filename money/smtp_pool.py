@@ -0,0 +1,387 @@
+"""
+Пул SMTP-сессий по MX-хостам.
+
+Вместо отдельного соединения с HELO/MAIL FROM/QUIT на каждый адрес одна
+сессия используется для многих команд RCPT TO. Конверт (MAIL FROM)
+открывается один раз и сбрасывается RSET после MAX_ENVELOPE_RECIPIENTS
+получателей или при ошибке последовательности команд. Сессия закрывается
+после SMTP_POOL_MAX_RECIPIENTS проверок или SMTP_POOL_MAX_IDLE секунд простоя.
+На хост открывается не больше SMTP_POOL_MAX_SESSIONS_PER_HOST сессий,
+остальные проверки хоста ждут освободившуюся. Слот MXThrottle своего хоста
+проверка занимает только на время обмена RCPT TO, уже получив сессию: пока
+она ждёт сессию, слоты хоста остаются другим воркерам.
+
+Пул живёт в event loop (get_smtp_pool), поэтому сессии переиспользуют
+асинхронные проверки; синхронный /api/verify/ (views.check_smtp_deliverable)
+открывает соединение на каждый адрес. Массовая проверка из синхронного кода
+работает со своим пулом (scoped_smtp_pool) и закрывает только его.
+"""
+
+import asyncio
+import time
+import weakref
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .domain_intel import areport_smtp_failure, areport_smtp_reply
+from .throttle import ThrottleTimeout, mx_throttle
+from .timing import mx_provider, reply_outcome, stage, verdict_outcome
+from .views import interpret_rcpt_code
+
+
+SMTP_PORT = 25
+SMTP_TIMEOUT = 10
+
+# Получателей в одном конверте до RSET (RFC 5321 гарантирует минимум 100)
+MAX_ENVELOPE_RECIPIENTS = 50
+
+
+class AsyncSMTPClient:
+    """Минимальный асинхронный SMTP-клиент для проверки RCPT"""
+    
+    def __init__(self, host, port=None, timeout=None):
+        self.host = host
+        self.port = port or SMTP_PORT
+        self.timeout = timeout or SMTP_TIMEOUT
+        self.reader = None
+        self.writer = None
+    
+    async def connect(self):
+        """Подключение и чтение приветствия сервера"""
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        return await self.read_reply()
+    
+    async def read_reply(self):
+        """Чтение (возможно многострочного) ответа сервера"""
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            if not line:
+                raise ConnectionError('Сервер закрыл соединение')
+            line = line.decode('utf-8', 'replace').rstrip('\r\n')
+            lines.append(line[4:])
+            if len(line) < 4 or line[3] != '-':
+                break
+        try:
+            code = int(line[:3])
+        except ValueError:
+            raise ConnectionError(f'Некорректный ответ сервера: {line!r}')
+        return code, '\n'.join(lines)
+    
+    async def command(self, line):
+        """Отправка команды и чтение ответа"""
+        self.writer.write(f'{line}\r\n'.encode('utf-8'))
+        await self.writer.drain()
+        return await self.read_reply()
+    
+    async def helo(self, name='verify.local'):
+        return await self.command(f'HELO {name}')
+    
+    async def mail(self, sender='verify@verify.local'):
+        return await self.command(f'MAIL FROM:<{sender}>')
+    
+    async def rcpt(self, email):
+        return await self.command(f'RCPT TO:<{email}>')
+    
+    async def quit(self):
+        """Вежливое завершение сессии, ошибки игнорируются"""
+        try:
+            await self.command('QUIT')
+        except (OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.close()
+    
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.reader = None
+
+
+class SMTPReplyError(ConnectionError):
+    """Сервер ответил отказом на этапе установки сессии"""
+    
+    def __init__(self, code, message):
+        super().__init__(f'SMTP {code}: {message}')
+        self.code = code
+
+
+class SMTPSession:
+    """SMTP-сессия с открытым конвертом для серии RCPT"""
+    
+    def __init__(self, host):
+        self.host = host
+        self.provider = mx_provider(host)
+        self.client = AsyncSMTPClient(host)
+        self.recipients = 0
+        self.envelope_recipients = 0
+        self.in_envelope = False
+        self.last_used = time.monotonic()
+    
+    async def open(self):
+        with stage('smtp_connect', self.provider) as span:
+            code, message = await self.client.connect()
+            span.outcome = reply_outcome(code)
+        if code != 220:
+            raise SMTPReplyError(code, message)
+        with stage('helo', self.provider) as span:
+            code, message = await self.client.helo()
+            span.outcome = reply_outcome(code)
+        if code != 250:
+            raise SMTPReplyError(code, message)
+    
+    async def reset(self):
+        """Сброс конверта командой RSET"""
+        await self.client.command('RSET')
+        self.in_envelope = False
+        self.envelope_recipients = 0
+    
+    async def rcpt(self, email):
+        """RCPT TO в текущем конверте, при необходимости открывает новый"""
+        if self.envelope_recipients >= MAX_ENVELOPE_RECIPIENTS:
+            await self.reset()
+        if not self.in_envelope:
+            code, message = await self.client.mail()
+            if code != 250:
+                raise SMTPReplyError(code, message)
+            self.in_envelope = True
+        
+        with stage('rcpt', self.provider) as span:
+            code, message = await self.client.rcpt(email)
+            span.outcome = verdict_outcome(interpret_rcpt_code(code))
+        self.recipients += 1
+        self.envelope_recipients += 1
+        self.last_used = time.monotonic()
+        return code
+    
+    def close(self):
+        self.client.close()
+
+
+class SMTPSessionPool:
+    """SMTP-сессии, сгруппированные по MX-хосту.
+    
+    На хост открывается не больше max_sessions сессий. Проверка, которой не
+    досталось свободной сессии, ждёт в очереди хоста, и освободившаяся сессия
+    передаётся ей напрямую - так параллельные проверки массовой верификации
+    используют одни и те же соединения. Простаивающие дольше max_idle сессии
+    закрывает фоновая задача.
+    """
+    
+    def __init__(self, max_idle=None, max_recipients=None, max_sessions=None):
+        self.max_idle = max_idle or getattr(settings, 'SMTP_POOL_MAX_IDLE', 30)
+        self.max_recipients = max_recipients or getattr(settings, 'SMTP_POOL_MAX_RECIPIENTS', 100)
+        self.max_sessions = max_sessions or getattr(settings, 'SMTP_POOL_MAX_SESSIONS_PER_HOST', 2)
+        self.idle = defaultdict(deque)
+        self.open_sessions = defaultdict(int)  # Открытые сессии хоста: простаивающие и занятые
+        self.waiters = defaultdict(deque)  # Проверки, ждущие сессию хоста
+        self.closing = set()  # Задачи QUIT закрываемых сессий
+        self.reaper = None
+    
+    def take_idle(self, host):
+        """Свободная живая сессия для хоста или None"""
+        sessions = self.idle.get(host, ())
+        now = time.monotonic()
+        while sessions:
+            session = sessions.pop()
+            if now - session.last_used < self.max_idle:
+                return session
+            session.close()
+            self.forget(host)
+        return None
+    
+    async def acquire(self, host):
+        """Сессия для хоста или None - можно открыть новую (место в лимите хоста уже занято)"""
+        session = self.take_idle(host)
+        if session is not None:
+            return session
+        if self.open_sessions[host] < self.max_sessions:
+            self.open_sessions[host] += 1
+            return None
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters[host].append(waiter)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.cancelled():
+                if waiter in self.waiters.get(host, ()):
+                    self.waiters[host].remove(waiter)
+            elif waiter.result() is None:
+                self.forget(host)  # Переданное место под новую сессию достаётся следующему
+            else:
+                self.release(waiter.result())
+            raise
+    
+    def hand_over(self, host, session):
+        """Передать сессию (None - место под новую) первой ждущей проверке. False - никто не ждёт"""
+        waiters = self.waiters.get(host, ())
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(session)
+                return True
+        self.waiters.pop(host, None)
+        return False
+    
+    def forget(self, host):
+        """Сессия хоста закрыта - её место получает ждущая проверка или освобождается"""
+        if not self.hand_over(host, None):
+            self.open_sessions[host] -= 1
+            if self.open_sessions[host] <= 0:
+                del self.open_sessions[host]
+    
+    def release(self, session):
+        """Передать сессию ждущей проверке, вернуть в пул или закрыть, если исчерпан лимит получателей"""
+        if session.recipients >= self.max_recipients:
+            self.retire(session)
+        elif not self.hand_over(session.host, session):
+            self.idle[session.host].append(session)
+            if self.reaper is None or self.reaper.done():
+                self.reaper = asyncio.ensure_future(self.reap_idle())
+    
+    def retire(self, session):
+        """Завершить сессию командой QUIT в фоне, место хоста освобождается сразу"""
+        self.forget(session.host)
+        task = asyncio.ensure_future(session.client.quit())
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+    
+    async def reap_idle(self):
+        """Закрывать сессии, простаивающие дольше max_idle, пока в пуле есть простаивающие"""
+        while any(self.idle.values()):
+            await asyncio.sleep(self.max_idle)
+            now = time.monotonic()
+            for host, sessions in list(self.idle.items()):
+                for session in [session for session in sessions if now - session.last_used >= self.max_idle]:
+                    sessions.remove(session)
+                    self.retire(session)
+                if not sessions:
+                    del self.idle[host]
+    
+    async def probe(self, email, mx_host):
+        """Проверка адреса с учётом лимитов хоста: True / False / None.
+        
+        Ответы сервера и сбои учитываются в вердикте домена (см. views.check_smtp_deliverable).
+        ThrottleTimeout - не дождались слота хоста, проверка не выполнялась.
+        """
+        domain = email.rpartition('@')[2]
+        try:
+            code = await self.probe_code(email, mx_host)
+        except SMTPReplyError as e:
+            # Отказ на приветствии, HELO или MAIL FROM ничего не говорит о получателе
+            await sync_to_async(mx_throttle.report, thread_sensitive=False)(mx_host, e.code)
+            await areport_smtp_reply(domain, e.code)
+            return None
+        
+        if code is None:
+            await areport_smtp_failure(domain)
+            return None
+        await sync_to_async(mx_throttle.report, thread_sensitive=False)(mx_host, code)
+        await areport_smtp_reply(domain, code, rcpt=True)
+        return interpret_rcpt_code(code)
+    
+    async def probe_code(self, email, mx_host):
+        """Код ответа на RCPT TO через сессию пула, None - сервер недоступен.
+        
+        Отказ сервера до RCPT TO (приветствие, HELO, MAIL FROM) поднимает SMTPReplyError,
+        не дождались слота MXThrottle - ThrottleTimeout (сессия возвращается в пул).
+        """
+        session = await self.acquire(mx_host)
+        reused = session is not None
+        
+        for attempt in range(2):
+            if session is None:
+                session = SMTPSession(mx_host)
+                try:
+                    await session.open()
+                except (SMTPReplyError, asyncio.CancelledError):
+                    session.close()
+                    self.forget(mx_host)
+                    raise
+                except (OSError, asyncio.TimeoutError):
+                    session.close()
+                    self.forget(mx_host)
+                    return None
+            
+            try:
+                async with mx_throttle.aslot(mx_host):
+                    code = await session.rcpt(email)
+                    if code == 503:
+                        # Сервер потерял конверт - начинаем новый
+                        await session.reset()
+                        code = await session.rcpt(email)
+            except ThrottleTimeout:
+                self.release(session)  # Команды не отправлялись - сессия исправна
+                raise
+            except (SMTPReplyError, asyncio.CancelledError):
+                # Отказ или отмена посреди команды - сессия в неизвестном состоянии
+                session.close()
+                self.forget(mx_host)
+                raise
+            except (OSError, asyncio.TimeoutError):
+                session.close()
+                if reused and attempt == 0:
+                    # Сервер мог закрыть простаивающую сессию - пробуем новую на её месте
+                    session = None
+                    reused = False
+                    continue
+                self.forget(mx_host)
+                return None
+            
+            if code == 421:
+                # Сервер закрывает соединение
+                session.close()
+                self.forget(mx_host)
+            else:
+                self.release(session)
+            return code
+        
+        return None
+    
+    async def close(self):
+        """Завершение простаивающих сессий и ожидание отправленных QUIT"""
+        if self.reaper is not None:
+            self.reaper.cancel()
+            self.reaper = None
+        sessions = [session for host_sessions in self.idle.values() for session in host_sessions]
+        self.idle.clear()
+        for session in sessions:
+            self.retire(session)
+        await asyncio.gather(*self.closing, return_exceptions=True)
+
+
+_pools = weakref.WeakKeyDictionary()
+_scoped_pool = ContextVar('smtp_session_pool', default=None)
+
+
+def get_smtp_pool():
+    """Пул SMTP-сессий текущего event loop (или scoped_smtp_pool, если он открыт)"""
+    pool = _scoped_pool.get()
+    if pool is not None:
+        return pool
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = SMTPSessionPool()
+        _pools[loop] = pool
+    return pool
+
+
+@asynccontextmanager
+async def scoped_smtp_pool():
+    """Отдельный пул для блока: закрывается на выходе, не трогая пул event loop"""
+    pool = SMTPSessionPool()
+    token = _scoped_pool.set(pool)
+    try:
+        yield pool
+    finally:
+        _scoped_pool.reset(token)
+        await pool.close()
@@ -0,0 +1,84 @@
+"""
+Компактное хранение истории проверок.
+
+MX-записи хранятся в MXHostSet одной строкой на уникальный набор хостов,
+а проверка ссылается на него - у популярных провайдеров набор один на
+миллионы проверок. Идентификаторы наборов запоминаются в процессе, так что
+новая проверка обычно не делает лишнего запроса.
+
+Записи старше VERIFICATION_RETENTION_DAYS сворачиваются в дневные итоги
+VerificationDailyStats и удаляются (команда rollup_verifications), поэтому
+таблица EmailVerification остаётся небольшой.
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .caching import TTLCache
+from .models import EmailVerification, MXHostSet, VerificationDailyStats
+
+VERIFICATION_RETENTION_DAYS = getattr(settings, 'VERIFICATION_RETENTION_DAYS', 180)
+
+# digest набора MX-хостов -> id строки MXHostSet
+mx_set_ids = TTLCache(max_size=getattr(settings, 'MX_SET_CACHE_SIZE', 50000))
+MX_SET_CACHE_TTL = 24 * 60 * 60
+
+
+def intern_mx_hosts(mx_records):
+    """id набора MX-хостов (создаётся при первом появлении) или None для пустого списка"""
+    if not mx_records:
+        return None
+    hosts = ', '.join(mx_records)
+    digest = MXHostSet.make_digest(hosts)
+    mx_set_id = mx_set_ids.get(digest)
+    if mx_set_id is None:
+        mx_set_id = MXHostSet.objects.get_or_create(digest=digest, defaults={'hosts': hosts})[0].pk
+        # Запоминаем только закоммиченную строку: после отката id был бы недействителен
+        transaction.on_commit(lambda: mx_set_ids.set(digest, mx_set_id, MX_SET_CACHE_TTL))
+    return mx_set_id
+
+
+def day_bounds(day):
+    """Начало и конец дня в текущем часовом поясе"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def merge_daily_stats(day, rows):
+    """Прибавить итоги дня (по пользователям) к VerificationDailyStats"""
+    for row in rows:
+        stats, _ = VerificationDailyStats.objects.select_for_update().get_or_create(user_id=row.pop('user'), date=day)
+        VerificationDailyStats.objects.filter(pk=stats.pk).update(
+            **{field: F(field) + value for field, value in row.items()}
+        )
+
+
+def rollup_verifications(cutoff):
+    """Свернуть проверки старше cutoff в дневные итоги и удалить их.
+    
+    Каждый день обрабатывается в своей транзакции. Возвращает число
+    удалённых записей.
+    """
+    removed = 0
+    old = EmailVerification.objects.filter(created_at__lt=cutoff).order_by()
+    while True:
+        oldest = old.order_by('created_at').values_list('created_at', flat=True).first()
+        if oldest is None:
+            return removed
+        
+        day = timezone.localtime(oldest).date()
+        start, end = day_bounds(day)
+        day_rows = old.filter(created_at__gte=start, created_at__lt=min(end, cutoff))
+        with transaction.atomic():
+            merge_daily_stats(day, day_rows.values('user').annotate(
+                total=Count('id'),
+                valid_syntax=Count('id', filter=Q(is_valid_syntax=True)),
+                with_mx=Count('id', filter=Q(has_mx_record=True)),
+                deliverable=Count('id', filter=Q(is_deliverable=True)),
+                disposable=Count('id', filter=Q(is_disposable=True)),
+            ))
+            removed += day_rows.delete()[0]
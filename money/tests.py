@@ -14,6 +14,29 @@ from .views import (
 )
 
 
+def clear_caches():
+    """Очистка общего кэша и локальных кэшей процесса между тестами"""
+    from django.core.cache import cache
+    from .views import mx_cache
+    from .result_cache import result_cache
+    from .storage import mx_set_ids
+    from .domain_intel import domain_verdicts
+    from .plans import plan_registry
+    from .views import pricing_pages
+    cache.clear()
+    mx_cache.local.clear()
+    result_cache.local.clear()
+    mx_set_ids.clear()
+    domain_verdicts.local.clear()
+    plan_registry.reset()
+    pricing_pages.clear()
+
+
+def accept_only(*emails):
+    """side_effect SMTP-проверки: принимаются только указанные адреса, остальные отклоняются"""
+    return lambda email, mx_host, deadline=None: email in emails
+
+
 class EmailSyntaxValidationTests(TestCase):
     """Тесты валидации синтаксиса email"""
     
@@ -73,6 +96,9 @@ class DisposableEmailTests(TestCase):
 class EmailVerificationLogicTests(TestCase):
     """Тесты логики верификации email"""
     
+    def setUp(self):
+        clear_caches()
+    
     def test_invalid_syntax_returns_invalid_status(self):
         """Невалидный синтаксис возвращает статус invalid"""
         result = verify_email('invalid-email')
@@ -93,7 +119,7 @@ class EmailVerificationLogicTests(TestCase):
     def test_valid_email_returns_valid_status(self, mock_smtp, mock_mx):
         """Валидный email возвращает статус valid"""
         mock_mx.return_value = (True, ['mx.example.com'])
-        mock_smtp.return_value = True
+        mock_smtp.side_effect = accept_only('user@example.com')
         
         result = verify_email('user@example.com')
         self.assertEqual(result['status'], 'valid')
@@ -450,3 +476,2291 @@ class PaymentTests(TestCase):
         profile = self.user.profile
         profile.refresh_from_db()
         self.assertEqual(profile.plan, self.plan)
+
+
+class AsyncVerifierTests(TestCase):
+    """Тесты асинхронного движка верификации"""
+    
+    def setUp(self):
+        clear_caches()
+    
+    def run_async(self, coro):
+        import asyncio
+        return asyncio.run(coro)
+    
+    async def start_fake_smtp(self, rcpt_code, connections=None):
+        """Локальный SMTP-сервер, отвечающий заданным кодом на RCPT"""
+        import asyncio
+        
+        async def handle(reader, writer):
+            if connections is not None:
+                connections.append(writer)
+            writer.write(b'220-fake.local ESMTP\r\n220 ready\r\n')
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode().upper()
+                if command.startswith('RCPT'):
+                    writer.write(f'{rcpt_code} rcpt\r\n'.encode())
+                elif command.startswith('QUIT'):
+                    writer.write(b'221 bye\r\n')
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b'250 ok\r\n')
+                await writer.drain()
+            writer.close()
+        
+        return await asyncio.start_server(handle, '127.0.0.1', 0)
+    
+    def test_smtp_probe_accepts_and_rejects(self):
+        """SMTP-проверка различает принятый и несуществующий ящик"""
+        from . import async_verifier
+        
+        async def probe(code):
+            server = await self.start_fake_smtp(code)
+            port = server.sockets[0].getsockname()[1]
+            with patch('money.smtp_pool.SMTP_PORT', port):
+                result = await async_verifier.check_smtp_deliverable_async('user@example.com', '127.0.0.1')
+                await async_verifier.get_smtp_pool().close()
+            server.close()
+            await server.wait_closed()
+            return result
+        
+        self.assertTrue(self.run_async(probe(250)))
+        self.assertFalse(self.run_async(probe(550)))
+        self.assertIsNone(self.run_async(probe(451)))
+    
+    def test_smtp_session_reused_for_same_host(self):
+        """Несколько адресов одного MX проверяются через одно соединение"""
+        from .smtp_pool import SMTPSessionPool
+        
+        async def probe_many():
+            connections = []
+            server = await self.start_fake_smtp(250, connections)
+            port = server.sockets[0].getsockname()[1]
+            pool = SMTPSessionPool(max_recipients=2)
+            with patch('money.smtp_pool.SMTP_PORT', port):
+                results = [await pool.probe(f'user{i}@example.com', '127.0.0.1') for i in range(3)]
+                await pool.close()
+            server.close()
+            await server.wait_closed()
+            return results, len(connections)
+        
+        results, connections = self.run_async(probe_many())
+        self.assertEqual(results, [True, True, True])
+        self.assertEqual(connections, 2)  # Новая сессия после 2 получателей
+    
+    def test_concurrent_probes_share_sessions(self):
+        """Параллельные проверки одного хоста передают друг другу сессии, а не открывают новые"""
+        import asyncio
+        from .smtp_pool import SMTPSessionPool
+        
+        async def probe_many():
+            connections = []
+            server = await self.start_fake_smtp(250, connections)
+            port = server.sockets[0].getsockname()[1]
+            pool = SMTPSessionPool(max_sessions=2)
+            with patch('money.smtp_pool.SMTP_PORT', port), patch('money.throttle.mx_throttle.max_rate', 100):
+                results = await asyncio.gather(*(pool.probe(f'user{i}@example.com', '127.0.0.1') for i in range(8)))
+                await pool.close()
+            server.close()
+            await server.wait_closed()
+            return results, len(connections), pool
+        
+        results, connections, pool = self.run_async(probe_many())
+        self.assertEqual(results, [True] * 8)
+        self.assertEqual(connections, 2)
+        self.assertFalse(pool.open_sessions)
+        self.assertFalse(pool.closing)
+    
+    def test_waiting_for_session_holds_no_throttle_slot(self):
+        """Проверка занимает слот MXThrottle только с сессией на руках"""
+        import asyncio
+        from contextlib import asynccontextmanager
+        from .smtp_pool import SMTPSessionPool
+        held = []
+        
+        @asynccontextmanager
+        async def tracking_slot(host, max_wait=None):
+            held.append(host)
+            self.assertLessEqual(len(held), 1)
+            try:
+                yield
+            finally:
+                held.remove(host)
+        
+        async def probe_many():
+            server = await self.start_fake_smtp(250)
+            port = server.sockets[0].getsockname()[1]
+            pool = SMTPSessionPool(max_sessions=1)
+            with patch('money.smtp_pool.SMTP_PORT', port), patch('money.throttle.mx_throttle.aslot', tracking_slot):
+                results = await asyncio.gather(*(pool.probe(f'user{i}@example.com', '127.0.0.1') for i in range(4)))
+                await pool.close()
+            server.close()
+            await server.wait_closed()
+            return results
+        
+        self.assertEqual(self.run_async(probe_many()), [True] * 4)
+    
+    def test_bulk_run_keeps_loop_pool(self):
+        """Массовая проверка закрывает только свой пул, пул event loop остаётся открытым"""
+        from .async_verifier import run_bulk_verification
+        from .smtp_pool import get_smtp_pool
+        
+        async def bulk_beside_loop_pool():
+            pool = get_smtp_pool()
+            with patch.object(pool, 'close') as mock_close, \
+                    patch('money.async_verifier.check_mx_records_async', return_value=(True, ['mx.example.com'])), \
+                    patch('money.smtp_pool.SMTPSessionPool.probe', return_value=True) as mock_probe:
+                await run_bulk_verification(['user@example.com'])
+            self.assertTrue(mock_probe.called)
+            return mock_close.called
+        
+        self.assertFalse(self.run_async(bulk_beside_loop_pool()))
+    
+    def test_idle_sessions_reaped(self):
+        """Простаивающие сессии закрываются, даже если хост больше не проверяется"""
+        import asyncio
+        from .smtp_pool import SMTPSessionPool
+        
+        async def probe_and_wait():
+            connections = []
+            server = await self.start_fake_smtp(250, connections)
+            port = server.sockets[0].getsockname()[1]
+            pool = SMTPSessionPool(max_idle=0.05)
+            with patch('money.smtp_pool.SMTP_PORT', port):
+                await pool.probe('user@example.com', '127.0.0.1')
+                self.assertEqual(len(pool.idle['127.0.0.1']), 1)
+                await asyncio.sleep(0.2)
+                idle, open_sessions = dict(pool.idle), dict(pool.open_sessions)
+                await pool.close()
+            server.close()
+            await server.wait_closed()
+            return idle, open_sessions, connections[0].is_closing()
+        
+        idle, open_sessions, closed = self.run_async(probe_and_wait())
+        self.assertEqual((idle, open_sessions), ({}, {}))
+        self.assertTrue(closed)
+    
+    def test_sender_rejection_is_not_recipient_verdict(self):
+        """Отказ на MAIL FROM не означает, что ящика нет (синхронная и асинхронная проверка)"""
+        from .async_verifier import check_smtp_deliverable_async, get_smtp_pool
+        from .benchmarks.fakes import FakeSMTPServer
+        from .views import check_smtp_deliverable
+        
+        async def probe():
+            try:
+                return await check_smtp_deliverable_async('user@example.com', '127.0.0.1')
+            finally:
+                await get_smtp_pool().close()
+        
+        with FakeSMTPServer(mail_code=553) as server, server.installed():
+            with patch('money.throttle.mx_throttle.report') as mock_report:
+                self.assertIsNone(self.run_async(probe()))
+                self.assertIsNone(check_smtp_deliverable('user@example.com', '127.0.0.1'))
+        self.assertEqual(server.rcpt_commands, 0)
+        self.assertEqual([call.args[1] for call in mock_report.call_args_list], [553, 553])
+    
+    def test_unreachable_host_returns_unknown(self):
+        """Недоступный сервер даёт неизвестный результат"""
+        from .async_verifier import check_smtp_deliverable_async
+        
+        with patch('money.smtp_pool.SMTP_PORT', 1), patch('money.smtp_pool.SMTP_TIMEOUT', 1):
+            result = self.run_async(check_smtp_deliverable_async('user@example.com', '127.0.0.1'))
+        self.assertIsNone(result)
+    
+    @patch('money.async_verifier.check_mx_records_async')
+    @patch('money.async_verifier.check_smtp_deliverable_async')
+    def test_verify_email_async_matches_sync_result(self, mock_smtp, mock_mx):
+        """Асинхронная верификация даёт тот же результат, что и синхронная"""
+        from .async_verifier import verify_email_async
+        mock_mx.return_value = (True, ['mx.example.com.'])
+        mock_smtp.side_effect = accept_only('user@example.com')
+        
+        result = self.run_async(verify_email_async('user@example.com'))
+        self.assertEqual(result['status'], 'valid')
+        self.assertEqual(result['score'], 100)
+        self.assertEqual(mock_smtp.await_args_list[0].args, ('user@example.com', 'mx.example.com'))
+    
+    @patch('money.async_verifier.verify_email_async')
+    def test_async_api_endpoint(self, mock_verify):
+        """Асинхронный API сохраняет проверку и возвращает результат"""
+        result = verify_email('bad-email')
+        mock_verify.return_value = result
+        
+        response = self.client.post(
+            reverse('money:verify_api_async'),
+            data=json.dumps({'email': 'bad-email'}),
+            content_type='application/json',
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['status'], 'invalid')
+        self.assertEqual(EmailVerification.objects.filter(email='bad-email').count(), 1)
+
+
+class MXCacheTests(TestCase):
+    """Тесты кэша MX-записей"""
+    
+    def setUp(self):
+        clear_caches()
+    
+    def make_answer(self, hosts, ttl=3600):
+        answer = MagicMock()
+        answer.__iter__.return_value = [MagicMock(exchange=host) for host in hosts]
+        answer.rrset.ttl = ttl
+        return answer
+    
+    @patch('money.resolver.resolver_pool.resolve')
+    def test_repeated_domain_uses_cache(self, mock_resolve):
+        """Повторный запрос домена не обращается к DNS"""
+        mock_resolve.return_value = self.make_answer(['mx.example.com.'])
+        
+        self.assertEqual(check_mx_records('example.com'), (True, ['mx.example.com.']))
+        self.assertEqual(check_mx_records('EXAMPLE.com'), (True, ['mx.example.com.']))
+        mock_resolve.assert_called_once()
+    
+    @patch('money.resolver.resolver_pool.resolve')
+    def test_shared_layer_used_after_local_eviction(self, mock_resolve):
+        """Запись берётся из общего кэша, если её нет в памяти процесса"""
+        from .views import mx_cache
+        mock_resolve.return_value = self.make_answer(['mx.example.com.'])
+        
+        check_mx_records('example.com')
+        mx_cache.local.clear()
+        self.assertEqual(check_mx_records('example.com'), (True, ['mx.example.com.']))
+        mock_resolve.assert_called_once()
+    
+    @patch('money.resolver.resolver_pool.resolve')
+    def test_nxdomain_cached_but_timeout_not(self, mock_resolve):
+        """NXDOMAIN кэшируется, а таймаут DNS - нет"""
+        import dns.resolver
+        import dns.exception
+        mock_resolve.side_effect = dns.resolver.NXDOMAIN()
+        self.assertEqual(check_mx_records('missing.example'), (False, []))
+        self.assertEqual(check_mx_records('missing.example'), (False, []))
+        self.assertEqual(mock_resolve.call_count, 1)
+        
+        mock_resolve.side_effect = dns.exception.Timeout()
+        check_mx_records('slow.example')
+        check_mx_records('slow.example')
+        self.assertEqual(mock_resolve.call_count, 3)
+    
+    def test_ttl_cache_evicts_least_recently_used(self):
+        """Локальный кэш ограничен по размеру и вытесняет старые записи"""
+        from .caching import TTLCache
+        local = TTLCache(max_size=2)
+        local.set('a', 1, 60)
+        local.set('b', 2, 60)
+        local.get('a')
+        local.set('c', 3, 60)
+        
+        self.assertEqual(local.get('a'), 1)
+        self.assertIsNone(local.get('b'))
+        self.assertEqual(len(local), 2)
+
+
+class BulkVerificationTests(TestCase):
+    """Тесты массовой проверки"""
+    
+    def setUp(self):
+        clear_caches()
+        self.client = Client()
+        self.user = User.objects.create_user('bulkuser', 'bulk@test.com', 'password')
+        self.plan = SubscriptionPlan.objects.create(
+            name='pro',
+            display_name='Pro',
+            daily_limit=100,
+            monthly_limit=1000,
+            api_access=True,
+            bulk_verification=True,
+        )
+        self.profile = UserProfile.objects.create(user=self.user, plan=self.plan)
+        self.api_key = APIKey.objects.create(user=self.user, name='Bulk Key')
+    
+    def post_bulk(self, emails):
+        return self.client.post(
+            reverse('money:verify_bulk_api'),
+            data=json.dumps({'emails': emails}),
+            content_type='application/json',
+            HTTP_X_API_KEY=self.api_key.key,
+        )
+    
+    @patch('money.async_verifier.check_smtp_deliverable_async')
+    @patch('money.async_verifier.check_mx_records_async')
+    def test_bulk_resolves_dns_once_per_domain(self, mock_mx, mock_smtp):
+        """DNS запрашивается один раз на домен, лимит списывается за все адреса"""
+        mock_mx.return_value = (True, ['mx.example.com.'])
+        mock_smtp.side_effect = accept_only('a@example.com', 'b@example.com')
+        
+        response = self.post_bulk(['a@example.com', 'b@example.com', 'A@example.com', 'bad'])
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['summary']['valid'], 2)
+        self.assertEqual(data['summary']['invalid'], 1)
+        mock_mx.assert_awaited_once_with('example.com')
+        self.assertEqual(EmailVerification.objects.filter(user=self.user).count(), 3)
+        
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_verifications, 3)
+        self.api_key.refresh_from_db()
+        self.assertEqual(self.api_key.requests_count, 1)
+    
+    @patch('money.async_verifier.run_bulk_verification')
+    def test_bulk_accepts_csv_upload(self, mock_bulk):
+        """Адреса принимаются файлом CSV"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        mock_bulk.side_effect = lambda emails, level: [verify_email('bad') | {'email': e} for e in emails]
+        upload = SimpleUploadedFile('emails.csv', b'name,email\nA,a@example.com\nB,b@example.org\n')
+        
+        response = self.client.post(
+            reverse('money:verify_bulk_api'),
+            {'file': upload},
+            HTTP_X_API_KEY=self.api_key.key,
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        mock_bulk.assert_called_once_with(['a@example.com', 'b@example.org'], level='smtp')
+    
+    @patch('money.bulk.BULK_VERIFY_MAX_BYTES', 64)
+    @patch('money.bulk.BULK_VERIFY_MAX_EMAILS', 2)
+    @patch('money.async_verifier.run_bulk_verification')
+    def test_bulk_upload_limits(self, mock_bulk):
+        """Файл больше BULK_VERIFY_MAX_BYTES не читается, адреса сверх лимита не дочитываются"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .bulk import read_upload_emails
+        
+        def post(content):
+            return self.client.post(
+                reverse('money:verify_bulk_api'),
+                {'file': SimpleUploadedFile('emails.csv', content)},
+                HTTP_X_API_KEY=self.api_key.key,
+            )
+        
+        self.assertEqual(post(b'a@example.com\n' * 10).status_code, 400)
+        response = post(b'a@example.com\nA@example.com\nb@example.com\nc@example.com\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Слишком много адресов', response.json()['error'])
+        mock_bulk.assert_not_called()
+        
+        upload = SimpleUploadedFile('emails.csv', b''.join(b'user%d@example.com\n' % i for i in range(1000)))
+        self.assertEqual(len(read_upload_emails(upload, limit=2)), 3)
+        self.assertLess(upload.file.tell(), len(upload))
+    
+    def test_bulk_requires_plan_flag(self):
+        """Массовая проверка недоступна без bulk_verification"""
+        self.plan.bulk_verification = False
+        self.plan.save()
+        
+        response = self.post_bulk(['a@example.com'])
+        self.assertEqual(response.status_code, 403)
+    
+    def test_bulk_rejects_list_over_remaining_quota(self):
+        """Список больше остатка лимита отклоняется целиком"""
+        self.plan.daily_limit = 2
+        self.plan.save()
+        
+        response = self.post_bulk(['a@example.com', 'b@example.com', 'c@example.com'])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(EmailVerification.objects.count(), 0)
+
+
+class VerificationJobTests(TestCase):
+    """Тесты фоновых задач верификации"""
+    
+    def setUp(self):
+        clear_caches()
+        self.client = Client()
+        self.user = User.objects.create_user('jobuser', 'job@test.com', 'password')
+        self.plan = SubscriptionPlan.objects.create(
+            name='pro',
+            display_name='Pro',
+            daily_limit=100,
+            monthly_limit=1000,
+            api_access=True,
+            bulk_verification=True,
+        )
+        self.profile = UserProfile.objects.create(user=self.user, plan=self.plan)
+        self.api_key = APIKey.objects.create(user=self.user, name='Job Key')
+    
+    def enqueue(self, url_name='money:verify_api', data=None, query='?async=1'):
+        return self.client.post(
+            reverse(url_name) + query,
+            data=json.dumps(data or {'email': 'user@example.com'}),
+            content_type='application/json',
+            HTTP_X_API_KEY=self.api_key.key,
+        )
+    
+    async def fake_results(self, emails, on_round=None):
+        if on_round:
+            await on_round()
+        return [verify_email('bad') | {'email': email} for email in emails]
+    
+    def test_async_request_returns_job_id(self):
+        """Асинхронный запрос сразу возвращает id задачи и списывает лимит"""
+        from .models import VerificationJob
+        response = self.enqueue()
+        
+        self.assertEqual(response.status_code, 202)
+        job = VerificationJob.objects.get(pk=response.json()['job_id'])
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual(job.emails, ['user@example.com'])
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_verifications, 1)
+    
+    @patch('money.async_verifier.run_bulk_verification')
+    def test_worker_completes_job_and_status_endpoint(self, mock_run):
+        """Воркер выполняет задачу, результат доступен по /api/jobs/<id>/"""
+        from .jobs import run_worker
+        mock_run.side_effect = self.fake_results
+        job_id = self.enqueue('money:verify_bulk_api', {'emails': ['a@example.com', 'b@example.com']}).json()['job_id']
+        
+        self.assertEqual(run_worker(once=True), 1)
+        
+        response = self.client.get(reverse('money:job_status', args=[job_id]), HTTP_X_API_KEY=self.api_key.key)
+        data = response.json()
+        self.assertEqual(data['status'], 'completed')
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(EmailVerification.objects.filter(user=self.user).count(), 2)
+    
+    @patch('money.async_verifier.run_bulk_verification')
+    def test_long_job_keeps_heartbeat_and_claim(self, mock_run):
+        """Проверка продлевает heartbeat; задачу, взятую повторно, прежний воркер не завершает"""
+        from datetime import timedelta
+        from django.db.models import F
+        from django.utils import timezone
+        from .jobs import claim_next_job, process_job
+        from .models import VerificationJob
+        job_id = self.enqueue('money:verify_bulk_api', {'emails': ['a@example.com']}).json()['job_id']
+        job = claim_next_job()
+        stale = timezone.now() - timedelta(hours=1)
+        VerificationJob.objects.filter(pk=job_id).update(heartbeat_at=stale)
+        
+        async def requeued_meanwhile(emails, on_round=None):
+            await on_round()
+            heartbeat_at = await VerificationJob.objects.values_list('heartbeat_at', flat=True).aget(pk=job_id)
+            self.assertGreater(heartbeat_at, stale)
+            # Другой воркер счёл задачу брошенной и взял её снова
+            await VerificationJob.objects.filter(pk=job_id).aupdate(attempts=F('attempts') + 1)
+            return await self.fake_results(emails)
+        
+        mock_run.side_effect = requeued_meanwhile
+        process_job(job)
+        
+        job = VerificationJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, 'running')
+        self.assertIsNone(job.results)
+        self.assertFalse(EmailVerification.objects.exists())
+    
+    def test_job_hidden_from_other_users(self):
+        """Чужая задача не видна"""
+        job_id = self.enqueue().json()['job_id']
+        User.objects.create_user('other', 'other@test.com', 'password')
+        self.client.login(username='other', password='password')
+        
+        response = self.client.get(reverse('money:job_status', args=[job_id]))
+        self.assertEqual(response.status_code, 404)
+    
+    @patch('money.jobs.resolve_host', return_value=['93.184.216.34'])
+    @patch('money.jobs.post_callback', return_value=200)
+    @patch('money.async_verifier.run_bulk_verification')
+    def test_callback_sent_on_completion(self, mock_run, mock_post, mock_resolve):
+        """Результат отправляется на callback_url через проверенный адрес"""
+        from .jobs import run_worker
+        from .models import VerificationJob
+        mock_run.side_effect = self.fake_results
+        job_id = self.enqueue(query='?async=1&callback_url=https://client.example/hook').json()['job_id']
+        
+        run_worker(once=True)
+        
+        self.assertTrue(VerificationJob.objects.get(pk=job_id).callback_sent)
+        url, address, body = mock_post.call_args.args
+        self.assertEqual((url, address), ('https://client.example/hook', '93.184.216.34'))
+        self.assertEqual(json.loads(body)['job_id'], job_id)
+        self.assertEqual(mock_resolve.call_count, 2)  # При постановке задачи и перед отправкой
+    
+    def test_internal_callback_rejected(self):
+        """Callback на внутренние адреса отклоняется при постановке задачи"""
+        from .models import VerificationJob
+        for url in [
+            'http://127.0.0.1/hook', 'http://10.0.0.5/hook', 'http://169.254.169.254/latest/meta-data/',
+            'http://[::1]:8000/hook', 'http://[::ffff:192.168.0.1]/hook', 'http://0.0.0.0/hook', 'ftp://client.example/',
+        ]:
+            with self.subTest(url=url):
+                self.assertEqual(self.enqueue(query=f'?async=1&callback_url={url}').status_code, 400)
+        with patch('money.jobs.resolve_host', return_value=['93.184.216.34', '10.0.0.5']):
+            self.assertEqual(self.enqueue(query='?async=1&callback_url=https://client.example/').status_code, 400)
+        self.assertFalse(VerificationJob.objects.exists())
+    
+    @patch('money.jobs.post_callback')
+    def test_callback_rechecked_before_sending(self, mock_post):
+        """Если имя хоста стало указывать на внутренний адрес, callback не отправляется"""
+        from .jobs import send_callback
+        from .models import VerificationJob
+        job = VerificationJob.objects.create(
+            kind='single', emails=['user@example.com'], user=self.user, status='failed',
+            callback_url='https://client.example/hook',
+        )
+        with patch('money.jobs.resolve_host', return_value=['169.254.169.254']):
+            self.assertFalse(send_callback(job))
+        mock_post.assert_not_called()
+    
+    def test_callback_redirect_not_followed(self):
+        """Редирект в ответ на callback не выполняется"""
+        import threading
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        from .jobs import send_callback
+        from .models import VerificationJob
+        requests = []
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                requests.append(self.path)
+                self.rfile.read(int(self.headers['Content-Length']))
+                self.send_response(302)
+                self.send_header('Location', 'http://169.254.169.254/latest/meta-data/')
+                self.end_headers()
+            
+            def log_message(self, *args):
+                pass
+        
+        server = HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        job = VerificationJob.objects.create(
+            kind='single', emails=['user@example.com'], user=self.user, status='failed',
+            callback_url=f'http://127.0.0.1:{server.server_port}/hook',
+        )
+        # Тестовый сервер локальный - проверку адреса отключаем
+        with patch('money.jobs.is_public_address', return_value=True):
+            self.assertFalse(send_callback(job))
+        self.assertEqual(requests, ['/hook'])
+    
+    def test_stale_running_job_requeued(self):
+        """Задача упавшего воркера возвращается в очередь"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .jobs import requeue_stale_jobs
+        from .models import VerificationJob
+        job = VerificationJob.objects.create(
+            user=self.user, emails=['a@example.com'], status='running', attempts=1,
+            started_at=timezone.now() - timedelta(hours=1),
+        )
+        
+        self.assertEqual(requeue_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'pending')
+
+
+class ResultCacheTests(TestCase):
+    """Тесты кэша результатов верификации"""
+    
+    def setUp(self):
+        clear_caches()
+        self.client = Client()
+        self.user = User.objects.create_user('cacheuser', 'cache@test.com', 'password')
+        self.plan = SubscriptionPlan.objects.create(
+            name='pro',
+            display_name='Pro',
+            daily_limit=100,
+            monthly_limit=1000,
+            api_access=True,
+        )
+        UserProfile.objects.create(user=self.user, plan=self.plan)
+        self.api_key = APIKey.objects.create(user=self.user, name='Cache Key')
+    
+    def valid_result(self, email, level='smtp'):
+        result = verify_email('bad') | {'email': email, 'is_valid_syntax': True, 'status': 'valid'}
+        result['mx_records'] = ['mx.example.com']
+        return result
+    
+    def post(self, email, query=''):
+        return self.client.post(
+            reverse('money:verify_api') + query,
+            data=json.dumps({'email': email}),
+            content_type='application/json',
+            HTTP_X_API_KEY=self.api_key.key,
+        )
+    
+    @patch('money.views.verify_email')
+    def test_repeat_check_served_from_cache(self, mock_verify):
+        """Повторная проверка адреса берётся из кэша"""
+        mock_verify.side_effect = self.valid_result
+        
+        self.assertEqual(self.post('User@Example.com').json()['cache'], 'miss')
+        response = self.post('user@example.com').json()
+        
+        self.assertEqual(response['cache'], 'hit')
+        self.assertEqual(response['data']['email'], 'user@example.com')
+        mock_verify.assert_called_once()
+    
+    @patch('money.views.verify_email')
+    def test_cache_bypass(self, mock_verify):
+        """cache=bypass выполняет проверку заново"""
+        mock_verify.side_effect = self.valid_result
+        
+        self.post('user@example.com')
+        response = self.post('user@example.com', '?cache=bypass').json()
+        
+        self.assertEqual(response['cache'], 'bypass')
+        self.assertEqual(mock_verify.call_count, 2)
+    
+    def test_ttl_depends_on_status(self):
+        """Время жизни зависит от статуса, неверный синтаксис не кэшируется"""
+        from .result_cache import get_result_ttl, RESULT_CACHE_TTLS
+        valid = self.valid_result('a@example.com')
+        unknown = dict(valid, status='unknown')
+        
+        self.assertEqual(get_result_ttl(valid), RESULT_CACHE_TTLS['valid'])
+        self.assertLess(get_result_ttl(unknown), get_result_ttl(valid))
+        self.assertEqual(get_result_ttl(verify_email('bad')), 0)
+    
+    def test_bulk_verifies_only_misses(self):
+        """Массовая проверка вызывает движок только для адресов не из кэша"""
+        from .result_cache import cache_result, verify_many_with_cache
+        cache_result(self.valid_result('a@example.com'))
+        verify_many = MagicMock(side_effect=lambda emails: [self.valid_result(e) for e in emails])
+        
+        results, hits = verify_many_with_cache(['A@example.com', 'b@example.com'], verify_many)
+        
+        self.assertEqual(hits, 1)
+        self.assertEqual([r['email'] for r in results], ['A@example.com', 'b@example.com'])
+        verify_many.assert_called_once_with(['b@example.com'])
+
+
+class MXThrottleTests(TestCase):
+    """Тесты ограничения нагрузки на MX-хосты"""
+    
+    def setUp(self):
+        from .throttle import MXThrottle
+        clear_caches()
+        self.throttle = MXThrottle()
+        self.throttle.max_concurrent = 2
+        self.throttle.max_wait = 0.2
+    
+    def test_concurrent_sessions_limited_per_host(self):
+        """Слотов на хост не больше max_concurrent, другие хосты не затронуты"""
+        self.assertTrue(self.throttle.try_acquire('mx.example.com'))
+        self.assertTrue(self.throttle.try_acquire('MX.example.com'))
+        self.assertFalse(self.throttle.try_acquire('mx.example.com'))
+        self.assertTrue(self.throttle.try_acquire('mx.other.com'))
+        
+        self.throttle.release('mx.example.com')
+        self.assertTrue(self.throttle.try_acquire('mx.example.com'))
+    
+    def test_slot_counter_kept_alive_and_not_negative(self):
+        """Счётчик слотов продлевается при занятии и не уходит ниже нуля"""
+        key = self.throttle.make_key('slots', 'mx.example.com')
+        with patch.object(self.throttle.cache, 'touch', wraps=self.throttle.cache.touch) as mock_touch:
+            self.assertTrue(self.throttle.try_acquire('mx.example.com'))
+        mock_touch.assert_called_once_with(key, self.throttle.slot_timeout)
+        
+        self.throttle.release('mx.example.com')
+        self.throttle.release('mx.example.com')  # Слот, занятый до истечения счётчика
+        self.assertEqual(self.throttle.cache.get(key), 0)
+        self.assertTrue(self.throttle.try_acquire('mx.example.com'))
+        self.assertTrue(self.throttle.try_acquire('mx.example.com'))
+        self.assertFalse(self.throttle.try_acquire('mx.example.com'))
+    
+    @patch('money.async_verifier.check_mx_records_async', return_value=(True, ['mx.example.com.']))
+    def test_bulk_requeues_throttled_addresses(self, mock_mx):
+        """Адреса, не дождавшиеся слота, массовая проверка проверяет в следующем круге"""
+        import asyncio
+        from .async_verifier import verify_bulk_async
+        from .domain_intel import NORMAL, set_domain_verdict
+        from .throttle import ThrottleTimeout
+        set_domain_verdict('example.com', NORMAL)
+        attempts = []
+        
+        async def probe(pool, email, mx_host):
+            attempts.append(email)
+            if attempts.count(email) == 1 and email != 'a@example.com':
+                raise ThrottleTimeout(mx_host)
+            return True
+        
+        with patch('money.smtp_pool.SMTPSessionPool.probe', probe):
+            results = asyncio.run(verify_bulk_async(['a@example.com', 'b@example.com']))
+        self.assertEqual([result['status'] for result in results], ['valid', 'valid'])
+        self.assertEqual(attempts.count('b@example.com'), 2)
+        
+        attempts.clear()
+        with patch('money.smtp_pool.SMTPSessionPool.probe', side_effect=ThrottleTimeout('mx.example.com')), \
+                patch('money.async_verifier.BULK_THROTTLE_ROUNDS', 2):
+            results = asyncio.run(verify_bulk_async(['c@example.com']))
+        self.assertEqual(results[0]['status'], 'unknown')
+    
+    @patch('money.throttle.time.time', return_value=1700000000.0)
+    def test_rate_limited_per_second(self, mock_time):
+        """Частота проверок хоста ограничена"""
+        self.throttle.max_concurrent = 100
+        self.throttle.max_rate = 3
+        acquired = [self.throttle.try_acquire('mx.example.com') for _ in range(5)]
+        self.assertEqual(acquired, [True, True, True, False, False])
+    
+    def test_backoff_after_421_and_reset_on_success(self):
+        """Ответ 421 ставит хост на паузу, успешный ответ сбрасывает уровень"""
+        from .throttle import ThrottleTimeout
+        self.throttle.report('mx.example.com', 421)
+        self.assertGreater(self.throttle.backoff_until('mx.example.com'), 0)
+        self.assertFalse(self.throttle.try_acquire('mx.example.com'))
+        
+        with self.assertRaises(ThrottleTimeout):
+            with self.throttle.slot('mx.example.com'):
+                pass
+        
+        self.throttle.report('mx.example.com', 250)
+        self.assertIsNone(self.throttle.cache.get(self.throttle.make_key('level', 'mx.example.com')))
+    
+    @patch('money.views.mx_throttle')
+    @patch('money.views.smtplib.SMTP')
+    def test_sync_probe_reports_response_code(self, mock_smtp, mock_throttle):
+        """Синхронная SMTP-проверка занимает слот и сообщает код ответа"""
+        from .views import check_smtp_deliverable
+        mock_smtp.return_value.helo.return_value = (250, b'ok')
+        mock_smtp.return_value.mail.return_value = (250, b'ok')
+        mock_smtp.return_value.rcpt.return_value = (451, b'greylisted')
+        
+        self.assertIsNone(check_smtp_deliverable('user@example.com', 'mx.example.com'))
+        mock_throttle.slot.assert_called_once_with('mx.example.com', max_wait=None)
+        mock_throttle.report.assert_called_once_with('mx.example.com', 451)
+
+
+class MXFailoverTests(TestCase):
+    """Тесты перебора резервных MX-хостов"""
+    
+    def setUp(self):
+        clear_caches()
+    
+    @patch('money.resolver.resolver_pool.resolve')
+    def test_mx_sorted_by_preference(self, mock_resolve):
+        """MX-записи сортируются по приоритету"""
+        answer = MagicMock()
+        answer.__iter__.return_value = [
+            MagicMock(exchange='backup.example.com.', preference=20),
+            MagicMock(exchange='primary.example.com.', preference=5),
+        ]
+        answer.rrset.ttl = 300
+        mock_resolve.return_value = answer
+        
+        self.assertEqual(
+            check_mx_records('example.com'),
+            (True, ['primary.example.com.', 'backup.example.com.']),
+        )
+    
+    @patch('money.views.check_mx_records')
+    @patch('money.views.check_smtp_deliverable')
+    def test_sync_falls_back_to_next_mx(self, mock_smtp, mock_mx):
+        """Если основной MX не ответил, проверяется следующий"""
+        mock_mx.return_value = (True, ['primary.example.com.', 'backup.example.com.'])
+        mock_smtp.side_effect = [None, True, False]  # третий вызов - проверка catch-all
+        
+        result = verify_email('user@example.com')
+        
+        self.assertEqual(result['status'], 'valid')
+        self.assertEqual(result['mx_host'], 'backup.example.com')
+    
+    @patch('money.views.SMTP_VERIFY_DEADLINE', 0.05)
+    @patch('money.views.check_mx_records')
+    @patch('money.views.check_smtp_deliverable')
+    def test_sync_failover_bounded_by_deadline(self, mock_smtp, mock_mx):
+        """Зависший MX исчерпывает общий срок - остальные хосты не пробуются"""
+        import time
+        mock_mx.return_value = (True, ['a.example.com.', 'b.example.com.', 'c.example.com.'])
+        
+        def hang_until_deadline(email, mx_host, deadline=None):
+            time.sleep(max(deadline - time.monotonic(), 0))
+        
+        mock_smtp.side_effect = hang_until_deadline
+        result = verify_email('user@example.com')
+        
+        self.assertEqual(result['status'], 'unknown')
+        self.assertEqual(mock_smtp.call_count, 1)
+    
+    def test_slot_wait_bounded_by_deadline(self):
+        """Синхронная проверка ждёт слот MX-хоста не дольше своего срока"""
+        import time
+        from .views import check_smtp_deliverable
+        from .throttle import mx_throttle
+        
+        with patch.object(mx_throttle, 'try_acquire', return_value=False), \
+                patch('money.views.smtplib.SMTP') as mock_smtp:
+            started = time.monotonic()
+            self.assertIsNone(check_smtp_deliverable('user@example.com', 'mx.example.com', started + 0.05))
+        
+        self.assertLess(time.monotonic() - started, 1)
+        mock_smtp.assert_not_called()
+    
+    def test_async_race_starts_backup_after_delay(self):
+        """Медленный основной MX не задерживает ответ резервного"""
+        import asyncio
+        from .async_verifier import race_mx_hosts
+        
+        async def fake_probe(email, host):
+            if host == 'slow.example.com':
+                await asyncio.sleep(5)
+                return True
+            return False
+        
+        with patch('money.async_verifier.check_smtp_deliverable_async', side_effect=fake_probe), \
+                patch('money.async_verifier.MX_RACE_DELAY', 0.01):
+            result = asyncio.run(asyncio.wait_for(
+                race_mx_hosts('user@example.com', ['slow.example.com.', 'fast.example.com.']), 1
+            ))
+        
+        self.assertEqual(result, (False, 'fast.example.com'))
+    
+    def test_async_race_all_unknown(self):
+        """Все MX без точного ответа - результат неизвестен"""
+        import asyncio
+        from .async_verifier import race_mx_hosts
+        
+        with patch('money.async_verifier.check_smtp_deliverable_async', return_value=None):
+            result = asyncio.run(race_mx_hosts('user@example.com', ['a.example.com.', 'b.example.com.']))
+        
+        self.assertEqual(result, (None, ''))
+
+
+class DisposableClassifierTests(TestCase):
+    """Тесты классификатора одноразовых доменов"""
+    
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.blocklist = f'{self.tmpdir.name}/block.txt'
+        self.allowlist = f'{self.tmpdir.name}/allow.txt'
+        self.compiled_dir = f'{self.tmpdir.name}/compiled'
+        self.write(self.blocklist, '# список\nzzz-mail.net\nMailinator.com\n*.spam.org\n')
+        self.write(self.allowlist, 'good.mailinator.com\n')
+    
+    def write(self, path, text):
+        with open(path, 'w') as f:
+            f.write(text)
+    
+    def make(self):
+        from .disposable import DomainClassifier
+        return DomainClassifier(self.blocklist, self.allowlist, reload_interval=0, compiled_dir=self.compiled_dir)
+    
+    def test_matches_listed_domains_and_subdomains(self):
+        """Совпадают домены из списка и их поддомены"""
+        classifier = self.make()
+        self.assertTrue(classifier.is_disposable('mailinator.com'))
+        self.assertTrue(classifier.is_disposable('a.b.Mailinator.com'))
+        self.assertTrue(classifier.is_disposable('x.spam.org'))
+        self.assertTrue(classifier.is_disposable('zzz-mail.net'))
+        self.assertFalse(classifier.is_disposable('gmail.com'))
+        self.assertFalse(classifier.is_disposable('notmailinator.com'))
+    
+    def test_allowlist_overrides_blocklist(self):
+        """Белый список важнее чёрного"""
+        self.assertFalse(self.make().is_disposable('good.mailinator.com'))
+    
+    def test_hot_reload_on_file_change(self):
+        """Изменённый файл подхватывается без перезапуска"""
+        import os
+        classifier = self.make()
+        self.assertFalse(classifier.is_disposable('new-temp.io'))
+        
+        self.write(self.blocklist, 'new-temp.io\n')
+        stat = os.stat(self.blocklist)
+        os.utime(self.blocklist, (stat.st_atime, stat.st_mtime + 10))
+        
+        self.assertTrue(classifier.is_disposable('new-temp.io'))
+        self.assertFalse(classifier.is_disposable('mailinator.com'))
+    
+    def test_sorted_file_binary_search(self):
+        """Бинарный поиск находит каждый домен большого списка"""
+        from .disposable import SortedDomainFile, compile_domain_list
+        domains = [f'd{i}.example' for i in range(2000)]
+        self.write(self.blocklist, '\n'.join(domains))
+        
+        sorted_file = SortedDomainFile(compile_domain_list(self.blocklist, self.compiled_dir))
+        self.assertTrue(all(domain in sorted_file for domain in domains))
+        self.assertNotIn('d2000.example', sorted_file)
+        self.assertNotIn('a.example', sorted_file)
+    
+    def test_failed_reload_keeps_previous_list(self):
+        """Ошибка чтения нового списка не ломает проверку: остаётся прежний список"""
+        import os
+        classifier = self.make()
+        self.assertTrue(classifier.is_disposable('mailinator.com'))
+        
+        stat = os.stat(self.blocklist)
+        os.utime(self.blocklist, (stat.st_atime, stat.st_mtime + 10))
+        with patch('money.disposable.read_domains', side_effect=PermissionError('denied')):
+            with self.assertLogs('money.disposable', level='ERROR'):
+                self.assertTrue(classifier.is_disposable('mailinator.com'))
+        self.assertTrue(classifier.is_disposable('mailinator.com'))
+    
+    def test_compiled_list_written_outside_source_dir(self):
+        """Отсортированная копия пишется в отдельный каталог, а не рядом с исходным файлом"""
+        import os
+        from .disposable import compile_domain_list
+        compiled = compile_domain_list(self.blocklist, self.compiled_dir)
+        self.assertEqual(os.path.dirname(compiled), self.compiled_dir)
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ['allow.txt', 'block.txt', 'compiled'])
+    
+    def test_builtin_subdomain_detection(self):
+        """Встроенный список тоже учитывает поддомены"""
+        self.assertTrue(is_disposable_email('inbox.yopmail.com'))
+
+
+class QuotaTests(TestCase):
+    """Тесты атомарного списания лимитов"""
+    
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user('quotauser', 'quota@test.com', 'password')
+        self.plan = SubscriptionPlan.objects.create(
+            name='basic',
+            display_name='Basic',
+            daily_limit=3,
+            monthly_limit=10,
+            api_access=True,
+        )
+        self.profile = UserProfile.objects.create(user=self.user, plan=self.plan)
+    
+    def test_reserve_charges_all_counters(self):
+        """Успешное резервирование увеличивает все счётчики"""
+        from datetime import date
+        from .quota import reserve_quota
+        
+        self.assertEqual(reserve_quota(self.profile, 2), (True, 'OK'))
+        
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_verifications, 2)
+        self.assertEqual(self.profile.monthly_verifications, 2)
+        self.assertEqual(self.profile.total_verifications, 2)
+        self.assertEqual(self.profile.last_verification_date, date.today())
+    
+    def test_reserve_rejects_at_limit_without_charging(self):
+        """При исчерпанном лимите ничего не списывается"""
+        from .quota import reserve_quota
+        
+        for _ in range(3):
+            self.assertTrue(reserve_quota(self.profile)[0])
+        can_verify, message = reserve_quota(self.profile)
+        
+        self.assertFalse(can_verify)
+        self.assertIn('дневной лимит', message.lower())
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_verifications, 3)
+    
+    def test_reserve_resets_daily_counter_on_new_day(self):
+        """Дневной счётчик вчерашнего дня сбрасывается тем же запросом"""
+        from datetime import date, timedelta
+        from .quota import reserve_quota
+        UserProfile.objects.filter(pk=self.profile.pk).update(
+            daily_verifications=3,
+            monthly_verifications=3,
+            last_verification_date=date.today() - timedelta(days=1),
+        )
+        self.profile.refresh_from_db()
+        
+        self.assertTrue(reserve_quota(self.profile)[0])
+        
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_verifications, 1)
+        self.assertEqual(self.profile.monthly_verifications, 4)
+    
+    def test_stale_instance_does_not_overdraw(self):
+        """Устаревший объект профиля не позволяет превысить лимит"""
+        from .quota import reserve_quota
+        stale = UserProfile.objects.get(pk=self.profile.pk)
+        
+        self.assertTrue(reserve_quota(self.profile, 3)[0])
+        self.assertFalse(reserve_quota(stale)[0])
+        
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_verifications, 3)
+    
+    @patch('money.views.verify_email')
+    def test_api_charges_once_per_request(self, mock_verify):
+        """API списывает одну проверку и обновляет статистику ключа"""
+        mock_verify.return_value = verify_email('bad')
+        api_key = APIKey.objects.create(user=self.user, name='Quota Key')
+        
+        response = self.client.post(
+            reverse('money:verify_api'),
+            data=json.dumps({'email': 'user@example.com'}),
+            content_type='application/json',
+            HTTP_X_API_KEY=api_key.key,
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_verifications, 1)
+        api_key.refresh_from_db()
+        self.assertEqual(api_key.requests_count, 1)
+
+
+class AnonymousQuotaTests(TestCase):
+    """Тесты дневного лимита анонимных проверок"""
+    
+    def setUp(self):
+        clear_caches()
+    
+    def test_reserve_counts_down_to_limit(self):
+        """Счётчик на IP ведётся в кэше и не превышает лимит"""
+        from .quota import ANONYMOUS_DAILY_LIMIT, anonymous_usage, reserve_anonymous_quota
+        
+        for i in range(ANONYMOUS_DAILY_LIMIT):
+            self.assertEqual(reserve_anonymous_quota('10.0.0.1'), (True, ANONYMOUS_DAILY_LIMIT - i - 1))
+        
+        self.assertEqual(reserve_anonymous_quota('10.0.0.1'), (False, 0))
+        self.assertEqual(anonymous_usage('10.0.0.1'), ANONYMOUS_DAILY_LIMIT)
+        self.assertTrue(reserve_anonymous_quota('10.0.0.2')[0])
+    
+    @patch('money.views.verify_email')
+    def test_api_limit_without_scanning_verifications(self, mock_verify):
+        """API отклоняет анонимный запрос сверх лимита без подсчёта строк проверок"""
+        from .quota import ANONYMOUS_DAILY_LIMIT
+        mock_verify.return_value = verify_email('bad')
+        
+        def post():
+            return self.client.post(
+                reverse('money:verify_api'),
+                data=json.dumps({'email': 'user@example.com'}),
+                content_type='application/json',
+            )
+        
+        for _ in range(ANONYMOUS_DAILY_LIMIT):
+            self.assertEqual(post().status_code, 200)
+        with patch.object(EmailVerification.objects, 'filter') as mock_filter:
+            self.assertEqual(post().status_code, 429)
+            response = self.client.get(reverse('money:home'))
+        mock_filter.assert_not_called()
+        self.assertEqual(response.context['remaining_checks'], 0)
+
+
+class APIKeyAuthTests(TestCase):
+    """Тесты кэшированной аутентификации по API ключу"""
+    
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user('authuser', 'auth@test.com', 'password')
+        self.plan = SubscriptionPlan.objects.create(
+            name='pro',
+            display_name='Pro',
+            daily_limit=100,
+            monthly_limit=1000,
+            api_access=True,
+        )
+        UserProfile.objects.create(user=self.user, plan=self.plan)
+        self.api_key = APIKey.objects.create(user=self.user, name='Auth Key')
+    
+    def test_resolves_key_profile_and_plan_in_one_query(self):
+        """Ключ, пользователь, профиль и тариф загружаются одним запросом, затем из кэша"""
+        from .api_auth import get_api_key
+        
+        with self.assertNumQueries(1):
+            api_key = get_api_key(self.api_key.key)
+            self.assertTrue(api_key.user.profile.plan.api_access)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_api_key(self.api_key.key).user.profile.plan, self.plan)
+    
+    def test_unknown_key_is_negative_cached(self):
+        """Неизвестный ключ не запрашивается из БД повторно"""
+        from .api_auth import get_api_key
+        
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_api_key('guess'))
+            self.assertIsNone(get_api_key('guess'))
+    
+    def test_deactivated_key_is_invalidated(self):
+        """Отключённый ключ перестаёт приниматься сразу"""
+        from .api_auth import get_api_key
+        self.assertIsNotNone(get_api_key(self.api_key.key))
+        
+        self.api_key.is_active = False
+        self.api_key.save()
+        
+        self.assertIsNone(get_api_key(self.api_key.key))
+    
+    def test_plan_change_is_invalidated(self):
+        """Изменение тарифа сбрасывает кэш ключей его пользователей"""
+        from .api_auth import get_api_key
+        self.assertTrue(get_api_key(self.api_key.key).user.profile.plan.api_access)
+        
+        self.plan.api_access = False
+        self.plan.save()
+        
+        self.assertFalse(get_api_key(self.api_key.key).user.profile.plan.api_access)
+
+
+class WriteBehindTests(TestCase):
+    """Тесты отложенной записи проверок"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user('wbuser', 'wb@test.com', 'password')
+        self.api_key = APIKey.objects.create(user=self.user, name='WB Key')
+    
+    def make_buffer(self):
+        from .write_behind import WriteBuffer
+        buffer = WriteBuffer(interval=60, max_rows=100)
+        buffer._ensure_thread = lambda: None  # сбрасываем вручную
+        return buffer
+    
+    def test_flush_bulk_inserts_and_aggregates_key_usage(self):
+        """Записи вставляются одной пачкой, статистика ключа - одним UPDATE"""
+        from .views import build_verification
+        buffer = self.make_buffer()
+        for i in range(3):
+            buffer.add_verification(build_verification(verify_email(f'bad{i}'), user=self.user, api_key=self.api_key))
+            buffer.add_api_key_usage(self.api_key.pk)
+        self.assertEqual(EmailVerification.objects.count(), 0)
+        
+        # INSERT и UPDATE внутри одной транзакции (в тесте - SAVEPOINT)
+        with self.assertNumQueries(4):
+            self.assertEqual(buffer.flush(), 3)
+        
+        self.assertEqual(EmailVerification.objects.filter(api_key=self.api_key).count(), 3)
+        self.api_key.refresh_from_db()
+        self.assertEqual(self.api_key.requests_count, 3)
+        self.assertIsNotNone(self.api_key.last_used)
+        self.assertEqual(len(buffer), 0)
+    
+    def test_failed_flush_keeps_rows(self):
+        """Не записанные из-за ошибки строки остаются в буфере"""
+        from .views import build_verification
+        buffer = self.make_buffer()
+        buffer.add_verification(build_verification(verify_email('bad'), user=self.user))
+        
+        with patch.object(EmailVerification.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                buffer.flush()
+        
+        self.assertEqual(len(buffer), 1)
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(EmailVerification.objects.count(), 1)
+    
+    def test_failed_batch_rolls_back_whole_flush(self):
+        """Ошибка во второй пачке откатывает первую - повторный сброс не задваивает строки"""
+        from .views import build_verification
+        from .write_behind import WriteBuffer
+        buffer = WriteBuffer(interval=60, max_rows=2)
+        buffer._ensure_thread = lambda: None
+        for i in range(4):
+            buffer.add_verification(build_verification(verify_email(f'bad{i}'), user=self.user))
+        buffer.add_api_key_usage(self.api_key.pk)
+        
+        with patch.object(APIKey.objects, 'filter', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                buffer.flush()
+        self.assertEqual(EmailVerification.objects.count(), 0)
+        self.assertEqual(len(buffer), 4)
+        
+        self.assertEqual(buffer.flush(), 4)
+        self.assertEqual(EmailVerification.objects.count(), 4)
+        self.api_key.refresh_from_db()
+        self.assertEqual(self.api_key.requests_count, 1)
+    
+    def test_buffer_capped(self):
+        """Буфер не растёт сверх WRITE_BEHIND_MAX_BUFFER, пока БД недоступна"""
+        from .views import build_verification
+        from .write_behind import WriteBuffer
+        buffer = WriteBuffer(interval=60, max_rows=100, max_buffer=3)
+        buffer._ensure_thread = lambda: None
+        for i in range(5):
+            buffer.add_verification(build_verification(verify_email(f'bad{i}'), user=self.user))
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(buffer.dropped, 2)
+        
+        with patch.object(EmailVerification.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                buffer.flush()
+        self.assertEqual(len(buffer), 3)
+    
+    @patch('money.write_behind.WRITE_BEHIND_ENABLED', True)
+    @patch('money.views.verify_email')
+    def test_api_defers_writes(self, mock_verify):
+        """С включённой отложенной записью запрос не пишет проверку в БД"""
+        from .write_behind import write_buffer
+        clear_caches()
+        mock_verify.return_value = verify_email('bad')
+        plan = SubscriptionPlan.objects.create(name='pro', display_name='Pro', daily_limit=10, monthly_limit=100, api_access=True)
+        UserProfile.objects.create(user=self.user, plan=plan)
+        
+        with patch.object(write_buffer, '_ensure_thread'):
+            response = self.client.post(
+                reverse('money:verify_api'),
+                data=json.dumps({'email': 'user@example.com'}),
+                content_type='application/json',
+                HTTP_X_API_KEY=self.api_key.key,
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.json()['verification_id'])
+            self.assertEqual(EmailVerification.objects.count(), 0)
+            
+            write_buffer.flush()
+        self.assertEqual(EmailVerification.objects.count(), 1)
+        self.api_key.refresh_from_db()
+        self.assertEqual(self.api_key.requests_count, 1)
+
+
+class VerificationStorageTests(TestCase):
+    """Тесты компактного хранения и свёртки истории проверок"""
+    
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user('storeuser', 'store@test.com', 'password')
+    
+    def test_mx_sets_and_error_codes_are_interned(self):
+        """Одинаковые MX-наборы хранятся одной строкой, ошибка - кодом"""
+        from .models import MXHostSet
+        from .views import build_verification
+        result = verify_email('bad') | {'mx_records': ['mx1.example.com', 'mx2.example.com']}
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            first = build_verification(result, user=self.user)
+        with self.assertNumQueries(0):
+            second = build_verification(result, user=self.user)
+        EmailVerification.objects.bulk_create([first, second])
+        
+        self.assertEqual(MXHostSet.objects.count(), 1)
+        verification = EmailVerification.objects.select_related('mx_set').first()
+        self.assertEqual(verification.mx_records, 'mx1.example.com, mx2.example.com')
+        self.assertEqual(verification.error_code, 'invalid_syntax')
+        self.assertEqual(verification.error_message, 'Неверный формат email')
+    
+    def test_rollup_moves_old_rows_to_daily_stats(self):
+        """Старые проверки сворачиваются в дневные итоги и удаляются"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import VerificationDailyStats
+        from .storage import rollup_verifications
+        
+        now = timezone.now()
+        rows = [
+            EmailVerification.objects.create(user=self.user, email='a@example.com', is_valid_syntax=True, is_deliverable=True),
+            EmailVerification.objects.create(user=self.user, email='b@example.com', is_valid_syntax=True),
+            EmailVerification.objects.create(email='c@example.com'),
+            EmailVerification.objects.create(user=self.user, email='d@example.com'),
+        ]
+        for row, age in zip(rows, [200, 200, 200, 1]):
+            EmailVerification.objects.filter(pk=row.pk).update(created_at=now - timedelta(days=age))
+        
+        self.assertEqual(rollup_verifications(now - timedelta(days=180)), 3)
+        
+        self.assertEqual(list(EmailVerification.objects.values_list('email', flat=True)), ['d@example.com'])
+        stats = VerificationDailyStats.objects.get(user=self.user)
+        self.assertEqual((stats.total, stats.valid_syntax, stats.deliverable), (2, 2, 1))
+        self.assertEqual(VerificationDailyStats.objects.get(user__isnull=True).total, 1)
+    
+    def test_rollup_adds_to_existing_stats(self):
+        """Повторная свёртка за тот же день прибавляется к итогам"""
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .models import VerificationDailyStats
+        
+        created_at = timezone.now() - timedelta(days=400)
+        for _ in range(2):
+            row = EmailVerification.objects.create(user=self.user, email='a@example.com')
+            EmailVerification.objects.filter(pk=row.pk).update(created_at=created_at)
+            call_command('rollup_verifications', days=30, stdout=StringIO())
+        
+        self.assertEqual(VerificationDailyStats.objects.get(user=self.user).total, 2)
+
+
+class HistoryExportTests(TestCase):
+    """Тесты потоковой выгрузки истории"""
+    
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user('exportuser', 'export@test.com', 'password')
+        other = User.objects.create_user('other', 'other@test.com', 'password')
+        EmailVerification.objects.create(user=self.user, email='ok@example.com', is_valid_syntax=True, has_mx_record=True, is_deliverable=True)
+        EmailVerification.objects.create(user=self.user, email='temp@mailinator.com', is_valid_syntax=True, is_disposable=True, error_code='disposable')
+        EmailVerification.objects.create(user=other, email='foreign@example.com')
+    
+    def export(self, url_name='money:export_history', **params):
+        response = self.client.get(reverse(url_name), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8-sig')
+    
+    def test_csv_export_contains_only_own_rows(self):
+        """CSV содержит заголовок и только проверки пользователя"""
+        import csv
+        self.client.login(username='exportuser', password='password')
+        
+        rows = list(csv.DictReader(self.export().splitlines()))
+        
+        self.assertEqual([row['email'] for row in rows], ['ok@example.com', 'temp@mailinator.com'])
+        self.assertEqual(rows[0]['status'], 'valid')
+        self.assertEqual(rows[1]['error_message'], 'Одноразовый email - может быть удалён в любой момент')
+    
+    def test_jsonl_export_with_status_and_date_filters(self):
+        """JSONL учитывает фильтры по статусу и датам"""
+        from django.utils import timezone
+        self.client.login(username='exportuser', password='password')
+        today = timezone.localdate().isoformat()
+        
+        lines = self.export(format='jsonl', status='risky', **{'from': today, 'to': today}).splitlines()
+        self.assertEqual([json.loads(line)['email'] for line in lines], ['temp@mailinator.com'])
+        
+        self.assertEqual(self.export(format='jsonl', **{'to': '2000-01-01'}), '')
+    
+    def test_api_export_with_key(self):
+        """API выгрузка работает по ключу и проверяет параметры"""
+        plan = SubscriptionPlan.objects.create(name='pro', display_name='Pro', api_access=True)
+        UserProfile.objects.create(user=self.user, plan=plan)
+        api_key = APIKey.objects.create(user=self.user, name='Export Key')
+        
+        body = self.export('money:export_history_api', format='jsonl', api_key=api_key.key)
+        self.assertEqual(len(body.splitlines()), 2)
+        
+        response = self.client.get(reverse('money:export_history_api'), {'format': 'xml', 'api_key': api_key.key})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('money:export_history_api')).status_code, 401)
+
+
+class BulkUploadTests(TestCase):
+    """Тесты проверки больших файлов"""
+    
+    def setUp(self):
+        import tempfile
+        from pathlib import Path
+        clear_caches()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = patch('money.upload.BULK_UPLOAD_DIR', Path(self.tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        self.user = User.objects.create_user('uploaduser', 'upload@test.com', 'password')
+        self.plan = SubscriptionPlan.objects.create(
+            name='business',
+            display_name='Business',
+            daily_limit=100,
+            monthly_limit=1000,
+            api_access=True,
+            bulk_verification=True,
+        )
+        self.profile = UserProfile.objects.create(user=self.user, plan=self.plan)
+        self.api_key = APIKey.objects.create(user=self.user, name='Upload Key')
+    
+    def upload(self, content):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return self.client.post(
+            reverse('money:verify_upload_api'),
+            {'file': SimpleUploadedFile('emails.csv', content)},
+            HTTP_X_API_KEY=self.api_key.key,
+        )
+    
+    def fake_results(self, emails):
+        return [verify_email('bad') | {'email': email} for email in emails]
+    
+    @patch('money.upload.BULK_UPLOAD_CHUNK_SIZE', 2)
+    @patch('money.async_verifier.run_bulk_verification')
+    def test_upload_is_deduplicated_grouped_and_chunked(self, mock_bulk):
+        """Файл проверяется пачками по доменам без повторов, прогресс и результаты доступны"""
+        from .jobs import run_worker
+        mock_bulk.side_effect = self.fake_results
+        content = b'email,name\nB@two.example,x\na@one.example,y\nc@one.example,z\nb@two.example,dup\n'
+        
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+        
+        self.assertEqual(run_worker(once=True), 1)
+        
+        self.assertEqual([call.args[0] for call in mock_bulk.call_args_list], [
+            ['a@one.example', 'c@one.example'],
+            ['b@two.example'],
+        ])
+        status = self.client.get(reverse('money:job_status', args=[job_id]), HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertEqual(status['status'], 'completed')
+        self.assertEqual((status['total'], status['processed']), (3, 3))
+        self.assertEqual(status['summary'], {'invalid': 3})
+        
+        response = self.client.get(status['results_url'], HTTP_X_API_KEY=self.api_key.key)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['email'] for line in lines], ['a@one.example', 'c@one.example', 'b@two.example'])
+        self.assertEqual(EmailVerification.objects.filter(user=self.user).count(), 3)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_verifications, 3)
+    
+    @patch('money.upload.BULK_UPLOAD_CHUNK_SIZE', 2)
+    @patch('money.async_verifier.run_bulk_verification')
+    def test_resume_continues_after_last_saved_chunk(self, mock_bulk):
+        """После падения воркера задача продолжается с сохранённой позиции"""
+        from .upload import process_upload_job, results_path
+        from .models import VerificationJob
+        mock_bulk.side_effect = self.fake_results
+        job_id = self.upload(b'a@one.example\nb@one.example\nc@two.example\n').json()['job_id']
+        job = VerificationJob.objects.get(pk=job_id)
+        
+        # Первая пачка записана, вторая - наполовину (воркер упал до сохранения прогресса)
+        mock_bulk.side_effect = [self.fake_results(['a@one.example', 'b@one.example']), RuntimeError('boom')]
+        process_upload_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.processed_count, 2)
+        
+        job.status = 'running'
+        job.error_message = ''
+        with open(results_path(job.id), 'a') as results:
+            results.write('{"partial": true}\n')
+        # При настоящем падении процесса файл остаётся на диске - возвращаем его
+        self.upload_source(job, b'a@one.example\nb@one.example\nc@two.example\n')
+        mock_bulk.side_effect = self.fake_results
+        process_upload_job(job)
+        
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(mock_bulk.call_args.args[0], ['c@two.example'])
+        with open(results_path(job.id)) as results:
+            self.assertEqual([json.loads(line)['email'] for line in results], ['a@one.example', 'b@one.example', 'c@two.example'])
+    
+    @patch('money.async_verifier.run_bulk_verification')
+    def test_transient_error_keeps_job_and_charges_once(self, mock_bulk):
+        """Сбой БД до сохранения пачки не завершает задачу и не списывает лимит - повтор платит один раз"""
+        from django.db import OperationalError
+        from .upload import process_upload_job, results_path
+        from .models import VerificationJob
+        mock_bulk.side_effect = self.fake_results
+        job_id = self.upload(b'a@one.example\nb@one.example\n').json()['job_id']
+        job = VerificationJob.objects.get(pk=job_id)
+        job.status = 'running'
+        job.save()
+        
+        with patch.object(EmailVerification.objects, 'bulk_create', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('money.upload', level='ERROR'):
+            process_upload_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed_count), ('running', 0))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_verifications, 0)
+        
+        process_upload_job(job)
+        self.assertEqual(job.status, 'completed')
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_verifications, 2)
+        with open(results_path(job.id)) as results:
+            self.assertEqual(len(results.readlines()), 2)
+    
+    def upload_source(self, job, content):
+        from .upload import source_path
+        source_path(job.id).parent.mkdir(parents=True, exist_ok=True)
+        source_path(job.id).write_bytes(content)
+    
+    def test_upload_stops_when_quota_runs_out(self):
+        """При исчерпании лимита задача завершается с ошибкой"""
+        from .jobs import run_worker
+        self.plan.daily_limit = 1
+        self.plan.save()
+        job_id = self.upload(b'a@one.example\nb@one.example\n').json()['job_id']
+        
+        run_worker(once=True)
+        
+        status = self.client.get(reverse('money:job_status', args=[job_id]), HTTP_X_API_KEY=self.api_key.key).json()
+        self.assertEqual(status['status'], 'failed')
+        self.assertIn('Проверено 0 из 2', status['error'])
+        self.assertEqual(status['processed'], 0)
+    
+    @patch('money.upload.BULK_UPLOAD_CHUNK_SIZE', 2)
+    @patch('money.async_verifier.run_bulk_verification')
+    def test_index_build_keeps_heartbeat(self, mock_bulk):
+        """Пока строится индекс, heartbeat задачи продлевается - её не заберёт другой воркер"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .jobs import requeue_stale_jobs, JOB_STALE_TIMEOUT
+        from .upload import AddressIndex, process_upload_job
+        from .models import VerificationJob
+        mock_bulk.side_effect = self.fake_results
+        job_id = self.upload(b'a@one.example\nb@one.example\nc@two.example\n').json()['job_id']
+        job = VerificationJob.objects.get(pk=job_id)
+        job.status = 'running'
+        job.heartbeat_at = timezone.now() - timedelta(seconds=JOB_STALE_TIMEOUT + 1)
+        job.save()
+        
+        def slow_build(index, emails, batch_size=10000, on_batch=None):
+            original_build(index, emails, batch_size=1, on_batch=on_batch)
+            self.assertEqual(requeue_stale_jobs(), 0)
+        
+        original_build = AddressIndex.build
+        with patch.object(AddressIndex, 'build', slow_build):
+            process_upload_job(job)
+        self.assertEqual(job.status, 'completed')
+    
+    @patch('money.async_verifier.run_bulk_verification')
+    def test_finished_upload_files_purged(self, mock_bulk):
+        """Исходник и индекс удаляются сразу, результаты - по истечении BULK_UPLOAD_RESULTS_TTL"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .jobs import run_worker
+        from .upload import BULK_UPLOAD_RESULTS_TTL, index_path, job_dir, purge_expired_uploads, results_path
+        from .models import VerificationJob
+        mock_bulk.side_effect = self.fake_results
+        job_id = self.upload(b'a@one.example\n').json()['job_id']
+        run_worker(once=True)
+        self.assertFalse(index_path(job_id).exists())
+        self.assertTrue(results_path(job_id).exists())
+        
+        self.assertEqual(purge_expired_uploads(), 0)
+        self.assertTrue(results_path(job_id).exists())
+        later = timezone.now() + timedelta(seconds=BULK_UPLOAD_RESULTS_TTL + 1)
+        self.assertEqual(purge_expired_uploads(now=later), 1)
+        self.assertFalse(job_dir(job_id).exists())
+    
+    def test_upload_requires_bulk_plan(self):
+        """Загрузка файла недоступна без массовой проверки"""
+        self.plan.bulk_verification = False
+        self.plan.save()
+        self.assertEqual(self.upload(b'a@one.example\n').status_code, 403)
+
+
+class EmailParsingTests(TestCase):
+    """Тесты разбора адресов"""
+    
+    def setUp(self):
+        clear_caches()
+    
+    def test_rfc_forms_accepted(self):
+        """Кавычки, спецсимволы dot-atom и IDN-домены проходят проверку"""
+        from .validation import parse_email
+        for email in ['"john doe"@example.com', "o'brien@example.com", 'user/dept=1@example.com', 'info@пример.рф']:
+            self.assertTrue(validate_email_syntax(email), f"{email} should be valid")
+        self.assertEqual(parse_email('info@Пример.РФ').domain, 'xn--e1afmkfd.xn--p1ai')
+    
+    def test_invalid_reasons(self):
+        """Причина отказа указывает, что не так с адресом"""
+        from .validation import parse_email, NO_AT, INVALID_LOCAL, INVALID_DOMAIN, TOO_LONG
+        self.assertEqual(parse_email('invalid').reason, NO_AT)
+        self.assertEqual(parse_email('a..b@example.com').reason, INVALID_LOCAL)
+        self.assertEqual(parse_email('user@-example.com').reason, INVALID_DOMAIN)
+        self.assertEqual(parse_email('a' * 250 + '@example.com').reason, TOO_LONG)
+    
+    def test_provider_normalization(self):
+        """Точки и +метки Gmail не влияют на нормализованную форму"""
+        from .validation import parse_email
+        self.assertEqual(parse_email('John.Doe+news@googlemail.com').normalized, 'johndoe@gmail.com')
+        self.assertEqual(parse_email('john.doe+news@outlook.com').normalized, 'john.doe@outlook.com')
+        self.assertEqual(parse_email('John.Doe+news@example.com').normalized, 'john.doe+news@example.com')
+    
+    @patch('money.views.check_mx_records')
+    @patch('money.views.check_smtp_deliverable')
+    def test_idn_address_probed_in_ascii(self, mock_smtp, mock_mx):
+        """SMTP-серверу передаётся адрес с доменом в IDNA (синхронная и асинхронная проверка)"""
+        import asyncio
+        from .async_verifier import verify_email_async
+        mock_mx.return_value = (True, ['mx.example.com'])
+        mock_smtp.side_effect = accept_only('user@xn--e1afmkfd.xn--p1ai')
+        
+        self.assertEqual(verify_email('user@пример.рф')['status'], 'valid')
+        self.assertEqual(mock_smtp.call_args_list[0].args[0], 'user@xn--e1afmkfd.xn--p1ai')
+        
+        clear_caches()
+        with patch('money.async_verifier.check_mx_records_async', return_value=(True, ['mx.example.com'])), \
+                patch('money.async_verifier.check_smtp_deliverable_async') as mock_async:
+            mock_async.side_effect = accept_only('user@xn--e1afmkfd.xn--p1ai')
+            self.assertEqual(asyncio.run(verify_email_async(' user@пример.рф'))['status'], 'valid')
+        self.assertEqual(mock_async.await_args_list[0].args[0], 'user@xn--e1afmkfd.xn--p1ai')
+    
+    def test_validate_many_matches_parse_email(self):
+        """Пакетная проверка даёт те же результаты, что и поштучная"""
+        from .validation import parse_email, validate_many
+        emails = [
+            'a@example.com', 'B.c+d@Gmail.com', ' spaced@example.com ', '"q r"@example.com',
+            'bad', 'x@пример.рф', 'y@example', 'a..b@example.com', 'z@EXAMPLE.com',
+        ]
+        self.assertEqual(validate_many(emails), [parse_email(email) for email in emails])
+    
+    @patch('money.views.check_mx_records')
+    def test_cache_shared_between_mailbox_variants(self, mock_mx):
+        """Вариант адреса Gmail с точками берётся из кэша"""
+        from .result_cache import verify_with_cache, CACHE_HIT
+        mock_mx.return_value = (False, [])
+        verify_with_cache('john.doe@gmail.com', verify_email)
+        result, cache_status = verify_with_cache('JohnDoe+promo@gmail.com', verify_email)
+        self.assertEqual(cache_status, CACHE_HIT)
+        self.assertEqual(result['email'], 'JohnDoe+promo@gmail.com')
+        self.assertEqual(mock_mx.call_count, 1)
+
+
+class DomainVerdictTests(TestCase):
+    """Тесты вердиктов доменов (catch-all, блокировка проверки)"""
+    
+    def setUp(self):
+        clear_caches()
+    
+    @patch('money.views.check_mx_records')
+    @patch('money.views.check_smtp_deliverable')
+    def test_catch_all_detected_once(self, mock_smtp, mock_mx):
+        """Домен, принимающий любой адрес, получает статус catch_all без повторных SMTP-проверок"""
+        from .domain_intel import get_domain_verdict, CATCH_ALL
+        mock_mx.return_value = (True, ['mx.example.com'])
+        mock_smtp.return_value = True
+        
+        result = verify_email('user@example.com')
+        self.assertEqual(result['status'], 'catch_all')
+        self.assertTrue(result['is_catch_all'])
+        self.assertEqual(result['score'], 80)
+        self.assertEqual(mock_smtp.call_count, 2)
+        self.assertEqual(get_domain_verdict('example.com'), CATCH_ALL)
+        
+        self.assertEqual(verify_email('other@example.com')['status'], 'catch_all')
+        self.assertEqual(mock_smtp.call_count, 2)
+    
+    @patch('money.views.check_mx_records')
+    @patch('money.views.check_smtp_deliverable')
+    def test_normal_domain_probed_for_catch_all_once(self, mock_smtp, mock_mx):
+        """Несуществующий ящик проверяется только для незнакомого домена"""
+        mock_mx.return_value = (True, ['mx.example.com'])
+        mock_smtp.side_effect = accept_only('a@example.com', 'b@example.com')
+        
+        self.assertEqual(verify_email('a@example.com')['status'], 'valid')
+        self.assertEqual(verify_email('b@example.com')['status'], 'valid')
+        self.assertEqual(verify_email('c@example.com')['status'], 'invalid')
+        self.assertEqual([call.args[0] for call in mock_smtp.call_args_list][2:], ['b@example.com', 'c@example.com'])
+    
+    @patch('money.views.check_mx_records')
+    @patch('money.views.check_smtp_deliverable')
+    def test_inconclusive_answer_keeps_verdict(self, mock_smtp, mock_mx):
+        """Неточный ответ не блокирует домен и не сбрасывает вердикт normal"""
+        from .domain_intel import NORMAL, get_domain_verdict, set_domain_verdict
+        mock_mx.return_value = (True, ['mx.example.com'])
+        mock_smtp.return_value = None
+        
+        self.assertEqual(verify_email('a@example.com')['status'], 'unknown')
+        self.assertEqual(verify_email('b@example.com')['status'], 'unknown')
+        self.assertEqual(mock_smtp.call_count, 2)
+        self.assertIsNone(get_domain_verdict('example.com'))
+        
+        set_domain_verdict('example.com', NORMAL)
+        verify_email('c@example.com')
+        self.assertEqual(get_domain_verdict('example.com'), NORMAL)
+    
+    @patch('money.views.check_mx_records')
+    @patch('money.views.check_smtp_deliverable')
+    def test_blocked_domain_skips_smtp(self, mock_smtp, mock_mx):
+        """Адреса заблокированного домена не проверяются по SMTP до истечения вердикта"""
+        from .domain_intel import BLOCKED, set_domain_verdict
+        mock_mx.return_value = (True, ['mx.example.com'])
+        set_domain_verdict('example.com', BLOCKED)
+        
+        self.assertEqual(verify_email('a@example.com')['status'], 'unknown')
+        mock_smtp.assert_not_called()
+    
+    def test_policy_rejection_blocks_domain(self):
+        """Отказ 5xx в проверке блокирует домен сразу, 4xx и отказ об отсутствии ящика - нет"""
+        from .benchmarks.fakes import FakeSMTPServer
+        from .domain_intel import BLOCKED, get_domain_verdict
+        from .views import check_smtp_deliverable
+        
+        with FakeSMTPServer(mail_code=451) as server, server.installed():
+            self.assertIsNone(check_smtp_deliverable('user@example.com', '127.0.0.1'))
+        self.assertIsNone(get_domain_verdict('example.com'))
+        with FakeSMTPServer(mailboxes=set()) as server, server.installed():
+            self.assertFalse(check_smtp_deliverable('user@example.com', '127.0.0.1'))
+        self.assertIsNone(get_domain_verdict('example.com'))
+        with FakeSMTPServer(mail_code=554) as server, server.installed():
+            self.assertIsNone(check_smtp_deliverable('user@example.com', '127.0.0.1'))
+        self.assertEqual(get_domain_verdict('example.com'), BLOCKED)
+    
+    def test_consecutive_failures_block_domain(self):
+        """Домен блокируется после серии сбоев подряд; ответ сервера прерывает серию"""
+        from .domain_intel import (
+            BLOCKED, DOMAIN_BLOCK_AFTER_FAILURES, get_domain_verdict, report_smtp_failure, report_smtp_reply,
+        )
+        for _ in range(DOMAIN_BLOCK_AFTER_FAILURES - 1):
+            self.assertFalse(report_smtp_failure('example.com'))
+        report_smtp_reply('example.com', 451, rcpt=True)
+        for _ in range(DOMAIN_BLOCK_AFTER_FAILURES - 1):
+            self.assertFalse(report_smtp_failure('example.com'))
+        self.assertIsNone(get_domain_verdict('example.com'))
+        self.assertTrue(report_smtp_failure('example.com'))
+        self.assertEqual(get_domain_verdict('example.com'), BLOCKED)
+    
+    @patch('money.views.mx_throttle.slot')
+    def test_throttle_timeout_does_not_count(self, mock_slot):
+        """Таймаут очереди MXThrottle не считается сбоем сервера"""
+        from .domain_intel import DOMAIN_BLOCK_AFTER_FAILURES, get_domain_verdict
+        from .throttle import ThrottleTimeout
+        from .views import check_smtp_deliverable
+        mock_slot.side_effect = ThrottleTimeout('mx.example.com')
+        
+        for _ in range(DOMAIN_BLOCK_AFTER_FAILURES + 1):
+            self.assertIsNone(check_smtp_deliverable('user@example.com', 'mx.example.com'))
+        self.assertIsNone(get_domain_verdict('example.com'))
+    
+    @patch('money.async_verifier.check_mx_records_async')
+    @patch('money.async_verifier.check_smtp_deliverable_async')
+    def test_async_catch_all(self, mock_smtp, mock_mx):
+        """Асинхронная проверка использует те же вердикты доменов"""
+        import asyncio
+        from .async_verifier import verify_email_async
+        from .domain_intel import set_domain_verdict, CATCH_ALL
+        mock_mx.return_value = (True, ['mx.example.com.'])
+        set_domain_verdict('example.com', CATCH_ALL)
+        
+        result = asyncio.run(verify_email_async('user@example.com'))
+        self.assertEqual(result['status'], 'catch_all')
+        mock_smtp.assert_not_awaited()
+
+
+class TimingTests(TestCase):
+    """Тесты замеров этапов проверки и /metrics"""
+    
+    def setUp(self):
+        clear_caches()
+    
+    def post_verify(self, query=''):
+        return self.client.post(
+            reverse('money:verify_api') + query,
+            data=json.dumps({'email': 'user@nomx.example'}),
+            content_type='application/json',
+        )
+    
+    @patch('money.resolver.resolver_pool.resolve')
+    def test_debug_timing_in_response(self, mock_resolve):
+        """С ?debug_timing=1 ответ содержит замеры этапов"""
+        import dns.resolver
+        mock_resolve.side_effect = dns.resolver.NXDOMAIN()
+        
+        data = self.post_verify('?debug_timing=1').json()
+        stages = {span['stage']: span for span in data['timing']}
+        self.assertEqual(list(stages), ['quota', 'syntax', 'dns', 'db_write'])
+        self.assertEqual(stages['dns']['outcome'], 'no_mx')
+        self.assertGreaterEqual(stages['syntax']['ms'], 0)
+        
+        self.assertNotIn('timing', self.post_verify().json())
+    
+    @patch('money.resolver.resolver_pool.resolve')
+    def test_metrics_endpoint(self, mock_resolve):
+        """/metrics отдаёт гистограммы с метками этапа и результата"""
+        import dns.resolver
+        mock_resolve.side_effect = dns.resolver.NXDOMAIN()
+        self.post_verify()
+        
+        response = self.client.get(reverse('money:metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE verification_stage_seconds histogram', body)
+        self.assertIn('verification_stage_seconds_count{stage="dns",outcome="no_mx",provider=""}', body)
+        
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(reverse('money:metrics')).status_code, 401)
+            response = self.client.get(reverse('money:metrics'), HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+    
+    def test_workers_share_slots(self):
+        """Воркеры публикуют снимки в свои слоты, слот истёкшего воркера занимает новый"""
+        from django.core.cache import cache
+        from .timing import StageMetrics, collect_metrics, slot_key
+        first, second = StageMetrics(buckets=(1,)), StageMetrics(buckets=(1,))
+        first.worker_id, second.worker_id = 'host:1', 'host:2'
+        for metrics in (first, second):
+            metrics.observe('dns', 'ok', '', 0.5)
+            metrics.publish()
+        self.assertEqual({first.slot, second.slot}, {0, 1})
+        first.publish()
+        self.assertEqual(first.slot, 0)
+        
+        with patch('money.timing.stage_metrics', second):
+            self.assertEqual(collect_metrics()[('dns', 'ok', '')][0], [2, 0])
+        
+        # Первый воркер перезапущен: его слот истёк и достаётся новому процессу
+        cache.delete(slot_key(first.slot))
+        third = StageMetrics(buckets=(1,))
+        third.worker_id = 'host:3'
+        third.publish()
+        self.assertEqual(third.slot, 0)
+        first.publish()
+        self.assertEqual(first.slot, 2)
+    
+    def test_retired_worker_totals_stay(self):
+        """Сумма /metrics не уменьшается, когда слот завершённого воркера истёк"""
+        import time
+        from django.core.cache import cache
+        from .timing import METRICS_RETIRED_TTL, StageMetrics, collect_metrics, slot_key, update_seen
+        first, second = StageMetrics(buckets=(1,)), StageMetrics(buckets=(1,))
+        first.worker_id, second.worker_id = 'host:1', 'host:2'
+        for metrics in (first, second):
+            metrics.observe('dns', 'ok', '', 0.5)
+            metrics.publish()
+        with patch('money.timing.stage_metrics', second):
+            self.assertEqual(collect_metrics()[('dns', 'ok', '')][0], [2, 0])
+            
+            cache.delete(slot_key(first.slot))
+            second.observe('dns', 'ok', '', 0.5)
+            self.assertEqual(collect_metrics()[('dns', 'ok', '')][0], [3, 0])
+        
+        # Давно завершённый воркер переносится в базу, сумма та же
+        seen = update_seen({'host:2': second.snapshot()}, now=time.time() + METRICS_RETIRED_TTL + 1)
+        self.assertEqual(list(seen['workers']), ['host:2'])
+        self.assertEqual(seen['base'][('dns', 'ok', '')][0], [1, 0])
+    
+    def test_publish_in_event_loop_runs_off_loop(self):
+        """Внутри цикла событий снимок публикуется в пуле потоков"""
+        import asyncio
+        import threading
+        from .timing import StageMetrics
+        metrics = StageMetrics(buckets=(1,))
+        metrics.published_at = 0
+        loop_thread = threading.get_ident()
+        publish_threads = []
+        metrics.publish = lambda: publish_threads.append(threading.get_ident())
+        
+        async def observe():
+            metrics.observe('dns', 'ok', '', 0.5)
+            await asyncio.sleep(0.05)
+        
+        asyncio.run(observe())
+        self.assertEqual(len(publish_threads), 1)
+        self.assertNotEqual(publish_threads[0], loop_thread)
+    
+    def test_render_cumulative_buckets(self):
+        """Корзины гистограммы накопительные, провайдер берётся из MX-хоста"""
+        from .timing import mx_provider, render_metrics
+        self.assertEqual(mx_provider('aspmx.l.google.com.'), 'google.com')
+        body = render_metrics({('rcpt', 'valid', 'google.com'): ([1, 2, 0], 0.3)}, buckets=(0.1, 1))
+        self.assertIn('verification_stage_seconds_bucket{stage="rcpt",outcome="valid",provider="google.com",le="1"} 3', body)
+        self.assertIn('verification_stage_seconds_bucket{stage="rcpt",outcome="valid",provider="google.com",le="+Inf"} 3', body)
+        self.assertIn('verification_stage_seconds_count{stage="rcpt",outcome="valid",provider="google.com"} 3', body)
+
+
+class BenchmarkTests(TestCase):
+    """Тесты fake-серверов и сравнения с базовыми показателями"""
+    
+    def setUp(self):
+        clear_caches()
+    
+    def test_verify_email_against_fake_servers(self):
+        """verify_email проходит DNS и SMTP на локальных fake-серверах"""
+        from .benchmarks.fakes import FakeDNSServer, FakeSMTPServer
+        dns_server = FakeDNSServer({'example.test': ['127.0.0.1'], 'nomx.test': []})
+        smtp_server = FakeSMTPServer(mailboxes={'user@example.test'}, greylist=True)
+        with dns_server, dns_server.installed(), smtp_server, smtp_server.installed():
+            self.assertEqual(verify_email('user@nomx.test')['status'], 'invalid')
+            self.assertEqual(verify_email('user@missing.test')['status'], 'invalid')
+            # Первая попытка получает 451 - домен считается блокирующим проверку
+            self.assertEqual(verify_email('user@example.test')['status'], 'unknown')
+            clear_caches()
+            self.assertEqual(verify_email('user@example.test')['status'], 'valid')
+        self.assertEqual(smtp_server.rcpt_commands, 3)  # адрес дважды и проверка catch-all
+    
+    def test_scenario_reports_stats(self):
+        """Сценарий возвращает пропускную способность, перцентили и запросы к БД"""
+        from .benchmarks.runner import BenchmarkEnvironment, run_scenario
+        with BenchmarkEnvironment(dns_latency=0, smtp_latency=0) as env:
+            stats = run_scenario(env, 'reserve_quota', requests=5)
+            self.assertEqual(run_scenario(env, 'verify_email', requests=4)['requests'], 4)
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['queries'], 1.0)
+        self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+    
+    def test_find_regressions(self):
+        """Регрессия - хуже базового сверх допуска; запросы к БД сравниваются точно"""
+        from .benchmarks.runner import find_regressions
+        baseline = {'throughput': 100, 'p50_ms': 10, 'p95_ms': 20, 'p99_ms': 30, 'queries': 2}
+        stats = {'throughput': 90, 'p50_ms': 12, 'p95_ms': 20, 'p99_ms': 31, 'queries': 2}
+        self.assertEqual(find_regressions(stats, baseline, tolerance=0.5), [])
+        
+        problems = find_regressions(dict(stats, throughput=40, p95_ms=40, queries=3), baseline, tolerance=0.5)
+        self.assertEqual(len(problems), 3)
+    
+    def test_regressions_relative_to_host(self):
+        """Базовое время пересчитывается по эталонной нагрузке; без эталона сравниваются только запросы"""
+        from .benchmarks.runner import find_regressions, host_factor
+        baseline = {'throughput': 100, 'p50_ms': 10, 'p95_ms': 20, 'p99_ms': 30, 'queries': 2}
+        slower = {'throughput': 40, 'p50_ms': 20, 'p95_ms': 40, 'p99_ms': 60, 'queries': 2}
+        factor = host_factor({'throughput': 500}, {'throughput': 1000})
+        self.assertEqual(factor, 2)
+        self.assertEqual(host_factor({'throughput': 2000}, {'throughput': 1000}), 1)
+        self.assertEqual(find_regressions(slower, baseline, tolerance=0.5, factor=factor), [])
+        self.assertEqual(len(find_regressions(slower, baseline, tolerance=0.5)), 4)
+        
+        problems = find_regressions(dict(slower, queries=3), baseline, tolerance=0.5, factor=None)
+        self.assertEqual(problems, ['queries 3 > baseline 2'])
+
+
+class ServerSizingTests(TestCase):
+    """Тесты расчёта воркеров gunicorn"""
+    
+    def test_asgi_sizing_from_io_wait(self):
+        """ASGI: воркер на ядро, одновременные проверки - по доле ожидания сети"""
+        from mon_project.gunicorn_conf import size_workers
+        sizing = size_workers(4, mode='asgi', io_wait=0.98)
+        self.assertEqual((sizing['workers'], sizing['threads']), (4, 1))
+        self.assertEqual(sizing['concurrency'], 50)
+        # Каждый одновременный запрос может занять соединение Redis и БД
+        self.assertGreater(sizing['redis_connections'], sizing['concurrency'])
+        self.assertGreater(sizing['db_connections'], sizing['concurrency'])
+    
+    def test_gthread_sizing(self):
+        """gthread: потоков хватает на заданную нагрузку, соединения с БД - по потокам"""
+        from mon_project.gunicorn_conf import size_workers
+        sizing = size_workers(2, mode='gthread', concurrency=300)
+        self.assertEqual(sizing['workers'], 3)
+        self.assertEqual(sizing['threads'], 100)
+        self.assertEqual(sizing['db_connections'], 101)
+        self.assertGreaterEqual(sizing['workers'] * sizing['threads'], 300)
+
+
+class VerificationLevelTests(TestCase):
+    """Тесты уровней проверки syntax, dns и smtp"""
+    
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user('leveluser', 'level@test.com', 'password')
+        self.plan = SubscriptionPlan.objects.create(
+            name='pro',
+            display_name='Pro',
+            daily_limit=100,
+            monthly_limit=1000,
+            api_access=True,
+            bulk_verification=True,
+        )
+        self.profile = UserProfile.objects.create(user=self.user, plan=self.plan)
+        self.api_key = APIKey.objects.create(user=self.user, name='Level Key')
+    
+    def post(self, payload, url_name='money:verify_api', query=''):
+        return self.client.post(
+            reverse(url_name) + query,
+            data=json.dumps(payload),
+            content_type='application/json',
+            HTTP_X_API_KEY=self.api_key.key,
+        )
+    
+    @patch('money.views.check_mx_records')
+    @patch('money.views.check_smtp_deliverable')
+    def test_syntax_level_without_network(self, mock_smtp, mock_mx):
+        """Уровень syntax не обращается к DNS и SMTP, но учитывает домены без MX из кэша"""
+        from .views import mx_cache
+        mx_cache.set('nomx.com', (False, []), 300)
+        
+        result = verify_email('user@example.com', level='syntax')
+        self.assertEqual(result['status'], 'unknown')
+        self.assertEqual(result['level'], 'syntax')
+        self.assertTrue(result['is_deliverable_unknown'])
+        self.assertEqual(verify_email('user@mailinator.com', level='syntax')['status'], 'risky')
+        self.assertEqual(verify_email('user@nomx.com', level='syntax')['status'], 'invalid')
+        mock_mx.assert_not_called()
+        mock_smtp.assert_not_called()
+    
+    @patch('money.views.check_mx_records')
+    @patch('money.views.check_smtp_deliverable')
+    def test_dns_level_skips_smtp(self, mock_smtp, mock_mx):
+        """Уровень dns проверяет MX-записи, SMTP не проверяется; известный catch-all берётся из кэша"""
+        from .domain_intel import set_domain_verdict, CATCH_ALL
+        mock_mx.return_value = (True, ['mx.example.com'])
+        set_domain_verdict('catchall.com', CATCH_ALL)
+        
+        result = verify_email('user@example.com', level='dns')
+        self.assertEqual(result['status'], 'unknown')
+        self.assertEqual(result['level'], 'dns')
+        self.assertTrue(result['has_mx_record'])
+        self.assertEqual(result['score'], 80)
+        self.assertEqual(verify_email('user@catchall.com', level='dns')['status'], 'catch_all')
+        mock_smtp.assert_not_called()
+    
+    @patch('money.views.check_mx_records')
+    def test_cheap_level_not_charged_or_saved(self, mock_mx):
+        """Проверка уровня syntax не списывает лимит и не пишется в историю"""
+        self.post({'email': 'warmup@example.com', 'level': 'syntax'})
+        
+        # Остаётся только учёт запроса по ключу (с VERIFICATION_WRITE_BEHIND - через буфер)
+        with self.assertNumQueries(1):
+            response = self.post({'email': 'user@example.com', 'level': 'syntax'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['verification_id'])
+        self.assertEqual(response.json()['data']['level'], 'syntax')
+        self.assertFalse(EmailVerification.objects.exists())
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_verifications, 0)
+        mock_mx.assert_not_called()
+    
+    def test_anonymous_syntax_level_beyond_limit(self):
+        """Анонимные проверки уровня syntax не ограничены дневным лимитом"""
+        from .quota import ANONYMOUS_DAILY_LIMIT
+        client = Client()
+        for _ in range(ANONYMOUS_DAILY_LIMIT + 1):
+            response = client.post(
+                reverse('money:verify_api') + '?level=syntax',
+                data=json.dumps({'email': 'user@example.com'}),
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 200)
+    
+    @patch('money.views.check_mx_records')
+    def test_anonymous_dns_level_counts_against_limit(self, mock_mx):
+        """Анонимные проверки уровня dns списываются из дневного лимита по IP"""
+        from .quota import ANONYMOUS_DAILY_LIMIT
+        mock_mx.return_value = (True, ['mx.example.com'])
+        client = Client()
+        for _ in range(ANONYMOUS_DAILY_LIMIT):
+            response = client.post(
+                reverse('money:verify_api') + '?level=dns',
+                data=json.dumps({'email': 'user@example.com'}),
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 200)
+        response = client.post(
+            reverse('money:verify_api') + '?level=dns',
+            data=json.dumps({'email': 'user@example.com'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 429)
+    
+    @patch('money.views.check_mx_records')
+    @patch('money.views.check_smtp_deliverable')
+    def test_cheap_level_uses_full_cached_result(self, mock_smtp, mock_mx):
+        """Полная проверка кэшируется и отдаётся запросам уровня syntax, неполная - не кэшируется"""
+        mock_mx.return_value = (True, ['mx.example.com'])
+        mock_smtp.side_effect = accept_only('user@example.com')
+        
+        self.assertEqual(self.post({'email': 'other@example.com', 'level': 'dns'}).json()['cache'], 'miss')
+        self.assertEqual(self.post({'email': 'other@example.com', 'level': 'dns'}).json()['cache'], 'miss')
+        
+        self.post({'email': 'user@example.com'})
+        response = self.post({'email': 'user@example.com', 'level': 'syntax'}).json()
+        self.assertEqual(response['cache'], 'hit')
+        self.assertEqual(response['data']['level'], 'smtp')
+        self.assertTrue(response['data']['is_deliverable'])
+        
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_verifications, 1)
+    
+    def test_unknown_level_rejected(self):
+        """Неизвестный уровень - ошибка 400 без списания лимита"""
+        response = self.post({'email': 'user@example.com', 'level': 'full'})
+        self.assertEqual(response.status_code, 400)
+        response = self.post({'emails': ['user@example.com']}, 'money:verify_bulk_api', '?level=full')
+        self.assertEqual(response.status_code, 400)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_verifications, 0)
+    
+    @patch('money.async_verifier.check_mx_records_async')
+    @patch('money.async_verifier.check_smtp_deliverable_async')
+    def test_bulk_dns_level(self, mock_smtp, mock_mx):
+        """Массовая проверка уровня dns: MX-записи без SMTP, без списания и сохранения"""
+        mock_mx.return_value = (True, ['mx.example.com.'])
+        
+        response = self.post(
+            {'emails': ['a@example.com', 'b@example.com', 'bad']}, 'money:verify_bulk_api', '?level=dns'
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['summary']['unknown'], 2)
+        self.assertEqual(response.json()['summary']['valid'], 0)
+        mock_mx.assert_awaited_once_with('example.com')
+        mock_smtp.assert_not_awaited()
+        self.assertFalse(EmailVerification.objects.exists())
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_verifications, 0)
+
+
+class ResolverPoolTests(TestCase):
+    """Тесты пула DNS-резолверов"""
+    
+    def setUp(self):
+        clear_caches()
+    
+    def make_answer(self, exchanges=(), ttl=300):
+        answer = MagicMock()
+        answer.__iter__.return_value = [
+            MagicMock(exchange=exchange, preference=index) for index, exchange in enumerate(exchanges)
+        ]
+        answer.rrset.ttl = ttl
+        return answer
+    
+    def test_timeout_is_not_no_mx(self):
+        """Не ответивший DNS-сервер даёт timeout за DNS_LIFETIME, а не "нет MX" """
+        import time
+        from .benchmarks.fakes import FakeDNSServer
+        from .resolver import ResolverPool, TIMEOUT
+        
+        with FakeDNSServer({'example.com': ['mx.example.com']}, failure='timeout', failure_rate=1.0) as server:
+            pool = ResolverPool(['127.0.0.1'], port=server.port, timeout=0.1, lifetime=0.3)
+            started = time.monotonic()
+            lookup = pool.lookup_mx('example.com')
+        
+        self.assertEqual(lookup.status, TIMEOUT)
+        self.assertIsNone(lookup.has_mx)
+        self.assertLess(time.monotonic() - started, 1.5)
+    
+    def test_fake_server_answers(self):
+        """MX-записи и отсутствие домена через настоящий резолвер"""
+        from .benchmarks.fakes import FakeDNSServer
+        from .resolver import ResolverPool, NO_MX, OK
+        
+        with FakeDNSServer({'example.com': ['mx2.example.com', 'mx1.example.com']}) as server:
+            pool = ResolverPool(['127.0.0.1'], port=server.port, timeout=0.5, lifetime=1)
+            lookup = pool.lookup_mx('example.com')
+            self.assertEqual(lookup.status, OK)
+            self.assertEqual(lookup.hosts, ('mx2.example.com.', 'mx1.example.com.'))
+            self.assertEqual(pool.lookup_mx('missing.com').status, NO_MX)
+    
+    @patch('money.resolver.resolver_pool.resolve')
+    def test_implicit_mx_and_null_mx(self, mock_resolve):
+        """Домен без MX, но с A-записью принимает почту сам; null MX - почты нет"""
+        import dns.resolver
+        
+        def resolve(domain, rdtype, tcp=False):
+            if domain == 'nullmx.com':
+                return self.make_answer(['.'])
+            if rdtype == 'MX':
+                raise dns.resolver.NoAnswer()
+            if rdtype == 'A':
+                return self.make_answer(ttl=120)
+            raise dns.resolver.NoAnswer()
+        mock_resolve.side_effect = resolve
+        
+        self.assertEqual(check_mx_records('example.com'), (True, ['example.com.']))
+        self.assertEqual(check_mx_records('nullmx.com'), (False, []))
+    
+    @patch('money.resolver.resolver_pool.resolve')
+    def test_servfail_retried_over_tcp_and_not_cached(self, mock_resolve):
+        """Ошибка всех серверов повторяется по TCP, затем проверка получает "unknown" без кэширования"""
+        import dns.resolver
+        mock_resolve.side_effect = dns.resolver.NoNameservers()
+        
+        self.assertEqual(check_mx_records('broken.com'), (None, []))
+        self.assertEqual([call.args[2] for call in mock_resolve.call_args_list], [False, True])
+        check_mx_records('broken.com')
+        self.assertEqual(mock_resolve.call_count, 4)
+        
+        result = verify_email('user@broken.com')
+        self.assertEqual(result['status'], 'unknown')
+        self.assertTrue(result['is_deliverable_unknown'])
+    
+    def test_async_fallback_runs_alongside_mx(self):
+        """Асинхронный поиск запрашивает A/AAAA одновременно с MX"""
+        import asyncio
+        import dns.resolver
+        from .resolver import ResolverPool, OK
+        started = []
+        
+        async def aresolve(domain, rdtype, tcp=False):
+            started.append(rdtype)
+            await asyncio.sleep(0.01)
+            if rdtype == 'AAAA':
+                return self.make_answer(ttl=60)
+            raise dns.resolver.NoAnswer()
+        
+        pool = ResolverPool()
+        with patch.object(pool, 'aresolve', side_effect=aresolve):
+            lookup = asyncio.run(pool.alookup_mx('example.com'))
+        
+        self.assertEqual(lookup, (OK, ('example.com.',), 60))
+        self.assertEqual(sorted(started), ['A', 'AAAA', 'MX'])
+
+
+class WarmupTests(TestCase):
+    """Тесты прогрева кэшей воркера"""
+    
+    def setUp(self):
+        clear_caches()
+    
+    def test_top_domains_by_frequency(self):
+        """Частые домены считаются по недавним проверкам и запоминаются в общем кэше"""
+        from .warmup import top_domains
+        for email in ['a@gmail.com', 'b@gmail.com', 'c@gmail.com', 'a@mail.ru', 'b@mail.ru', 'a@rare.com']:
+            EmailVerification.objects.create(email=email, domain=email.split('@')[1])
+        
+        self.assertEqual(top_domains(limit=2), ['gmail.com', 'mail.ru'])
+        with self.assertNumQueries(0):
+            self.assertEqual(top_domains(limit=2), ['gmail.com', 'mail.ru'])
+    
+    def test_top_domains_computed_once(self):
+        """Пока список считает другой воркер (блокировка занята), агрегация не запускается"""
+        from django.core.cache import cache
+        from .warmup import TOP_DOMAINS_KEY, TOP_DOMAINS_LOCK_KEY, top_domains
+        cache.add(TOP_DOMAINS_LOCK_KEY, 1)
+        
+        with self.assertNumQueries(0):
+            self.assertEqual(top_domains(timeout=0.05), [])
+        
+        cache.set(TOP_DOMAINS_KEY, ['gmail.com'])
+        with self.assertNumQueries(0):
+            self.assertEqual(top_domains(timeout=0.05), ['gmail.com'])
+    
+    @patch('money.warmup.check_mx_records')
+    def test_warm_up_resolves_only_unknown_domains(self, mock_mx):
+        """Домены из общего кэша переносятся в локальный, остальные запрашиваются в DNS"""
+        from .views import mx_cache
+        from .warmup import warm_up
+        EmailVerification.objects.create(email='a@example.com', domain='example.com')
+        mx_cache.set('gmail.com', (True, ['gmail-smtp-in.l.google.com.']), 300)
+        mx_cache.local.clear()
+        
+        with patch('money.warmup.WARMUP_DOMAINS', ['gmail.com', 'yandex.ru']):
+            report = warm_up()
+        
+        self.assertEqual(report['domains'], 3)
+        self.assertEqual(report['resolved'], 2)
+        self.assertEqual(sorted(call.args[0] for call in mock_mx.call_args_list), ['example.com', 'yandex.ru'])
+        self.assertEqual(mx_cache.local.get('gmail.com'), (True, ['gmail-smtp-in.l.google.com.']))
+    
+    def test_failed_step_does_not_stop_warm_up(self):
+        """Ошибка одного шага не мешает остальным"""
+        from . import warmup
+        calls = []
+        
+        def broken():
+            raise RuntimeError('boom')
+        
+        with patch.object(warmup, 'WARMUP_STEPS', [broken, lambda: calls.append(1) or {'ok': 1}]):
+            with self.assertLogs('money.warmup', level='ERROR'):
+                report = warmup.warm_up()
+        self.assertEqual(report['ok'], 1)
+        self.assertIn('seconds', report)
+
+
+class PlanRegistryTests(TestCase):
+    """Тесты реестра тарифных планов и кэша страницы тарифов"""
+    
+    def setUp(self):
+        clear_caches()
+        self.plan = SubscriptionPlan.objects.create(
+            name='basic', display_name='Базовый', price_monthly=490, daily_limit=100, monthly_limit=1000
+        )
+        self.user = User.objects.create_user(username='planuser', password='pass12345')
+        profile, _ = UserProfile.objects.get_or_create(user=self.user)
+        profile.plan = self.plan
+        profile.save()
+    
+    def test_plans_loaded_once(self):
+        """Повторное обращение к реестру не выполняет запросов к БД"""
+        from .plans import get_active_plan, get_plan
+        self.assertEqual(get_plan(self.plan.pk).name, 'basic')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_active_plan('basic'), get_plan(self.plan.pk))
+            self.assertIsNone(get_active_plan('business'))
+    
+    def test_plan_change_resets_registry(self):
+        """Сохранение плана сбрасывает реестр и меняет версию после фиксации транзакции"""
+        from .plans import get_plan, plans_version
+        version = plans_version()
+        self.plan.daily_limit = 200
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.save()
+        self.assertEqual(get_plan(self.plan.pk).daily_limit, 200)
+        self.assertNotEqual(plans_version(), version)
+    
+    def test_pricing_page_cached(self):
+        """Повторный показ страницы тарифов не обращается к БД"""
+        first = self.client.get(reverse('money:pricing'))
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('money:pricing'))
+        self.assertEqual(second.content, first.content)
+    
+    def test_dashboard_plan_from_registry(self):
+        """Личный кабинет берёт план профиля из реестра"""
+        from .plans import plan_registry
+        plan_registry.load()
+        self.client.login(username='planuser', password='pass12345')
+        with patch('money.plans.SubscriptionPlan.objects.all') as mock_all:
+            response = self.client.get(reverse('money:dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIs(response.context['profile'].plan, plan_registry.load()[self.plan.pk])
+        mock_all.assert_not_called()
@@ -0,0 +1,148 @@
+"""
+Ограничение нагрузки на MX-хосты.
+
+Крупные почтовые провайдеры блокируют или замедляют нас, когда несколько
+воркеров одновременно проверяют один MX-хост. MXThrottle ограничивает число
+одновременных SMTP-сессий и проверок в секунду на хост для всех воркеров
+через общий кэш (Redis в production). На ответы 4xx/421 хост получает
+паузу, растущую экспоненциально, а успешный ответ её сбрасывает.
+Проверка, не получившая слот, ждёт в очереди до THROTTLE_MAX_WAIT секунд
+(синхронная - не дольше своего общего срока SMTP_VERIFY_DEADLINE); массовая
+проверка возвращает такие адреса в очередь (async_verifier.verify_bulk_async).
+"""
+
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+
+class ThrottleTimeout(Exception):
+    """Не удалось дождаться слота для MX-хоста"""
+
+
+class MXThrottle:
+    """Лимиты одновременных сессий, частоты проверок и адаптивная пауза по MX-хосту"""
+    
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self.max_concurrent = getattr(settings, 'THROTTLE_MAX_CONCURRENT_PER_HOST', 5)
+        self.max_rate = getattr(settings, 'THROTTLE_MAX_RATE_PER_HOST', 10)
+        self.max_wait = getattr(settings, 'THROTTLE_MAX_WAIT', 30)
+        self.backoff_base = getattr(settings, 'THROTTLE_BACKOFF_BASE', 5)
+        self.backoff_max = getattr(settings, 'THROTTLE_BACKOFF_MAX', 300)
+        # Слот освобождается сам, если воркер упал, не вернув его
+        self.slot_timeout = getattr(settings, 'THROTTLE_SLOT_TIMEOUT', 120)
+    
+    @property
+    def cache(self):
+        return caches[self.alias]
+    
+    def make_key(self, kind, host):
+        return f'mxthrottle:{kind}:{host.lower()}'
+    
+    def backoff_until(self, host):
+        """Время (unix), до которого хост на паузе"""
+        return self.cache.get(self.make_key('backoff', host), 0)
+    
+    def try_acquire(self, host):
+        """Занять слот без ожидания. False - хост на паузе или лимит исчерпан"""
+        if self.backoff_until(host) > time.time():
+            return False
+        
+        slots_key = self.make_key('slots', host)
+        self.cache.add(slots_key, 0, timeout=self.slot_timeout)
+        try:
+            slots = self.cache.incr(slots_key)
+        except ValueError:
+            return False  # Счётчик истёк между add и incr - попробуем снова
+        # Срок продлевается при каждом занятии: пока слоты заняты, счётчик не истекает и не начинается с 0
+        self.cache.touch(slots_key, self.slot_timeout)
+        if slots > self.max_concurrent:
+            self.release(host)
+            return False
+        
+        rate_key = self.make_key(f'rate:{int(time.time())}', host)
+        self.cache.add(rate_key, 0, timeout=2)
+        if self.cache.incr(rate_key) > self.max_rate:
+            self.cache.decr(rate_key)
+            self.release(host)
+            return False
+        
+        return True
+    
+    def release(self, host):
+        """Освободить слот"""
+        slots_key = self.make_key('slots', host)
+        try:
+            slots = self.cache.decr(slots_key)
+        except ValueError:
+            return  # Счётчик уже истёк
+        if slots < 0:
+            # Слоты, занятые до истечения счётчика, не уводят его ниже нуля
+            self.cache.incr(slots_key, -slots)
+    
+    def report(self, host, code):
+        """Учесть код ответа сервера: 4xx увеличивает паузу, иной ответ - сбрасывает"""
+        if code is None:
+            return
+        level_key = self.make_key('level', host)
+        if 400 <= code < 500:
+            self.cache.add(level_key, 0, timeout=self.backoff_max * 4)
+            level = self.cache.incr(level_key)
+            delay = min(self.backoff_base * 2 ** (level - 1), self.backoff_max)
+            self.cache.set(self.make_key('backoff', host), time.time() + delay, timeout=int(delay) + 1)
+        else:
+            self.cache.delete(level_key)
+    
+    def retry_delay(self, host, attempt):
+        """Пауза перед следующей попыткой занять слот"""
+        backoff = self.backoff_until(host) - time.time()
+        if backoff > 0:
+            return backoff
+        return min(0.05 * 2 ** attempt, 1.0) * random.uniform(0.5, 1.5)
+    
+    def wait_deadline(self, max_wait=None):
+        """Момент (time.monotonic), после которого ожидание слота прекращается"""
+        wait = self.max_wait if max_wait is None else min(max_wait, self.max_wait)
+        return time.monotonic() + wait
+    
+    @contextmanager
+    def slot(self, host, max_wait=None):
+        """Слот для SMTP-сессии с ожиданием в очереди (не дольше max_wait, если задан)"""
+        deadline = self.wait_deadline(max_wait)
+        attempt = 0
+        while not self.try_acquire(host):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ThrottleTimeout(host)
+            time.sleep(min(self.retry_delay(host, attempt), remaining))
+            attempt += 1
+        try:
+            yield
+        finally:
+            self.release(host)
+    
+    @asynccontextmanager
+    async def aslot(self, host, max_wait=None):
+        """Слот для SMTP-сессии с ожиданием в очереди (асинхронно)"""
+        try_acquire = sync_to_async(self.try_acquire, thread_sensitive=False)
+        deadline = self.wait_deadline(max_wait)
+        attempt = 0
+        while not await try_acquire(host):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ThrottleTimeout(host)
+            await asyncio.sleep(min(self.retry_delay(host, attempt), remaining))
+            attempt += 1
+        try:
+            yield
+        finally:
+            await sync_to_async(self.release, thread_sensitive=False)(host)
+
+
+mx_throttle = MXThrottle()
@@ -0,0 +1,314 @@
+"""
+Замеры времени этапов проверки.
+
+stage('dns') - контекстный менеджер вокруг этапа (syntax, dns, smtp_connect,
+helo, rcpt, db_write, quota). Длительность попадает в гистограмму
+verification_stage_seconds с метками stage, outcome (результат этапа) и
+provider (почтовый провайдер по MX-хосту), а если запрос пришёл с
+?debug_timing=1 - ещё и в список замеров этого запроса (contextvars, так
+что замеры из sync_to_async и задач asyncio тоже попадают в список).
+
+Гистограммы копятся в памяти процесса и не чаще раза в
+METRICS_PUBLISH_INTERVAL секунд публикуются в общий кэш. /metrics
+суммирует снимки всех воркеров и отдаёт их в текстовом формате Prometheus.
+
+Каждый воркер занимает в кэше слот metrics:slot:<n> (cache.add - атомарно,
+без общего списка воркеров) и продлевает его при каждой публикации. Слот
+воркера, который не публиковался METRICS_WORKER_TTL секунд (процесс
+перезапущен по max_requests), истекает и достаётся новому воркеру, поэтому
+/metrics читает не больше METRICS_MAX_WORKERS ключей одним запросом.
+
+Публикация внутри цикла событий (verify_email_async, пул SMTP) уходит в
+пул потоков, чтобы запросы к кэшу не блокировали цикл.
+
+Счётчики Prometheus не должны уменьшаться, поэтому /metrics запоминает в
+ключе metrics:seen последний снимок каждого воркера. Снимок воркера, слот
+которого истёк, остаётся в сумме, а через METRICS_RETIRED_TTL секунд
+переносится в накопленную базу - сумма не уменьшается и ключ не растёт
+бесконечно.
+"""
+
+import asyncio
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+
+METRIC_NAME = 'verification_stage_seconds'
+
+METRICS_BUCKETS = tuple(getattr(
+    settings, 'METRICS_BUCKETS', (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+))
+METRICS_PUBLISH_INTERVAL = getattr(settings, 'METRICS_PUBLISH_INTERVAL', 10)
+# Снимок воркера, который давно не публиковался (процесс завершён), удаляется из кэша
+METRICS_WORKER_TTL = getattr(settings, 'METRICS_WORKER_TTL', 10 * 60)
+# Слотов для снимков воркеров (на все узлы с общим кэшем)
+METRICS_MAX_WORKERS = getattr(settings, 'METRICS_MAX_WORKERS', 256)
+# Через сколько секунд снимок завершённого воркера переносится в накопленную базу
+METRICS_RETIRED_TTL = getattr(settings, 'METRICS_RETIRED_TTL', 24 * 3600)
+# Провайдеры сверх этого числа попадают в метку "other"
+METRICS_MAX_PROVIDERS = getattr(settings, 'METRICS_MAX_PROVIDERS', 100)
+
+_request_spans = ContextVar('verification_timings', default=None)
+
+
+def mx_provider(mx_host):
+    """Провайдер по MX-хосту: два последних уровня имени (aspmx.l.google.com -> google.com)"""
+    labels = mx_host.rstrip('.').lower().split('.')
+    return '.'.join(labels[-2:]) if mx_host else ''
+
+
+def verdict_outcome(deliverable):
+    """Метка результата SMTP-проверки"""
+    return {True: 'valid', False: 'invalid'}.get(deliverable, 'unknown')
+
+
+def reply_outcome(code):
+    """Метка по коду ответа SMTP: 2xx, 4xx, 5xx"""
+    return f'{code // 100}xx' if code else 'none'
+
+
+class StageMetrics:
+    """Гистограммы длительности этапов в памяти процесса"""
+    
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self.series = {}  # (stage, outcome, provider) -> [счётчики по корзинам, сумма]
+        self.providers = set()
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.slot = None
+        self.published_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+    
+    def observe(self, stage, outcome, provider, seconds):
+        with self._lock:
+            if provider and provider not in self.providers:
+                if len(self.providers) >= METRICS_MAX_PROVIDERS:
+                    provider = 'other'
+                else:
+                    self.providers.add(provider)
+            entry = self.series.get((stage, outcome, provider))
+            if entry is None:
+                entry = self.series[(stage, outcome, provider)] = [[0] * (len(self.buckets) + 1), 0.0]
+            index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+            entry[0][index] += 1
+            entry[1] += seconds
+            due = time.monotonic() - self.published_at >= METRICS_PUBLISH_INTERVAL
+            if due:
+                self.published_at = time.monotonic()
+        
+        if due:
+            self.schedule_publish()
+    
+    def schedule_publish(self):
+        """Опубликовать снимок; из цикла событий - в пуле потоков, не блокируя цикл"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.publish()
+        else:
+            loop.run_in_executor(None, self.publish)
+    
+    def snapshot(self):
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self.series.items()}
+    
+    def publish(self):
+        """Записать снимок процесса в свой слот общего кэша"""
+        self.published_at = time.monotonic()
+        if not self._publish_lock.acquire(blocking=False):
+            return  # Снимок уже публикуется
+        try:
+            value = (self.worker_id, self.snapshot())
+            if self.slot is not None:
+                owner = cache.get(slot_key(self.slot))
+                if owner is not None and owner[0] == self.worker_id:
+                    cache.set(slot_key(self.slot), value, METRICS_WORKER_TTL)
+                    return
+            # Слота ещё нет или он истёк и занят другим воркером
+            self.slot = self.claim_slot(value)
+        except Exception:
+            pass  # Метрики не должны ломать проверку
+        finally:
+            self._publish_lock.release()
+    
+    def claim_slot(self, value):
+        """Занять первый свободный слот. None - все слоты заняты"""
+        for slot in range(METRICS_MAX_WORKERS):
+            if cache.add(slot_key(slot), value, METRICS_WORKER_TTL):
+                return slot
+        return None
+
+
+def slot_key(slot):
+    return f'metrics:slot:{slot}'
+
+
+SEEN_KEY = 'metrics:seen'
+SEEN_LOCK_KEY = 'metrics:seen:lock'
+
+
+stage_metrics = StageMetrics()
+
+
+class Span:
+    """Замер одного этапа; outcome можно уточнить внутри блока"""
+    
+    def __init__(self, name, provider=''):
+        self.name = name
+        self.provider = provider
+        self.outcome = 'ok'
+        self.seconds = 0.0
+    
+    def as_dict(self):
+        span = {'stage': self.name, 'ms': round(self.seconds * 1000, 2), 'outcome': self.outcome}
+        if self.provider:
+            span['provider'] = self.provider
+        return span
+
+
+@contextmanager
+def stage(name, provider=''):
+    span = Span(name, provider)
+    started = time.perf_counter()
+    try:
+        yield span
+    except asyncio.CancelledError:
+        span.outcome = 'cancelled'  # Проигравшая проверка в гонке MX-хостов
+        raise
+    except BaseException:
+        if span.outcome == 'ok':
+            span.outcome = 'error'
+        raise
+    finally:
+        span.seconds = time.perf_counter() - started
+        stage_metrics.observe(span.name, span.outcome, span.provider, span.seconds)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append(span)
+
+
+def timed(name, outcome=None):
+    """Декоратор: замер функции как этапа name, outcome(результат) - метка результата"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name) as span:
+                result = func(*args, **kwargs)
+                if outcome is not None:
+                    span.outcome = outcome(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def is_timing_requested(request):
+    return request.GET.get('debug_timing') in ('1', 'true')
+
+
+@contextmanager
+def collect_timings(enabled=True):
+    """Собирать замеры этапов текущего запроса"""
+    token = _request_spans.set([] if enabled else None)
+    try:
+        yield
+    finally:
+        _request_spans.reset(token)
+
+
+def timing_report():
+    """Замеры текущего запроса для ответа API или None, если они не запрошены"""
+    spans = _request_spans.get()
+    if spans is None:
+        return None
+    return [span.as_dict() for span in spans]
+
+
+def with_timings(view):
+    """Декоратор view: с ?debug_timing=1 замеры собираются для ответа (см. timing_report)"""
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with collect_timings(is_timing_requested(request)):
+                return await view(request, *args, **kwargs)
+        return async_wrapper
+    
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with collect_timings(is_timing_requested(request)):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def merge_snapshots(snapshots):
+    """Сложить снимки: {(stage, outcome, provider): (счётчики, сумма)}"""
+    merged = {}
+    for snapshot in snapshots:
+        for key, (counts, total) in snapshot.items():
+            entry = merged.setdefault(key, ([0] * len(counts), [0.0]))
+            for index, count in enumerate(counts):
+                entry[0][index] += count
+            entry[1][0] += total
+    return {key: (counts, total[0]) for key, (counts, total) in merged.items()}
+
+
+def update_seen(live, now=None):
+    """Запомнить последние снимки воркеров, давно завершённые перенести в базу.
+    
+    metrics:seen = {'base': снимок, 'workers': {worker_id: (снимок, время)}}.
+    Снимок воркера накопительный, поэтому свежий заменяет прежний.
+    """
+    now = time.time() if now is None else now
+    # Сохраняет один сборщик за раз, иначе он может затереть более новое состояние.
+    # Остальные считают сумму по прочитанному без записи
+    locked = cache.add(SEEN_LOCK_KEY, 1, 30)
+    try:
+        seen = cache.get(SEEN_KEY) or {'base': {}, 'workers': {}}
+        workers = seen['workers']
+        for worker_id, snapshot in live.items():
+            workers[worker_id] = (snapshot, now)
+        retired = [worker_id for worker_id, (_, seen_at) in workers.items() if now - seen_at > METRICS_RETIRED_TTL]
+        if retired:
+            seen['base'] = merge_snapshots([seen['base']] + [workers.pop(worker_id)[0] for worker_id in retired])
+        if locked:
+            cache.set(SEEN_KEY, seen, None)
+    finally:
+        if locked:
+            cache.delete(SEEN_LOCK_KEY)
+    return seen
+
+
+def collect_metrics():
+    """Сумма снимков всех воркеров, включая завершённые: {(stage, outcome, provider): (счётчики, сумма)}"""
+    stage_metrics.publish()
+    slots = cache.get_many([slot_key(slot) for slot in range(METRICS_MAX_WORKERS)])
+    seen = update_seen(dict(slots.values()))
+    return merge_snapshots([seen['base']] + [snapshot for snapshot, _ in seen['workers'].values()])
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics(series, buckets=METRICS_BUCKETS):
+    """Гистограммы в текстовом формате Prometheus"""
+    lines = [
+        f'# HELP {METRIC_NAME} Длительность этапов проверки email',
+        f'# TYPE {METRIC_NAME} histogram',
+    ]
+    for (stage_name, outcome, provider), (counts, total) in sorted(series.items()):
+        labels = f'stage="{escape_label(stage_name)}",outcome="{escape_label(outcome)}",provider="{escape_label(provider)}"'
+        cumulative = 0
+        for bound, count in zip(list(buckets) + ['+Inf'], counts):
+            cumulative += count
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{METRIC_NAME}_sum{{{labels}}} {total}')
+        lines.append(f'{METRIC_NAME}_count{{{labels}}} {cumulative}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,299 @@
+"""
+Проверка больших файлов адресов (миллионы строк) с ограниченной памятью.
+
+Конвейер задачи kind='upload':
+1. Файл из запроса переносится на диск в BULK_UPLOAD_DIR/<job_id>/ кусками.
+2. Генератор читает CSV построчно, нормализует адреса и складывает их в
+   индекс SQLite на диске - он же убирает повторы.
+3. Адреса читаются из индекса курсором, отсортированными по домену, пачками
+   по BULK_UPLOAD_CHUNK_SIZE - DNS каждого домена запрашивается один раз.
+4. Следующая пачка берётся только после того, как предыдущая проверена и
+   записана (обратное давление), поэтому в памяти не больше одной пачки.
+
+Результаты дописываются в results.jsonl, прогресс и сводка хранятся в
+VerificationJob - их можно смотреть, пока задача выполняется. После
+падения воркера задача продолжается с последней записанной пачки. Пока
+строится индекс, воркер обновляет heartbeat_at после каждой пачки строк,
+чтобы долгую сборку не забрал другой воркер как брошенную задачу.
+
+Лимит за пачку списывается в той же транзакции, что сохраняет её
+результаты и processed_count, поэтому продолженная задача не платит за
+пачку дважды. Временные сбои (БД, сеть) не завершают задачу: она остаётся
+в статусе running и возвращается в очередь requeue_stale_jobs, у которого
+есть предел попыток.
+
+Исходный файл и индекс удаляются по завершении задачи, results.jsonl -
+через BULK_UPLOAD_RESULTS_TTL секунд после него (purge_expired_uploads
+вызывает воркер).
+"""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import uuid
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, transaction
+from django.utils import timezone
+
+from .bulk import iter_csv_emails
+from .jobs import send_callback, touch_job
+from .models import EmailVerification, UserProfile, VerificationJob
+from .quota import quota_error, reserve_quota
+from .result_cache import verify_many_with_cache
+
+BULK_UPLOAD_DIR = Path(getattr(settings, 'BULK_UPLOAD_DIR', Path(settings.BASE_DIR) / 'uploads'))
+BULK_UPLOAD_MAX_BYTES = getattr(settings, 'BULK_UPLOAD_MAX_BYTES', 512 * 1024 * 1024)
+BULK_UPLOAD_CHUNK_SIZE = getattr(settings, 'BULK_UPLOAD_CHUNK_SIZE', 1000)
+BULK_UPLOAD_RESULTS_TTL = getattr(settings, 'BULK_UPLOAD_RESULTS_TTL', 7 * 24 * 3600)
+
+# Ошибки, после которых задачу стоит повторить, а не завершать
+TRANSIENT_ERRORS = (OperationalError, InterfaceError, ConnectionError, TimeoutError)
+
+logger = logging.getLogger(__name__)
+
+
+def job_dir(job_id):
+    return BULK_UPLOAD_DIR / str(job_id)
+
+
+def source_path(job_id):
+    return job_dir(job_id) / 'source.csv'
+
+
+def index_path(job_id):
+    return job_dir(job_id) / 'index.sqlite3'
+
+
+def results_path(job_id):
+    return job_dir(job_id) / 'results.jsonl'
+
+
+def save_upload(upload, job_id):
+    """Сохранить загруженный файл на диск, не читая его в память целиком"""
+    path = source_path(job_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if hasattr(upload, 'temporary_file_path'):
+        # Django уже записал большой файл во временный - просто переносим
+        shutil.move(upload.temporary_file_path(), path)
+    else:
+        with open(path, 'wb') as destination:
+            for chunk in upload.chunks():
+                destination.write(chunk)
+    return path
+
+
+def iter_upload_emails(path):
+    """Адреса из файла по одному в нижнем регистре"""
+    # Не normalize_email: варианты одного ящика (user+tag@gmail.com) должны
+    # остаться отдельными строками отчёта
+    with open(path, encoding='utf-8-sig', errors='replace', newline='') as source:
+        for email in iter_csv_emails(source):
+            yield email.strip().lower()
+
+
+class AddressIndex:
+    """Множество адресов на диске (SQLite) с выборкой, упорядоченной по домену"""
+    
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS addresses (email TEXT PRIMARY KEY, domain TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        ''')
+    
+    @property
+    def is_complete(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'complete'").fetchone()
+        return row is not None
+    
+    def build(self, emails, batch_size=10000, on_batch=None):
+        """Заполнить индекс из потока адресов, повторы отбрасываются.
+        
+        on_batch вызывается после каждой пачки строк (продление heartbeat задачи).
+        """
+        self.connection.execute('DELETE FROM addresses')
+        batch = []
+        for email in emails:
+            batch.append((email, email.rpartition('@')[2]))
+            if len(batch) >= batch_size:
+                self.connection.executemany('INSERT OR IGNORE INTO addresses VALUES (?, ?)', batch)
+                batch = []
+                if on_batch:
+                    on_batch()
+        self.connection.executemany('INSERT OR IGNORE INTO addresses VALUES (?, ?)', batch)
+        self.connection.execute('CREATE INDEX IF NOT EXISTS addresses_domain ON addresses (domain, email)')
+        self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('complete', '1')")
+        self.connection.commit()
+    
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM addresses').fetchone()[0]
+    
+    def iter_chunks(self, size, offset=0):
+        """Пачки адресов по size штук, сгруппированные по домену, начиная с offset"""
+        cursor = self.connection.execute(
+            'SELECT email FROM addresses ORDER BY domain, email LIMIT -1 OFFSET ?', (offset,)
+        )
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                return
+            yield [email for email, in rows]
+    
+    def close(self):
+        self.connection.close()
+
+
+def truncate_results(job):
+    """Обрезать файл результатов до processed_count строк (остальное не сохранено в БД)"""
+    with open(results_path(job.id), 'ab+') as results:
+        results.seek(0)
+        for _ in range(job.processed_count):
+            if not results.readline():
+                break
+        results.truncate()
+
+
+def open_results(job):
+    """Файл результатов для дозаписи, обрезанный до processed_count строк"""
+    truncate_results(job)
+    return open(results_path(job.id), 'a', encoding='utf-8')
+
+
+def fail_upload_job(job, message):
+    """Завершить задачу с ошибкой; уже записанные результаты остаются доступны"""
+    job.status = 'failed'
+    job.error_message = message
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error_message', 'finished_at'])
+    cleanup_upload(job.id)
+    send_callback(job)
+    return job
+
+
+def process_upload_job(job):
+    """Проверить загруженный файл пачками с сохранением прогресса"""
+    from .async_verifier import run_bulk_verification
+    from .views import build_verification
+    
+    index = AddressIndex(index_path(job.id))
+    try:
+        if not index.is_complete:
+            index.build(iter_upload_emails(source_path(job.id)), on_batch=lambda: touch_job(job))
+            job.total_count = len(index)
+            job.save(update_fields=['total_count'])
+        if not job.total_count:
+            return fail_upload_job(job, 'В файле не найдено адресов')
+        
+        profile = UserProfile.objects.select_related('plan').get(user=job.user)
+        summary = Counter(job.results or {})
+        verify_many = async_to_sync(run_bulk_verification)
+        
+        with open_results(job) as results_file:
+            for chunk in index.iter_chunks(BULK_UPLOAD_CHUNK_SIZE, offset=job.processed_count):
+                # Предварительная проверка: не тратить SMTP-проверки на пачку, за которую нечем платить
+                profile.refresh_from_db(fields=['daily_verifications', 'monthly_verifications', 'last_verification_date'])
+                if profile.remaining_verifications() < len(chunk):
+                    message = quota_error(profile, len(chunk))
+                    return fail_upload_job(job, f'{message}. Проверено {job.processed_count} из {job.total_count}')
+                
+                results, _ = verify_many_with_cache(chunk, verify_many)
+                for result in results:
+                    results_file.write(json.dumps(result, ensure_ascii=False) + '\n')
+                results_file.flush()
+                
+                with transaction.atomic():
+                    can_verify, message = reserve_quota(profile, len(results))
+                    if can_verify:
+                        EmailVerification.objects.bulk_create([
+                            build_verification(result, user=job.user, ip_address=job.ip_address, api_key=job.api_key)
+                            for result in results
+                        ], batch_size=500)
+                        summary.update(result['status'] for result in results)
+                        job.processed_count += len(results)
+                        job.results = dict(summary)
+                        job.heartbeat_at = timezone.now()
+                        job.save(update_fields=['processed_count', 'results', 'heartbeat_at'])
+                if not can_verify:
+                    # Лимит кончился, пока пачка проверялась: её результаты не сохранены
+                    results_file.close()
+                    truncate_results(job)
+                    return fail_upload_job(job, f'{message}. Проверено {job.processed_count} из {job.total_count}')
+    except TRANSIENT_ERRORS:
+        # Задача остаётся running: requeue_stale_jobs вернёт её в очередь
+        logger.exception('Временный сбой задачи загрузки %s, задача будет повторена', job.id)
+        return job
+    except Exception as e:
+        return fail_upload_job(job, str(e))
+    finally:
+        index.close()
+    
+    job.status = 'completed'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at'])
+    cleanup_upload(job.id)
+    send_callback(job)
+    return job
+
+
+def cleanup_upload(job_id):
+    """Удалить исходный файл и индекс, оставив результаты"""
+    for path in (source_path(job_id), index_path(job_id)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def purge_expired_uploads(now=None):
+    """Удалить файлы завершённых задач: исходник и индекс - сразу, результаты - по истечении срока.
+    
+    Возвращает число удалённых каталогов задач.
+    """
+    try:
+        job_ids = [path.name for path in BULK_UPLOAD_DIR.iterdir() if path.is_dir()]
+    except FileNotFoundError:
+        return 0
+    deadline = (now or timezone.now()) - timedelta(seconds=BULK_UPLOAD_RESULTS_TTL)
+    finished = VerificationJob.objects.filter(
+        pk__in=[job_id for job_id in job_ids if is_job_id(job_id)],
+        status__in=('completed', 'failed'),
+    ).values_list('id', 'finished_at')
+    
+    removed = 0
+    for job_id, finished_at in finished:
+        if finished_at is None or finished_at < deadline:
+            shutil.rmtree(job_dir(job_id), ignore_errors=True)
+            removed += 1
+        else:
+            # Задача могла завершиться без воркера (исчерпаны попытки)
+            cleanup_upload(job_id)
+    return removed
+
+
+def is_job_id(value):
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
+
+
+def enqueue_upload(upload, user, api_key=None, ip_address=None, callback_url=''):
+    """Создать задачу проверки файла и сохранить файл на диск"""
+    job = VerificationJob(
+        kind='upload',
+        user=user,
+        api_key=api_key,
+        ip_address=ip_address,
+        callback_url=callback_url,
+    )
+    save_upload(upload, job.id)
+    job.save()
+    return job
@@ -8,7 +8,15 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('verify/', views.verify_email_form, name='verify'),
     path('api/verify/', views.verify_email_api, name='verify_api'),
+    path('api/v2/verify/', views.verify_email_api_async, name='verify_api_async'),
+    path('api/verify/bulk/', views.verify_email_bulk_api, name='verify_bulk_api'),
+    path('api/verify/bulk/upload/', views.verify_email_upload_api, name='verify_upload_api'),
+    path('api/jobs/<uuid:job_id>/', views.job_status, name='job_status'),
+    path('api/jobs/<uuid:job_id>/results/', views.job_results, name='job_results'),
     path('history/', views.history, name='history'),
+    path('history/export/', views.export_history, name='export_history'),
+    path('api/history/export/', views.export_history_api, name='export_history_api'),
+    path('metrics', views.metrics, name='metrics'),
     
     # Тарифы и оплата
     path('pricing/', views.pricing, name='pricing'),
@@ -0,0 +1,148 @@
+"""
+Разбор и проверка синтаксиса email за один проход.
+
+parse_email разбирает адрес один раз и возвращает локальную часть, домен в
+ASCII (IDN переводится в punycode), нормализованную форму и причину отказа.
+Поддерживаются формы RFC 5321, которые отвергало старое регулярное
+выражение: локальная часть в кавычках, спецсимволы dot-atom, IDN-домены.
+
+Нормализованная форма учитывает правила провайдеров: у Gmail точки в
+локальной части не значимы, а у Gmail, Outlook, Яндекса и iCloud всё после
+'+' - метка того же ящика. Она используется как ключ кэша результатов.
+
+validate_many проверяет список адресов: домен разбирается один раз на весь
+список, а полный разбор с кавычками и IDNA нужен только необычным адресам.
+"""
+
+import re
+from typing import NamedTuple
+
+# Длины по RFC 5321
+MAX_EMAIL_LENGTH = 254
+MAX_LOCAL_LENGTH = 64
+MAX_DOMAIN_LENGTH = 253
+
+ATOM = r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+"
+DOT_ATOM_RE = re.compile(rf'{ATOM}(?:\.{ATOM})*')
+QUOTED_RE = re.compile(r'"(?:[\x20\x21\x23-\x5b\x5d-\x7e]|\\[\x20-\x7e])*"')
+LABEL = r'[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?'
+TLD = r'(?:[a-z]{2,63}|xn--[a-z0-9-]{1,59})'
+DOMAIN_RE = re.compile(rf'(?:{LABEL}\.)+{TLD}')
+
+# Причины отказа
+EMPTY = 'empty'
+TOO_LONG = 'too_long'
+NO_AT = 'no_at'
+INVALID_LOCAL = 'invalid_local'
+INVALID_DOMAIN = 'invalid_domain'
+
+# Канонический домен и правила нормализации локальной части
+PROVIDER_RULES = {
+    'gmail.com': ('gmail.com', True, True),
+    'googlemail.com': ('gmail.com', True, True),
+    'outlook.com': ('outlook.com', False, True),
+    'hotmail.com': ('hotmail.com', False, True),
+    'live.com': ('live.com', False, True),
+    'yandex.ru': ('yandex.ru', False, True),
+    'ya.ru': ('yandex.ru', False, True),
+    'icloud.com': ('icloud.com', False, True),
+    'me.com': ('icloud.com', False, True),
+}
+
+
+class ParsedEmail(NamedTuple):
+    """Результат разбора адреса"""
+    local: str
+    domain: str
+    normalized: str
+    reason: str
+    
+    @property
+    def valid(self):
+        return not self.reason
+    
+    @property
+    def address(self):
+        """Адрес с доменом в IDNA - в таком виде он передаётся SMTP-серверу"""
+        return f'{self.local}@{self.domain}'
+
+
+def invalid(reason, local='', domain=''):
+    return ParsedEmail(local, domain, '', reason)
+
+
+def encode_domain(domain):
+    """Домен в нижнем регистре и ASCII (IDNA) или None"""
+    domain = domain.lower()
+    if not domain.isascii():
+        try:
+            domain = domain.encode('idna').decode('ascii')
+        except UnicodeError:
+            return None
+    if len(domain) > MAX_DOMAIN_LENGTH or not DOMAIN_RE.fullmatch(domain):
+        return None
+    return domain
+
+
+def normalize_address(local, domain):
+    """Нормализованная форма адреса с учётом правил провайдера"""
+    canonical, strip_dots, strip_tag = PROVIDER_RULES.get(domain, (domain, False, False))
+    if local.startswith('"'):
+        return f'{local}@{canonical}'
+    local = local.lower()
+    if strip_tag:
+        local = local.partition('+')[0] or local
+    if strip_dots:
+        local = local.replace('.', '') or local
+    return f'{local}@{canonical}'
+
+
+def parse_email(email):
+    """Разобрать адрес в ParsedEmail(local, domain, normalized, reason)"""
+    email = email.strip()
+    if not email:
+        return invalid(EMPTY)
+    if len(email) > MAX_EMAIL_LENGTH:
+        return invalid(TOO_LONG)
+    
+    local, at, domain = email.rpartition('@')
+    if not at:
+        return invalid(NO_AT)
+    if not local or len(local) > MAX_LOCAL_LENGTH:
+        return invalid(INVALID_LOCAL, local, domain)
+    if not (DOT_ATOM_RE.fullmatch(local) or QUOTED_RE.fullmatch(local)):
+        return invalid(INVALID_LOCAL, local, domain)
+    
+    ascii_domain = encode_domain(domain)
+    if ascii_domain is None:
+        return invalid(INVALID_DOMAIN, local, domain)
+    return ParsedEmail(local, ascii_domain, normalize_address(local, ascii_domain), '')
+
+
+def validate_many(emails):
+    """Разбор списка адресов: список ParsedEmail в том же порядке.
+    
+    Домен проверяется и кодируется один раз на весь список; необычные
+    адреса (кавычки, пробелы по краям, ошибки) разбираются через parse_email.
+    """
+    dot_atom = DOT_ATOM_RE.fullmatch
+    domains = {}
+    parsed = []
+    append = parsed.append
+    for email in emails:
+        local, at, domain = email.rpartition('@')
+        if at and 0 < len(local) <= MAX_LOCAL_LENGTH and len(email) <= MAX_EMAIL_LENGTH and dot_atom(local):
+            known = domains.get(domain)
+            if known is None:
+                ascii_domain = encode_domain(domain) if domain == domain.strip() else None
+                known = domains[domain] = (ascii_domain, ascii_domain in PROVIDER_RULES)
+            ascii_domain, has_rules = known
+            if ascii_domain:
+                if has_rules:
+                    normalized = normalize_address(local, ascii_domain)
+                else:
+                    normalized = local.lower() + '@' + ascii_domain
+                append(ParsedEmail(local, ascii_domain, normalized, ''))
+                continue
+        append(parse_email(email))
+    return parsed
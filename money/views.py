@@ -1,10 +1,13 @@
-import re
-import dns.resolver
 import socket
 import smtplib
-from datetime import date, timedelta
+import time
+from datetime import timedelta
+from functools import partial
+from django.conf import settings
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.http import FileResponse, HttpResponse, JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
@@ -13,10 +16,35 @@ from django.contrib.auth.models import User
 from django.contrib import messages
 from django.utils import timezone
 from django_ratelimit.decorators import ratelimit
+from django_ratelimit.core import is_ratelimited
 from django_ratelimit.exceptions import Ratelimited
+from asgiref.sync import async_to_sync, sync_to_async
+import io
 import json
 
-from .models import EmailVerification, UserProfile, SubscriptionPlan, APIKey, Payment
+from .models import EmailVerification, UserProfile, SubscriptionPlan, APIKey, Payment, VerificationJob
+from .api_auth import get_api_key, get_request_api_key
+from .caching import TTLCache, TwoLevelCache
+from .disposable import make_classifier
+from .domain_intel import (
+    CATCH_ALL, MAILBOX_REJECTION_CODES, SKIP_SMTP_VERDICTS, catch_all_verdict, get_domain_verdict, probe_verdict,
+    random_mailbox, report_smtp_failure, report_smtp_reply, set_domain_verdict,
+)
+from .throttle import ThrottleTimeout, mx_throttle
+from .timing import (
+    collect_metrics, mx_provider, render_metrics, reply_outcome, stage, timing_report, verdict_outcome, with_timings,
+)
+from .write_behind import record_api_key_usage, save_verification
+from .bulk import parse_bulk_emails, summarize
+from .export import export_response, parse_export_params
+from .jobs import enqueue_job, is_async_request, is_valid_callback_url, job_payload
+from .levels import SMTP, SYNTAX, get_request_level, is_recorded, level_cost
+from .plans import active_plans, attach_plan, get_active_plan, plans_version
+from .quota import ANONYMOUS_DAILY_LIMIT, anonymous_usage, reserve_anonymous_quota, reserve_quota
+from .resolver import NO_MX, OK, resolver_pool
+from .storage import intern_mx_hosts
+from .validation import parse_email
+from .result_cache import averify_with_cache, is_cache_bypassed, verify_many_with_cache, verify_with_cache
 
 
 # Список одноразовых email доменов
@@ -27,8 +55,25 @@ DISPOSABLE_DOMAINS = {
     'tempail.com', 'mohmal.com', 'emailondeck.com', 'tempr.email',
 }
 
-# Лимит для анонимных пользователей
-ANONYMOUS_DAILY_LIMIT = 3
+# Полный список - из файла DISPOSABLE_DOMAINS_FILE, встроенный набор выше дополняет его
+disposable_classifier = make_classifier(builtin=DISPOSABLE_DOMAINS)
+
+# Кэш MX-записей: домен -> (has_mx, mx_records), общий для всех воркеров
+MX_CACHE_MIN_TTL = getattr(settings, 'MX_CACHE_MIN_TTL', 60)
+MX_CACHE_MAX_TTL = getattr(settings, 'MX_CACHE_MAX_TTL', 86400)
+MX_CACHE_NEGATIVE_TTL = getattr(settings, 'MX_CACHE_NEGATIVE_TTL', 300)
+mx_cache = TwoLevelCache('mx', max_size=getattr(settings, 'MX_CACHE_SIZE', 10000))
+
+# Готовые страницы тарифов: (версия планов, вход выполнен) -> HTML
+PRICING_CACHE_TTL = getattr(settings, 'PRICING_CACHE_TTL', 3600)
+pricing_pages = TTLCache(max_size=16)
+
+# Сколько MX-хостов пробовать, если основной не дал ответа
+MX_FAILOVER_MAX_HOSTS = getattr(settings, 'MX_FAILOVER_MAX_HOSTS', 3)
+# Таймаут SMTP-команды и общий срок SMTP-проверки одного адреса в синхронном
+# API (ожидание слота, все MX-хосты и проверка catch-all), секунды
+SMTP_TIMEOUT = 10
+SMTP_VERIFY_DEADLINE = getattr(settings, 'SMTP_VERIFY_DEADLINE', 20)
 
 
 def get_client_ip(request):
@@ -43,8 +88,7 @@ def get_client_ip(request):
 
 def validate_email_syntax(email):
     """Проверка синтаксиса email"""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email))
+    return parse_email(email).valid
 
 
 def get_domain(email):
@@ -52,100 +96,227 @@ def get_domain(email):
     return email.split('@')[1] if '@' in email else ''
 
 
+def get_mx_ttl(ttl):
+    """TTL для кэширования ответа DNS в допустимых пределах"""
+    return min(max(ttl, MX_CACHE_MIN_TTL), MX_CACHE_MAX_TTL)
+
+
+def cache_mx_lookup(domain, lookup):
+    """Запомнить результат поиска MX. Возвращает (True/False/None - DNS не ответил, MX-хосты)"""
+    if lookup.status == NO_MX:
+        # Домен точно без MX - кэшируем на короткое время
+        mx_cache.set(domain, (False, []), MX_CACHE_NEGATIVE_TTL)
+    elif lookup.status == OK:
+        mx_cache.set(domain, (True, list(lookup.hosts)), get_mx_ttl(lookup.ttl))
+    # Сбой DNS не кэшируем - он может быть временным
+    return lookup.has_mx, list(lookup.hosts)
+
+
+async def acache_mx_lookup(domain, lookup):
+    """Запомнить результат поиска MX (асинхронно, см. cache_mx_lookup)"""
+    if lookup.status == NO_MX:
+        await mx_cache.aset(domain, (False, []), MX_CACHE_NEGATIVE_TTL)
+    elif lookup.status == OK:
+        await mx_cache.aset(domain, (True, list(lookup.hosts)), get_mx_ttl(lookup.ttl))
+    return lookup.has_mx, list(lookup.hosts)
+
+
 def check_mx_records(domain):
-    """Проверка MX-записей домена"""
-    try:
-        mx_records = dns.resolver.resolve(domain, 'MX')
-        return True, [str(mx.exchange) for mx in mx_records]
-    except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN, dns.resolver.NoNameservers, Exception):
-        return False, []
+    """Проверка MX-записей домена: (True/False/None - DNS не ответил, MX-хосты)"""
+    domain = domain.lower()
+    with stage('dns') as span:
+        cached = mx_cache.get(domain)
+        if cached is not None:
+            span.outcome = 'cached'
+            return cached[0], list(cached[1])
+        
+        lookup = resolver_pool.lookup_mx(domain)
+        span.outcome = lookup.status
+        span.provider = mx_provider(lookup.hosts[0]) if lookup.hosts else ''
+        return cache_mx_lookup(domain, lookup)
+
+
+def interpret_rcpt_code(code):
+    """Перевод кода ответа на RCPT TO в результат проверки"""
+    # 250 = адрес принят
+    # 550, 551, 552, 553 = адрес не существует
+    # 450, 451, 452 = временная ошибка
+    if code == 250:
+        return True
+    elif code in MAILBOX_REJECTION_CODES:
+        return False
+    else:
+        return None  # Неизвестно
+
+
+def time_left(deadline):
+    """Таймаут следующего шага проверки: SMTP_TIMEOUT, но не позже deadline (time.monotonic)"""
+    if deadline is None:
+        return SMTP_TIMEOUT
+    return min(SMTP_TIMEOUT, deadline - time.monotonic())
 
 
-def check_smtp_deliverable(email, mx_host):
-    """Проверка доставляемости через SMTP"""
+def check_smtp_deliverable(email, mx_host, deadline=None):
+    """Проверка доставляемости через SMTP, уложенная в срок deadline (time.monotonic).
+    
+    Ответы сервера и сбои учитываются в вердикте домена (domain_intel.report_smtp_reply, report_smtp_failure).
+    """
+    if time_left(deadline) <= 0:
+        return None  # Срок проверки адреса вышел
+    provider = mx_provider(mx_host)
+    domain = email.rpartition('@')[2]
     try:
-        server = smtplib.SMTP(timeout=10)
-        server.connect(mx_host)
-        server.helo('verify.local')
-        server.mail('verify@verify.local')
-        code, message = server.rcpt(email)
-        server.quit()
+        with mx_throttle.slot(mx_host, max_wait=None if deadline is None else deadline - time.monotonic()):
+            server = smtplib.SMTP(timeout=max(time_left(deadline), 0.01))
+            with stage('smtp_connect', provider) as span:
+                span.outcome = reply_outcome(server.connect(mx_host)[0])
+            server.sock.settimeout(max(time_left(deadline), 0.01))
+            with stage('helo', provider) as span:
+                code = server.helo('verify.local')[0]
+                if code == 250:
+                    code = server.mail('verify@verify.local')[0]
+                span.outcome = reply_outcome(code)
+            if code != 250:
+                # Отказ на HELO или MAIL FROM ничего не говорит о получателе
+                mx_throttle.report(mx_host, code)
+                report_smtp_reply(domain, code)
+                server.quit()
+                return None
+            with stage('rcpt', provider) as span:
+                code, message = server.rcpt(email)
+                span.outcome = verdict_outcome(interpret_rcpt_code(code))
+            mx_throttle.report(mx_host, code)
+            report_smtp_reply(domain, code, rcpt=True)
+            server.quit()
         
-        # 250 = адрес принят
-        # 550, 551, 552, 553 = адрес не существует
-        # 450, 451, 452 = временная ошибка
-        if code == 250:
-            return True
-        elif code in [550, 551, 552, 553]:
-            return False
-        else:
-            return None  # Неизвестно
-    except smtplib.SMTPServerDisconnected:
-        return None  # Сервер отключился - неизвестно
-    except smtplib.SMTPConnectError:
+        return interpret_rcpt_code(code)
+    except ThrottleTimeout:
+        return None  # Хост перегружен - не дождались своей очереди
+    except smtplib.SMTPConnectError as e:
+        mx_throttle.report(mx_host, e.smtp_code)
+        report_smtp_reply(domain, e.smtp_code)
         return None
     except Exception:
+        # Нет соединения, сервер отключился или не ответил вовремя - неизвестно.
+        # Обрыв по общему сроку проверки не считается сбоем домена
+        if time_left(deadline) > 0:
+            report_smtp_failure(domain)
         return None
 
 
+def probe_mx_hosts(email, mx_records, deadline=None):
+    """SMTP-проверка по MX-хостам в порядке приоритета до первого точного ответа.
+    
+    Следующий хост пробуется, только пока не вышел срок deadline.
+    Возвращает (результат, ответивший хост).
+    """
+    for mx in mx_records[:MX_FAILOVER_MAX_HOSTS]:
+        if time_left(deadline) <= 0:
+            break
+        mx_host = mx.rstrip('.')
+        deliverable = check_smtp_deliverable(email, mx_host, deadline)
+        if deliverable is not None:
+            return deliverable, mx_host
+    return None, ''
+
+
+def probe_smtp(email, domain, mx_records):
+    """SMTP-проверка с учётом вердикта домена.
+    
+    Для доменов catch-all и блокирующих проверку SMTP пропускается. Если
+    домен ещё не знаком и адрес принят, проверяется несуществующий ящик.
+    Всё вместе укладывается в SMTP_VERIFY_DEADLINE секунд.
+    Возвращает (вердикт домена, результат, ответивший хост).
+    """
+    known = get_domain_verdict(domain)
+    if known in SKIP_SMTP_VERDICTS:
+        return known, None, ''
+    
+    deadline = time.monotonic() + SMTP_VERIFY_DEADLINE
+    deliverable, mx_host = probe_mx_hosts(email, mx_records, deadline)
+    if deliverable and known is None:
+        verdict = catch_all_verdict(check_smtp_deliverable(random_mailbox(domain), mx_host, deadline))
+    else:
+        verdict = probe_verdict(deliverable)
+    if verdict != known:
+        set_domain_verdict(domain, verdict)
+    return verdict, deliverable, mx_host
+
+
 def is_disposable_email(domain):
-    """Проверка на одноразовый email"""
-    return domain.lower() in DISPOSABLE_DOMAINS
+    """Проверка на одноразовый email (включая поддомены из списка)"""
+    return disposable_classifier.is_disposable(domain)
 
 
-def verify_email(email):
-    """Полная верификация email"""
-    result = {
+def new_verification_result(email, level=SMTP):
+    """Пустой результат верификации"""
+    return {
         'email': email,
+        'level': level,  # syntax, dns, smtp (см. levels)
         'is_valid_syntax': False,
         'has_mx_record': False,
         'is_deliverable': False,
         'is_deliverable_unknown': False,  # Новое поле
         'is_disposable': False,
+        'is_catch_all': False,
         'domain': '',
         'mx_records': [],
+        'mx_host': '',  # MX-хост, давший ответ на SMTP-проверку
         'error_message': '',
         'score': 0,
-        'status': 'invalid',  # invalid, risky, unknown, valid
+        'status': 'invalid',  # invalid, risky, unknown, catch_all, valid
     }
-    
-    if not validate_email_syntax(email):
-        result['error_message'] = 'Неверный формат email'
-        result['status'] = 'invalid'
-        return result
-    
-    result['is_valid_syntax'] = True
-    domain = get_domain(email)
-    result['domain'] = domain
-    result['is_disposable'] = is_disposable_email(domain)
-    
-    has_mx, mx_records = check_mx_records(domain)
-    result['has_mx_record'] = has_mx
-    result['mx_records'] = mx_records
-    
-    if not has_mx:
-        result['error_message'] = 'Домен не имеет MX-записей - почта не будет доставлена'
+
+
+def apply_smtp_result(result, deliverable):
+    """Заполнить результат по ответу SMTP-проверки"""
+    if deliverable is True:
+        result['is_deliverable'] = True
+        result['status'] = 'valid'
+    elif deliverable is False:
+        result['is_deliverable'] = False
+        result['error_message'] = 'Почтовый ящик не существует на сервере'
         result['status'] = 'invalid'
-        return result
-    
-    # SMTP проверка
-    if mx_records:
-        mx_host = mx_records[0].rstrip('.')
-        deliverable = check_smtp_deliverable(email, mx_host)
-        
-        if deliverable is True:
-            result['is_deliverable'] = True
-            result['status'] = 'valid'
-        elif deliverable is False:
-            result['is_deliverable'] = False
-            result['error_message'] = 'Почтовый ящик не существует на сервере'
-            result['status'] = 'invalid'
-        else:
-            # Неизвестно - сервер не дал точного ответа
-            result['is_deliverable_unknown'] = True
-            result['error_message'] = 'Не удалось проверить существование ящика (сервер не отвечает или блокирует проверку)'
-            result['status'] = 'unknown'
-    
+    else:
+        # Неизвестно - сервер не дал точного ответа
+        result['is_deliverable_unknown'] = True
+        result['error_message'] = 'Не удалось проверить существование ящика (сервер не отвечает или блокирует проверку)'
+        result['status'] = 'unknown'
+
+
+def apply_domain_verdict(result, verdict, deliverable):
+    """Заполнить результат по вердикту домена и ответу SMTP-проверки"""
+    if verdict != CATCH_ALL:
+        apply_smtp_result(result, deliverable)
+        return
+    # Сервер примет любой адрес - ответ на RCPT ничего не говорит о ящике
+    result['is_catch_all'] = True
+    result['is_deliverable'] = False
+    result['is_deliverable_unknown'] = True
+    result['error_message'] = 'Домен принимает любые адреса (catch-all) - существование ящика не проверить'
+    result['status'] = 'catch_all'
+
+
+def apply_dns_failure(result):
+    """DNS не ответил: о домене ничего не известно, адрес не считается недействительным"""
+    result['is_deliverable_unknown'] = True
+    result['error_message'] = 'DNS-серверы не ответили - не удалось получить MX-записи домена'
+    result['status'] = 'unknown'
+
+
+def apply_cached_verdict(result, verdict):
+    """Результат проверки без SMTP: ящик не проверялся, известен только вердикт домена из кэша"""
+    if verdict == CATCH_ALL:
+        apply_domain_verdict(result, verdict, None)
+        return
+    # Все проверки уровня пройдены, но ящик не проверялся - это не valid
+    result['is_deliverable_unknown'] = True
+    result['error_message'] = f'Существование ящика не проверялось (уровень проверки {result["level"]})'
+    result['status'] = 'unknown'
+
+
+def finalize_result(result):
+    """Учёт одноразового домена и расчёт баллов"""
     # Проверка на одноразовый email
     if result['is_disposable']:
         result['status'] = 'risky'
@@ -172,16 +343,73 @@ def verify_email(email):
     return result
 
 
+def verify_email(email, level=SMTP):
+    """Верификация email: полная или до уровня level (см. levels)"""
+    result = new_verification_result(email, level)
+    
+    with stage('syntax') as span:
+        parsed = parse_email(email)
+        span.outcome = 'valid' if parsed.valid else 'invalid'
+    if not parsed.valid:
+        result['error_message'] = 'Неверный формат email'
+        result['status'] = 'invalid'
+        return result
+    
+    result['is_valid_syntax'] = True
+    domain = parsed.domain
+    result['domain'] = domain
+    result['is_disposable'] = is_disposable_email(domain)
+    
+    if level == SYNTAX:
+        # Без DNS: MX-записи известны, только если домен уже есть в кэше
+        has_mx, mx_records = mx_cache.get(domain, (None, []))
+    else:
+        has_mx, mx_records = check_mx_records(domain)
+    result['has_mx_record'] = bool(has_mx)
+    result['mx_records'] = list(mx_records)
+    
+    if has_mx is False:
+        result['error_message'] = 'Домен не имеет MX-записей - почта не будет доставлена'
+        result['status'] = 'invalid'
+        return result
+    
+    if has_mx is None and level != SYNTAX:
+        apply_dns_failure(result)
+        return finalize_result(result)
+    
+    if level != SMTP:
+        apply_cached_verdict(result, get_domain_verdict(domain))
+        return finalize_result(result)
+    
+    # SMTP проверка
+    if mx_records:
+        verdict, deliverable, result['mx_host'] = probe_smtp(parsed.address, domain, mx_records)
+        apply_domain_verdict(result, verdict, deliverable)
+    
+    return finalize_result(result)
+
+
+def build_verification(result, user=None, ip_address=None, api_key=None):
+    """Несохранённая запись EmailVerification по результату проверки"""
+    return EmailVerification(
+        user=user,
+        email=result['email'],
+        is_valid_syntax=result['is_valid_syntax'],
+        has_mx_record=result['has_mx_record'],
+        is_deliverable=result['is_deliverable'],
+        is_disposable=result['is_disposable'],
+        domain=result['domain'],
+        mx_set_id=intern_mx_hosts(result['mx_records']),
+        error_code=EmailVerification.error_code_for(result['error_message']),
+        ip_address=ip_address,
+        api_key=api_key,
+    )
+
+
 def check_anonymous_limit(request):
-    """Проверка лимита для анонимных пользователей"""
-    ip = get_client_ip(request)
-    today = date.today()
-    count = EmailVerification.objects.filter(
-        ip_address=ip,
-        user__isnull=True,
-        created_at__date=today
-    ).count()
-    return count < ANONYMOUS_DAILY_LIMIT, ANONYMOUS_DAILY_LIMIT - count
+    """Проверка лимита для анонимных пользователей (счётчик в кэше, без запроса к БД)"""
+    count = anonymous_usage(get_client_ip(request))
+    return count < ANONYMOUS_DAILY_LIMIT, max(0, ANONYMOUS_DAILY_LIMIT - count)
 
 
 def home(request):
@@ -193,6 +421,7 @@ def home(request):
     
     if request.user.is_authenticated:
         profile, _ = UserProfile.objects.get_or_create(user=request.user)
+        attach_plan(profile)
         if profile.plan:
             context['remaining_checks'] = profile.plan.daily_limit - profile.daily_verifications
             context['plan'] = profile.plan
@@ -203,91 +432,404 @@ def home(request):
     return render(request, 'home/index.html', context)
 
 
+def prepare_api_request(request):
+    """Проверка API ключа, разбор email и уровня проверки, списание лимита.
+    
+    Возвращает (контекст, ответ с ошибкой) - одно из значений всегда None.
+    Бесплатные уровни (levels.LEVEL_COSTS, для анонимных запросов -
+    levels.ANONYMOUS_LEVEL_COSTS) не трогают профиль и лимиты.
+    """
+    # Получение email и уровня проверки
+    try:
+        data = json.loads(request.body)
+        email = data.get('email', '').strip()
+    except json.JSONDecodeError:
+        data = request.POST
+        email = request.POST.get('email', '').strip()
+    level, level_error = get_request_level(request, data)
+    
+    # Проверка API ключа (ключ, пользователь, профиль и тариф - из кэша или одним запросом)
+    api_key_header = get_request_api_key(request)
+    anonymous = not api_key_header and not request.user.is_authenticated
+    cost = level_cost(level, anonymous=anonymous) if level else 0
+    api_key_obj = None
+    user = None
+    profile = None
+    
+    if api_key_header:
+        api_key_obj = get_api_key(api_key_header)
+        if api_key_obj is None:
+            return None, JsonResponse({'error': 'Неверный API ключ'}, status=401)
+        user = api_key_obj.user
+        
+        # Проверка доступа к API
+        profile = user.profile
+        if not profile.plan or not profile.plan.api_access:
+            return None, JsonResponse({'error': 'Ваш план не включает доступ к API'}, status=403)
+    elif request.user.is_authenticated:
+        user = request.user
+        if cost:
+            profile, _ = UserProfile.objects.get_or_create(user=user)
+            attach_plan(profile)
+    elif cost:
+        # Анонимный запрос
+        can_verify, remaining = check_anonymous_limit(request)
+        if not can_verify:
+            return None, JsonResponse({
+                'error': f'Достигнут лимит бесплатных проверок ({ANONYMOUS_DAILY_LIMIT}/день). Зарегистрируйтесь для увеличения лимита.'
+            }, status=429)
+    
+    if level_error:
+        return None, JsonResponse({'error': level_error}, status=400)
+    if not email:
+        return None, JsonResponse({'error': 'Email не указан'}, status=400)
+    
+    # Проверка и списание лимита одним запросом
+    if cost and profile:
+        can_verify, message = reserve_quota(profile, cost)
+        if not can_verify:
+            return None, JsonResponse({'error': message}, status=429)
+    elif cost and not reserve_anonymous_quota(get_client_ip(request))[0]:
+        return None, JsonResponse({
+            'error': f'Достигнут лимит бесплатных проверок ({ANONYMOUS_DAILY_LIMIT}/день). Зарегистрируйтесь для увеличения лимита.'
+        }, status=429)
+    
+    if api_key_obj:
+        record_api_key_usage(api_key_obj)
+    
+    return {
+        'user': user,
+        'profile': profile,
+        'api_key': api_key_obj,
+        'email': email,
+        'level': level,
+        'cache_bypass': is_cache_bypassed(request, data),
+    }, None
+
+
+def save_api_verification(request, context, result, cache_status):
+    """Сохранение результата API-проверки и ответ клиенту (лимит уже списан).
+    
+    Проверки уровней syntax и dns в историю не пишутся.
+    """
+    verification_id = None
+    if is_recorded(context['level']):
+        verification_id = save_verification(build_verification(
+            result,
+            user=context['user'],
+            ip_address=get_client_ip(request),
+            api_key=context['api_key'],
+        )).id
+    
+    response = {
+        'success': True,
+        'data': result,
+        'verification_id': verification_id,
+        'cache': cache_status,
+    }
+    timing = timing_report()
+    if timing is not None:
+        response['timing'] = timing
+    return JsonResponse(response)
+
+
+def check_async_request(request):
+    """Проверка параметров асинхронного режима до списания лимита. Возвращает ответ с ошибкой или None"""
+    if not request.user.is_authenticated and not get_request_api_key(request):
+        return JsonResponse({'error': 'Асинхронный режим доступен только с API ключом или после входа'}, status=401)
+    
+    callback_url = request.GET.get('callback_url', '')
+    if callback_url and not is_valid_callback_url(callback_url):
+        return JsonResponse({'error': 'callback_url должен быть публичным http(s) адресом'}, status=400)
+    return None
+
+
+def enqueue_verification_job(request, context, kind, emails):
+    """Постановка проверки в очередь фоновых задач (лимит уже списан)"""
+    job = enqueue_job(
+        kind,
+        emails,
+        user=context['user'],
+        api_key=context['api_key'],
+        ip_address=get_client_ip(request),
+        callback_url=request.GET.get('callback_url', ''),
+    )
+    
+    return JsonResponse({
+        'success': True,
+        'job_id': str(job.id),
+        'status': job.status,
+        'status_url': reverse('money:job_status', args=[job.id]),
+    }, status=202)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 @ratelimit(key='ip', rate='30/m', method='POST', block=True)  # 30 запросов в минуту с IP
+@with_timings
 def verify_email_api(request):
     """API endpoint для верификации email"""
-    # Проверка API ключа
-    api_key_header = request.headers.get('X-API-Key') or request.GET.get('api_key')
+    is_async = is_async_request(request)
+    if is_async:
+        error = check_async_request(request)
+        if error:
+            return error
+    
+    context, error = prepare_api_request(request)
+    if error:
+        return error
+    
+    # Уровни без SMTP отвечают сразу - очередь им не нужна
+    if is_async and context['level'] == SMTP:
+        return enqueue_verification_job(request, context, 'single', [context['email']])
+    
+    # Верификация (повторные адреса - из кэша)
+    result, cache_status = verify_with_cache(
+        context['email'], partial(verify_email, level=context['level']), context['cache_bypass']
+    )
+    
+    return save_api_verification(request, context, result, cache_status)
+
+
+@with_timings
+async def verify_email_api_async(request):
+    """Асинхронный API endpoint для верификации email (ASGI).
+    
+    DNS и SMTP выполняются в event loop, поэтому медленный MX-сервер
+    не занимает воркер. Работа с БД вынесена в sync_to_async.
+    """
+    from .async_verifier import verify_email_async
+    
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    # Общий с verify_email_api лимит: 30 запросов в минуту с IP
+    limited = await sync_to_async(is_ratelimited)(
+        request=request, group='money.views.verify_email_api',
+        key='ip', rate='30/m', method='POST', increment=True,
+    )
+    if limited:
+        raise Ratelimited()
+    
+    context, error = await sync_to_async(prepare_api_request)(request)
+    if error:
+        return error
+    
+    result, cache_status = await averify_with_cache(
+        context['email'], partial(verify_email_async, level=context['level']), context['cache_bypass']
+    )
+    
+    return await sync_to_async(save_api_verification)(request, context, result, cache_status)
+
+
+# csrf_exempt в Django 4.2 не поддерживает корутины - помечаем вручную
+verify_email_api_async.csrf_exempt = True
+
+
+def authorize_bulk_request(request):
+    """Проверка API ключа или сессии и доступа к массовой проверке.
+    
+    Возвращает (пользователь, профиль, API ключ, ответ с ошибкой).
+    """
+    api_key_header = get_request_api_key(request)
     api_key_obj = None
-    user = None
+    profile = None
     
     if api_key_header:
-        try:
-            api_key_obj = APIKey.objects.get(key=api_key_header, is_active=True)
-            user = api_key_obj.user
-            
-            # Проверка доступа к API
-            profile = user.profile
-            if not profile.plan or not profile.plan.api_access:
-                return JsonResponse({'error': 'Ваш план не включает доступ к API'}, status=403)
-            
-            # Проверка лимитов
-            can_verify, message = profile.can_verify()
-            if not can_verify:
-                return JsonResponse({'error': message}, status=429)
-            
-            # Обновление статистики API ключа
-            api_key_obj.last_used = timezone.now()
-            api_key_obj.requests_count += 1
-            api_key_obj.save()
-            
-        except APIKey.DoesNotExist:
-            return JsonResponse({'error': 'Неверный API ключ'}, status=401)
+        api_key_obj = get_api_key(api_key_header)
+        if api_key_obj is None:
+            return None, None, None, JsonResponse({'error': 'Неверный API ключ'}, status=401)
+        user = api_key_obj.user
+        profile = getattr(user, 'profile', None)
+    elif request.user.is_authenticated:
+        user = request.user
     else:
-        # Анонимный запрос
-        if request.user.is_authenticated:
-            user = request.user
-            profile, _ = UserProfile.objects.get_or_create(user=user)
-            can_verify, message = profile.can_verify()
-            if not can_verify:
-                return JsonResponse({'error': message}, status=429)
-        else:
-            can_verify, remaining = check_anonymous_limit(request)
-            if not can_verify:
-                return JsonResponse({
-                    'error': f'Достигнут лимит бесплатных проверок ({ANONYMOUS_DAILY_LIMIT}/день). Зарегистрируйтесь для увеличения лимита.'
-                }, status=429)
+        return None, None, None, JsonResponse({'error': 'Требуется API ключ или авторизация'}, status=401)
     
-    # Получение email
-    try:
-        data = json.loads(request.body)
-        email = data.get('email', '').strip()
-    except json.JSONDecodeError:
-        email = request.POST.get('email', '').strip()
+    if profile is None:
+        profile, _ = UserProfile.objects.get_or_create(user=user)
+        attach_plan(profile)
+    if api_key_obj and (not profile.plan or not profile.plan.api_access):
+        return None, None, None, JsonResponse({'error': 'Ваш план не включает доступ к API'}, status=403)
+    if not profile.plan or not profile.plan.bulk_verification:
+        return None, None, None, JsonResponse({'error': 'Ваш план не включает массовую проверку'}, status=403)
+    return user, profile, api_key_obj, None
+
+
+def prepare_bulk_request(request):
+    """Проверка доступа к массовой проверке, лимитов и разбор списка адресов.
     
-    if not email:
-        return JsonResponse({'error': 'Email не указан'}, status=400)
+    Возвращает (контекст, ответ с ошибкой) - одно из значений всегда None.
+    """
+    user, profile, api_key_obj, error = authorize_bulk_request(request)
+    if error:
+        return None, error
+    
+    level, error_message = get_request_level(request)
+    if error_message:
+        return None, JsonResponse({'error': error_message}, status=400)
+    
+    emails, error_message = parse_bulk_emails(request)
+    if error_message:
+        return None, JsonResponse({'error': error_message}, status=400)
+    
+    # Проверка и списание лимита сразу на весь список одним запросом
+    cost = level_cost(level, len(emails))
+    if cost:
+        can_verify, message = reserve_quota(profile, cost)
+        if not can_verify:
+            return None, JsonResponse({'error': message}, status=429)
     
-    # Верификация
-    result = verify_email(email)
+    if api_key_obj:
+        record_api_key_usage(api_key_obj)
     
-    # Сохранение в базу данных
-    verification = EmailVerification.objects.create(
+    return {
+        'user': user,
+        'profile': profile,
+        'api_key': api_key_obj,
+        'emails': emails,
+        'level': level,
+        'cache_bypass': is_cache_bypassed(request),
+    }, None
+
+
+def save_bulk_verifications(request, context, results, cache_hits):
+    """Сохранение результатов массовой проверки одним запросом (лимит уже списан)"""
+    ip_address = get_client_ip(request)
+    if is_recorded(context['level']):
+        with stage('db_write'):
+            EmailVerification.objects.bulk_create([
+                build_verification(result, user=context['user'], ip_address=ip_address, api_key=context['api_key'])
+                for result in results
+            ], batch_size=500)
+    
+    response = {
+        'success': True,
+        'count': len(results),
+        'summary': summarize(results),
+        'cache_hits': cache_hits,
+        'results': results,
+    }
+    timing = timing_report()
+    if timing is not None:
+        response['timing'] = timing
+    return JsonResponse(response)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@ratelimit(key='ip', rate='10/m', method='POST', block=True)  # 10 пакетов в минуту с IP
+@with_timings
+def verify_email_bulk_api(request):
+    """API endpoint для массовой верификации email (планы с bulk_verification)"""
+    from .async_verifier import run_bulk_verification
+    
+    is_async = is_async_request(request)
+    if is_async:
+        error = check_async_request(request)
+        if error:
+            return error
+    
+    context, error = prepare_bulk_request(request)
+    if error:
+        return error
+    
+    if is_async and context['level'] == SMTP:
+        return enqueue_verification_job(request, context, 'bulk', context['emails'])
+    
+    results, cache_hits = verify_many_with_cache(
+        context['emails'],
+        partial(async_to_sync(run_bulk_verification), level=context['level']),
+        context['cache_bypass'],
+    )
+    
+    return save_bulk_verifications(request, context, results, cache_hits)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@ratelimit(key='ip', rate='10/m', method='POST', block=True)
+def verify_email_upload_api(request):
+    """Загрузка большого CSV файла на проверку фоновой задачей"""
+    from .upload import BULK_UPLOAD_MAX_BYTES, enqueue_upload
+    
+    user, profile, api_key_obj, error = authorize_bulk_request(request)
+    if error:
+        return error
+    
+    upload = request.FILES.get('file')
+    if not upload:
+        return JsonResponse({'error': 'Файл не передан (поле file)'}, status=400)
+    if upload.size > BULK_UPLOAD_MAX_BYTES:
+        return JsonResponse({'error': f'Файл слишком большой: максимум {BULK_UPLOAD_MAX_BYTES // (1024 * 1024)} МБ'}, status=413)
+    
+    callback_url = request.GET.get('callback_url', '')
+    if callback_url and not is_valid_callback_url(callback_url):
+        return JsonResponse({'error': 'callback_url должен быть публичным http(s) адресом'}, status=400)
+    
+    if api_key_obj:
+        record_api_key_usage(api_key_obj)
+    job = enqueue_upload(
+        upload,
         user=user,
-        email=email,
-        is_valid_syntax=result['is_valid_syntax'],
-        has_mx_record=result['has_mx_record'],
-        is_deliverable=result['is_deliverable'],
-        is_disposable=result['is_disposable'],
-        domain=result['domain'],
-        mx_records=', '.join(result['mx_records']),
-        error_message=result['error_message'],
-        ip_address=get_client_ip(request),
         api_key=api_key_obj,
+        ip_address=get_client_ip(request),
+        callback_url=callback_url,
     )
     
-    # Обновление счётчика пользователя
-    if user:
-        profile, _ = UserProfile.objects.get_or_create(user=user)
-        profile.increment_usage()
-    
     return JsonResponse({
         'success': True,
-        'data': result,
-        'verification_id': verification.id,
-    })
+        'job_id': str(job.id),
+        'status': job.status,
+        'status_url': reverse('money:job_status', args=[job.id]),
+    }, status=202)
+
+
+def get_request_job(request, job_id):
+    """Задача пользователя из запроса (по API ключу или сессии). Возвращает (задача, ответ с ошибкой)"""
+    api_key_header = get_request_api_key(request)
+    if api_key_header:
+        api_key_obj = get_api_key(api_key_header)
+        if api_key_obj is None:
+            return None, JsonResponse({'error': 'Неверный API ключ'}, status=401)
+        user = api_key_obj.user
+    elif request.user.is_authenticated:
+        user = request.user
+    else:
+        return None, JsonResponse({'error': 'Требуется API ключ или авторизация'}, status=401)
+    
+    try:
+        return VerificationJob.objects.get(pk=job_id, user=user), None
+    except VerificationJob.DoesNotExist:
+        return None, JsonResponse({'error': 'Задача не найдена'}, status=404)
+
+
+@require_http_methods(["GET"])
+def job_status(request, job_id):
+    """Статус и результат фоновой задачи верификации"""
+    job, error = get_request_job(request, job_id)
+    if error:
+        return error
+    
+    return JsonResponse(job_payload(job))
+
+
+@require_http_methods(["GET"])
+def job_results(request, job_id):
+    """Результаты задачи загрузки файла в JSONL (во время выполнения - уже готовая часть)"""
+    from .upload import results_path
+    
+    job, error = get_request_job(request, job_id)
+    if error:
+        return error
+    if job.kind != 'upload':
+        return JsonResponse({'error': 'Результаты файлом доступны только для загрузки файла'}, status=400)
+    
+    try:
+        results = open(results_path(job.id), 'rb')
+    except FileNotFoundError:
+        results = io.BytesIO()
+    return FileResponse(results, content_type='application/x-ndjson; charset=utf-8', filename=f'{job.id}.jsonl')
 
 
 def verify_email_form(request):
@@ -295,39 +837,28 @@ def verify_email_form(request):
     if request.method == 'POST':
         email = request.POST.get('email', '').strip()
         
-        # Проверка лимитов
+        # Проверка лимитов (для пользователя - сразу со списанием)
         if request.user.is_authenticated:
             profile, _ = UserProfile.objects.get_or_create(user=request.user)
-            can_verify, message = profile.can_verify()
+            attach_plan(profile)
+            can_verify, message = reserve_quota(profile) if email else profile.can_verify()
             if not can_verify:
                 messages.error(request, message)
                 return redirect('money:home')
         else:
-            can_verify, remaining = check_anonymous_limit(request)
+            if email:
+                can_verify, remaining = reserve_anonymous_quota(get_client_ip(request))
+            else:
+                can_verify, remaining = check_anonymous_limit(request)
             if not can_verify:
                 messages.error(request, f'Достигнут лимит бесплатных проверок. Зарегистрируйтесь!')
                 return redirect('money:home')
         
         if email:
-            result = verify_email(email)
+            result, _ = verify_with_cache(email, verify_email)
             
             user = request.user if request.user.is_authenticated else None
-            EmailVerification.objects.create(
-                user=user,
-                email=email,
-                is_valid_syntax=result['is_valid_syntax'],
-                has_mx_record=result['has_mx_record'],
-                is_deliverable=result['is_deliverable'],
-                is_disposable=result['is_disposable'],
-                domain=result['domain'],
-                mx_records=', '.join(result['mx_records']),
-                error_message=result['error_message'],
-                ip_address=get_client_ip(request),
-            )
-            
-            if user:
-                profile, _ = UserProfile.objects.get_or_create(user=user)
-                profile.increment_usage()
+            save_verification(build_verification(result, user=user, ip_address=get_client_ip(request)))
             
             return render(request, 'home/index.html', {'result': result})
     
@@ -341,16 +872,61 @@ def history(request):
     return render(request, 'home/history.html', {'verifications': verifications})
 
 
+@login_required
+@require_http_methods(["GET"])
+def export_history(request):
+    """Выгрузка всей истории проверок в CSV или JSONL"""
+    options, error_message = parse_export_params(request.GET)
+    if error_message:
+        messages.error(request, error_message)
+        return redirect('money:history')
+    return export_response(request.user, options)
+
+
+@require_http_methods(["GET"])
+def export_history_api(request):
+    """Выгрузка истории проверок через API (по ключу или сессии)"""
+    api_key_header = get_request_api_key(request)
+    if api_key_header:
+        api_key_obj = get_api_key(api_key_header)
+        if api_key_obj is None:
+            return JsonResponse({'error': 'Неверный API ключ'}, status=401)
+        user = api_key_obj.user
+        profile = getattr(user, 'profile', None)
+        if not profile or not profile.plan or not profile.plan.api_access:
+            return JsonResponse({'error': 'Ваш план не включает доступ к API'}, status=403)
+        record_api_key_usage(api_key_obj)
+    elif request.user.is_authenticated:
+        user = request.user
+    else:
+        return JsonResponse({'error': 'Требуется API ключ или авторизация'}, status=401)
+    
+    options, error_message = parse_export_params(request.GET)
+    if error_message:
+        return JsonResponse({'error': error_message}, status=400)
+    return export_response(user, options)
+
+
 def pricing(request):
-    """Страница с тарифами"""
-    plans = SubscriptionPlan.objects.filter(is_active=True)
-    return render(request, 'home/pricing.html', {'plans': plans})
+    """Страница с тарифами (готовый HTML на версию планов, без запросов к БД)"""
+    is_authenticated = request.user.is_authenticated
+    key = (plans_version(), is_authenticated)
+    html = pricing_pages.get(key)
+    if html is None:
+        # Страница зависит только от планов и входа пользователя - без данных запроса (CSRF, сообщений)
+        html = render_to_string('home/pricing.html', {
+            'plans': active_plans(),
+            'user': {'is_authenticated': is_authenticated},
+        })
+        pricing_pages.set(key, html, PRICING_CACHE_TTL)
+    return HttpResponse(html)
 
 
 @login_required
 def dashboard(request):
     """Личный кабинет пользователя"""
     profile, _ = UserProfile.objects.get_or_create(user=request.user)
+    attach_plan(profile)
     api_keys = APIKey.objects.filter(user=request.user)
     recent_verifications = EmailVerification.objects.filter(user=request.user)[:10]
     
@@ -366,7 +942,7 @@ def dashboard(request):
 def create_api_key(request):
     """Создание нового API ключа"""
     if request.method == 'POST':
-        profile = request.user.profile
+        profile = attach_plan(request.user.profile)
         
         if not profile.plan or not profile.plan.api_access:
             messages.error(request, 'Ваш план не включает доступ к API')
@@ -395,12 +971,10 @@ def delete_api_key(request, key_id):
 @login_required
 def subscribe(request, plan_name):
     """Оформление подписки"""
-    from django.conf import settings
     from .yookassa_integration import create_payment
     
-    try:
-        plan = SubscriptionPlan.objects.get(name=plan_name, is_active=True)
-    except SubscriptionPlan.DoesNotExist:
+    plan = get_active_plan(plan_name)
+    if plan is None:
         messages.error(request, 'План не найден')
         return redirect('money:pricing')
     
@@ -445,7 +1019,7 @@ def subscribe(request, plan_name):
             
             # Редирект на страницу оплаты ЮКасса
             return redirect(payment_data['confirmation_url'])
-            
+        
         except Exception as e:
             messages.error(request, f'Ошибка создания платежа: {str(e)}')
             return redirect('money:pricing')
@@ -493,7 +1067,7 @@ def payment_callback(request):
         
         messages.success(request, 'Оплата прошла успешно! Подписка активирована.')
         return redirect('money:dashboard')
-        
+    
     except Payment.DoesNotExist:
         messages.error(request, 'Платёж не найден')
         return redirect('money:pricing')
@@ -557,6 +1131,14 @@ def logout_view(request):
     return redirect('money:home')
 
 
+def metrics(request):
+    """Гистограммы этапов проверки в формате Prometheus (METRICS_TOKEN - Bearer токен доступа)"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and request.META.get('HTTP_AUTHORIZATION') != f'Bearer {token}':
+        return HttpResponse(status=401)
+    return HttpResponse(render_metrics(collect_metrics()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def ratelimit_error(request, exception):
     """Обработчик ошибки rate limit"""
     return JsonResponse({
@@ -602,7 +1184,7 @@ def yookassa_webhook(request):
                     
                     profile.monthly_verifications = 0
                     profile.save()
-                    
+            
             except Payment.DoesNotExist:
                 pass  # Платёж не найден
         
@@ -615,7 +1197,7 @@ def yookassa_webhook(request):
                 pass
         
         return JsonResponse({'status': 'ok'})
-        
+    
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
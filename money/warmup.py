@@ -0,0 +1,141 @@
+"""
+Прогрев кэшей воркера до приёма запросов.
+
+После деплоя каждый воркер начинает с пустыми локальными кэшами, и первые
+тысячи проверок заново запрашивают DNS для gmail.com, yandex.ru и mail.ru.
+warm_up (вызывается из post_worker_init в mon_project/gunicorn_conf.py)
+заранее выполняет шаги WARMUP_STEPS:
+- домены - WARMUP_DOMAINS и WARMUP_TOP_DOMAINS самых частых доменов проверок
+  за WARMUP_LOOKBACK_DAYS дней: записи, уже известные другим воркерам,
+  переносятся из общего кэша одним запросом, для остальных запрашиваются
+  MX-записи (параллельно, не дольше WARMUP_TIMEOUT секунд);
+- список одноразовых доменов - загрузка и подкачка страниц mmap;
+- реестр тарифных планов (plans.plan_registry).
+
+Список частых доменов считается одним воркером и хранится в общем кэше,
+чтобы перезапуск всех воркеров не выполнял агрегацию по таблице проверок
+несколько раз: считает тот, кто первым взял блокировку (cache.add), а
+остальные ждут готовый список не дольше WARMUP_TIMEOUT секунд.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from .domain_intel import domain_verdicts
+from .models import EmailVerification
+from .plans import plan_registry
+from .views import check_mx_records, disposable_classifier, mx_cache
+
+WARMUP_ENABLED = getattr(settings, 'WARMUP_ENABLED', True)
+WARMUP_DOMAINS = list(getattr(settings, 'WARMUP_DOMAINS', ['gmail.com', 'yandex.ru', 'mail.ru']))
+WARMUP_TOP_DOMAINS = getattr(settings, 'WARMUP_TOP_DOMAINS', 100)
+WARMUP_LOOKBACK_DAYS = getattr(settings, 'WARMUP_LOOKBACK_DAYS', 7)
+WARMUP_TIMEOUT = getattr(settings, 'WARMUP_TIMEOUT', 10)
+WARMUP_CONCURRENCY = getattr(settings, 'WARMUP_CONCURRENCY', 16)
+
+logger = logging.getLogger(__name__)
+
+TOP_DOMAINS_KEY = 'warmup:top-domains'
+TOP_DOMAINS_TTL = 3600
+TOP_DOMAINS_LOCK_KEY = 'warmup:top-domains:lock'
+# Блокировка упавшего воркера освобождается сама
+TOP_DOMAINS_LOCK_TIMEOUT = 60
+
+
+def top_domains(limit=WARMUP_TOP_DOMAINS, days=WARMUP_LOOKBACK_DAYS, timeout=WARMUP_TIMEOUT):
+    """Самые частые домены проверок за последние days дней.
+    
+    Пока список считает другой воркер, ждём его не дольше timeout секунд,
+    потом прогреваемся без частых доменов.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        domains = cache.get(TOP_DOMAINS_KEY)
+        if domains is not None:
+            return domains
+        if cache.add(TOP_DOMAINS_LOCK_KEY, 1, TOP_DOMAINS_LOCK_TIMEOUT):
+            break
+        if time.monotonic() >= deadline:
+            return []
+        time.sleep(0.1)
+    
+    try:
+        since = timezone.now() - timedelta(days=days)
+        domains = list(
+            EmailVerification.objects.filter(created_at__gte=since)
+            .exclude(domain='')
+            .values('domain')
+            .annotate(count=Count('id'))
+            .order_by('-count')
+            .values_list('domain', flat=True)[:limit]
+        )
+        cache.set(TOP_DOMAINS_KEY, domains, TOP_DOMAINS_TTL)
+    finally:
+        cache.delete(TOP_DOMAINS_LOCK_KEY)
+    return domains
+
+
+def warm_domains(domains, timeout=WARMUP_TIMEOUT):
+    """MX-записи и вердикты доменов в локальный кэш. Возвращает число запрошенных в DNS доменов"""
+    known = mx_cache.get_many(domains)
+    domain_verdicts.get_many(domains)
+    missing = [domain for domain in domains if domain not in known]
+    if not missing:
+        return 0
+    
+    executor = ThreadPoolExecutor(max_workers=WARMUP_CONCURRENCY, thread_name_prefix='warmup')
+    try:
+        done, _ = wait([executor.submit(check_mx_records, domain) for domain in missing], timeout=timeout)
+    finally:
+        # Не дождавшиеся своей очереди запросы отменяются, начатые завершатся в пределах DNS_LIFETIME
+        executor.shutdown(wait=False, cancel_futures=True)
+    return len(done)
+
+
+def warm_hot_domains():
+    domains = list(dict.fromkeys(WARMUP_DOMAINS + top_domains()))
+    return {'domains': len(domains), 'resolved': warm_domains(domains)}
+
+
+def warm_disposable_list():
+    disposable_classifier.warm_up()
+    return {}
+
+
+def warm_plans():
+    return {'plans': len(plan_registry.load())}
+
+
+# Шаги прогрева: функция -> словарь для журнала
+WARMUP_STEPS = [
+    warm_hot_domains,
+    warm_disposable_list,
+    warm_plans,
+]
+
+
+def warm_up():
+    """Выполнить шаги прогрева. Возвращает сводку для журнала"""
+    report = {}
+    if not WARMUP_ENABLED:
+        return report
+    started = time.monotonic()
+    for step in WARMUP_STEPS:
+        try:
+            report.update(step())
+        except Exception:
+            # Прогрев только ускоряет первые запросы - ошибка шага не мешает запуску воркера
+            logger.exception('Шаг прогрева %s не выполнен', step.__name__)
+    # Запросы обслуживают другие потоки - соединение главного потока больше не нужно
+    if not connection.in_atomic_block:
+        connection.close()
+    report['seconds'] = round(time.monotonic() - started, 2)
+    return report
@@ -0,0 +1,167 @@
+"""
+Отложенная запись результатов проверок.
+
+Раньше каждый запрос к API синхронно вставлял строку EmailVerification и
+обновлял статистику API ключа. WriteBuffer копит записи и приращения
+статистики в памяти процесса, а фоновый поток сбрасывает их одним
+bulk_create и агрегированными F()-обновлениями - раз в
+WRITE_BEHIND_INTERVAL секунд или как только накопится
+WRITE_BEHIND_MAX_ROWS записей. При завершении процесса буфер сбрасывается
+через atexit.
+
+Сброс выполняется в одной транзакции: при ошибке в БД не остаётся ни одной
+пачки, и весь сброс возвращается в буфер без риска задвоить строки. Пока БД
+недоступна, буфер растёт не больше WRITE_BEHIND_MAX_BUFFER записей - новые
+сверх лимита отбрасываются с предупреждением в лог.
+
+Лимиты тарифа по-прежнему списываются синхронно (quota.reserve_quota):
+решение о допуске запроса нельзя откладывать. С VERIFICATION_WRITE_BEHIND =
+False запись идёт сразу, как раньше.
+"""
+
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import APIKey, EmailVerification
+from .timing import stage
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_ENABLED = getattr(settings, 'VERIFICATION_WRITE_BEHIND', False)
+WRITE_BEHIND_INTERVAL = getattr(settings, 'WRITE_BEHIND_INTERVAL', 0.2)
+WRITE_BEHIND_MAX_ROWS = getattr(settings, 'WRITE_BEHIND_MAX_ROWS', 500)
+WRITE_BEHIND_MAX_BUFFER = getattr(settings, 'WRITE_BEHIND_MAX_BUFFER', 100000)
+
+
+class WriteBuffer:
+    """Буфер записей EmailVerification и статистики API ключей"""
+    
+    def __init__(self, interval=WRITE_BEHIND_INTERVAL, max_rows=WRITE_BEHIND_MAX_ROWS,
+                 max_buffer=WRITE_BEHIND_MAX_BUFFER):
+        self.interval = interval
+        self.max_rows = max_rows
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self.verifications = []
+        self.api_key_requests = Counter()
+        self.api_key_last_used = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+    
+    def add_verification(self, verification):
+        with self._lock:
+            if len(self.verifications) < self.max_buffer:
+                self.verifications.append(verification)
+            else:
+                self.dropped += 1
+            full = len(self.verifications) >= self.max_rows
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+    
+    def add_api_key_usage(self, api_key_id, requests=1):
+        with self._lock:
+            self.api_key_requests[api_key_id] += requests
+            self.api_key_last_used[api_key_id] = timezone.now()
+        self._ensure_thread()
+    
+    def __len__(self):
+        return len(self.verifications)
+    
+    def flush(self):
+        """Записать накопленное в БД. Возвращает число вставленных строк"""
+        with self._flush_lock:
+            with self._lock:
+                verifications, self.verifications = self.verifications, []
+                requests, self.api_key_requests = self.api_key_requests, Counter()
+                last_used, self.api_key_last_used = self.api_key_last_used, {}
+            
+            try:
+                with transaction.atomic():
+                    if verifications:
+                        with stage('db_flush'):
+                            EmailVerification.objects.bulk_create(verifications, batch_size=self.max_rows)
+                    for api_key_id, count in requests.items():
+                        APIKey.objects.filter(pk=api_key_id).update(
+                            last_used=last_used[api_key_id],
+                            requests_count=F('requests_count') + count,
+                        )
+            except Exception:
+                # Транзакция откачена целиком - возвращаем весь сброс
+                for verification in verifications:
+                    verification.pk = None
+                self._restore(verifications, requests, last_used)
+                raise
+            return len(verifications)
+    
+    def _restore(self, verifications, requests, last_used):
+        """Вернуть в буфер то, что не удалось записать, до следующего сброса"""
+        with self._lock:
+            self.verifications[:0] = verifications
+            overflow = len(self.verifications) - self.max_buffer
+            if overflow > 0:
+                del self.verifications[self.max_buffer:]
+                self.dropped += overflow
+            self.api_key_requests.update(requests)
+            for api_key_id in requests:
+                self.api_key_last_used.setdefault(api_key_id, last_used[api_key_id])
+    
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='verification-write-behind', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось записать буфер проверок')
+                # Соединение могло порваться - следующий сброс откроет новое.
+                # При успехе соединение потока живёт между сбросами
+                connections.close_all()
+            with self._lock:
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                logger.warning('Буфер проверок переполнен, отброшено записей: %s', dropped)
+
+
+write_buffer = WriteBuffer()
+atexit.register(write_buffer.flush)
+
+
+def save_verification(verification):
+    """Сохранить запись проверки сразу или через буфер"""
+    with stage('db_write') as span:
+        if WRITE_BEHIND_ENABLED:
+            span.outcome = 'buffered'
+            write_buffer.add_verification(verification)
+        else:
+            verification.save()
+    return verification
+
+
+def record_api_key_usage(api_key):
+    """Учесть запрос по API ключу сразу или через буфер"""
+    if WRITE_BEHIND_ENABLED:
+        write_buffer.add_api_key_usage(api_key.pk)
+    else:
+        APIKey.objects.filter(pk=api_key.pk).update(
+            last_used=timezone.now(),
+            requests_count=F('requests_count') + 1,
+        )